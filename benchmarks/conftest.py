@@ -0,0 +1,15 @@
+"""
+Micro-benchmarks of the per-job hot paths (pytest-benchmark, `test` extra).
+
+    make bench          # run and compare with the latest saved run (report only)
+    make bench-save     # record a new baseline after an intended change
+    make bench-compare  # table of every saved run
+
+Baselines live in benchmarks/baselines/<machine>/; a comparison is only
+meaningful against one recorded on the same kind of machine, so record
+them on the CI runner rather than a laptop or shared VM.  `make bench`
+does not fail on a regression until such a baseline exists.
+"""
+import pytest
+
+pytest.importorskip("pytest_benchmark")
@@ -0,0 +1,128 @@
+"""
+Per-call cost of rule building, next-occurrence evaluation, request
+ingestion and claim-row hydration, over a mix of rules from SECONDLY to
+YEARLY.  Time is pinned so every run expands the same series.
+"""
+import uuid
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+import clock
+from models import CompiledRule, DueJob, Job, compiled_rule, parse_rule
+from rrule import RRuleBuilder, canonicalize
+
+NOW = datetime(2026, 6, 15, 12, tzinfo=timezone.utc)
+
+# name -> (DTSTART, RRULE body); "long_*" series started years before NOW
+RULES = {
+    "secondly":       ("20260615T000000Z", "FREQ=SECONDLY;INTERVAL=30"),
+    "minutely_hours": ("20260601T000000Z", "FREQ=MINUTELY;INTERVAL=15;BYHOUR=9,10,11,12,13,14,15,16,17"),
+    "hourly":         ("20260101T000000Z", "FREQ=HOURLY;BYMINUTE=0,30"),
+    "daily":          ("20260101T090000Z", "FREQ=DAILY;BYHOUR=9;BYMINUTE=0"),
+    "weekly_byday":   ("20260105T080000Z", "FREQ=WEEKLY;BYDAY=MO,WE,FR;BYHOUR=8"),
+    "monthly_setpos": ("20250101T170000Z", "FREQ=MONTHLY;BYDAY=MO,TU,WE,TH,FR;BYSETPOS=-1"),
+    "monthly_nth":    ("20250101T100000Z", "FREQ=MONTHLY;BYDAY=2TU"),
+    "yearly":         ("20200331T000000Z", "FREQ=YEARLY;BYMONTH=3;BYMONTHDAY=31"),
+    "bounded_count":  ("20260101T120000Z", "FREQ=WEEKLY;INTERVAL=2;COUNT=52"),
+    "long_daily":     ("20160101T090000Z", "FREQ=DAILY;BYHOUR=9"),
+    "long_hourly":    ("20230101T000000Z", "FREQ=HOURLY;BYDAY=MO,TU,WE,TH,FR"),
+}
+
+
+def _text(name: str) -> str:
+    dtstart, body = RULES[name]
+    return canonicalize(f"DTSTART:{dtstart}\nRRULE:{body}").text
+
+
+@pytest.fixture(autouse=True)
+def _pinned_time():
+    with clock.freeze_time(NOW):
+        yield
+
+
+# ── rrule.py ────────────────────────────────────────────────────────────────
+def test_builder_build(benchmark):
+    until = datetime(2030, 1, 1, tzinfo=timezone.utc)
+    benchmark(lambda: RRuleBuilder.weekly().interval(2).by_weekday("MO", "FR")
+              .at(9, 30).until(until).build())
+
+
+@pytest.mark.parametrize("name", RULES)
+def test_canonicalize(benchmark, name):
+    dtstart, body = RULES[name]
+    benchmark(canonicalize, f"RRULE:{body.lower()}\nDTSTART:{dtstart}")
+
+
+# ── next occurrence ─────────────────────────────────────────────────────────
+@pytest.mark.parametrize("name", RULES)
+def test_next_after_cold(benchmark, name):
+    """First sight of a rule: parse + expand from DTSTART."""
+    text = _text(name)
+
+    def cold():
+        parse_rule.cache_clear()
+        compiled_rule.cache_clear()
+        return compiled_rule(text).after(NOW)
+    benchmark(cold)
+
+
+@pytest.mark.parametrize("name", RULES)
+def test_next_after_expand(benchmark, name):
+    """Parsed rule, memo miss: the dateutil expansion a reschedule pays."""
+    rule = parse_rule(_text(name))
+    benchmark(rule.after, NOW, True)
+
+
+@pytest.mark.parametrize("name", RULES)
+def test_next_after_memo_hit(benchmark, name):
+    """A burst of 1000 requests sharing a rule inside one memo window."""
+    memo = CompiledRule(_text(name))
+    memo.after(NOW)
+    after, burst = memo.after, [NOW + timedelta(microseconds=i) for i in range(1000)]
+    benchmark(lambda: [after(dt) for dt in burst])
+
+
+@pytest.mark.parametrize("name", ["secondly", "daily", "monthly_setpos", "long_daily"])
+def test_reschedule_walk(benchmark, name):
+    """The producer's path: 50 successive `DueJob.next_after` calls."""
+    first = parse_rule(_text(name)).after(NOW, inc=True)
+    tick = timedelta(microseconds=1)
+
+    def walk():
+        job = DueJob(uuid.uuid4(), "bench", _text(name), first, 0)
+        at = first
+        for _ in range(50):
+            at = job.next_after(at + tick)
+            if at is None:
+                break
+    benchmark(walk)
+
+
+# ── models.py ───────────────────────────────────────────────────────────────
+def _event(schedule):
+    return {"id": str(uuid.uuid4()), "job_type": "notification",
+            "payload": {"user_id": 42, "template": "reminder", "locale": "de-DE"},
+            "schedule": schedule, "tags": {"tenant": "acme", "user_id": "42"}}
+
+
+@pytest.mark.parametrize("schedule", [
+    {"at": "2026-06-16T09:00:00Z"},
+    {"rrule": "DTSTART:20260101T090000Z\nRRULE:FREQ=DAILY;BYHOUR=9;BYMINUTE=0"},
+    {"rrule": "rrule:byday=fr,mo;freq=weekly;byhour=8\ndtstart:20260105T080000Z"},
+], ids=["at", "rrule_canonical", "rrule_respelled"])
+def test_job_from_request_event(benchmark, schedule):
+    evt = _event(schedule)
+    benchmark(Job.from_request_event, evt)
+
+
+def test_job_to_dict(benchmark):
+    job = Job.from_request_event(_event({"rrule": _text("weekly_byday")}))
+    benchmark(job.to_dict)
+
+
+def test_claim_row_hydration(benchmark):
+    """`DueJob(*row)` for a 1000-row claim (what replaced `_row_to_job`)."""
+    rows = [(uuid.uuid4(), "bench", _text("hourly") if i % 5 == 0 else None, NOW, 0, None, 0)
+            for i in range(1000)]
+    benchmark(lambda: [DueJob(*r) for r in rows])
@@ -0,0 +1,7 @@
+-- Optional correlation keys (user_id, tenant, ...) copied from ScheduleRequest.tags
+ALTER TABLE jobs ADD COLUMN tags JSONB NOT NULL DEFAULT '{}'::jsonb;
+
+-- Only pending rows are ever cancelled by selector, so keep the GIN index partial.
+CREATE INDEX jobs_pending_tags_idx
+  ON jobs USING GIN (tags jsonb_path_ops)
+  WHERE status = 'pending';
@@ -0,0 +1,2 @@
+-- Trace id of the ScheduleRequest that created the job, re-emitted on ScheduleDue
+ALTER TABLE jobs ADD COLUMN trace_id TEXT;
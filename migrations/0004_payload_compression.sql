@@ -0,0 +1,7 @@
+-- Large payloads are stored compressed in payload_z (payload is then NULL);
+-- payload_encoding names the codec ('deflate' | 'zstd').
+ALTER TABLE jobs ALTER COLUMN payload DROP NOT NULL;
+ALTER TABLE jobs ADD COLUMN payload_z BYTEA;
+ALTER TABLE jobs ADD COLUMN payload_encoding TEXT;
+ALTER TABLE jobs ADD CONSTRAINT jobs_payload_present
+  CHECK ((payload IS NULL) <> (payload_z IS NULL));
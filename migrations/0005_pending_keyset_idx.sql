@@ -0,0 +1,5 @@
+-- Keyset pagination for the producer's backlog drain:
+--   WHERE status = 'pending' AND (next_run_at, id) > ($3, $4) ORDER BY next_run_at, id
+CREATE INDEX jobs_pending_keyset_idx
+  ON jobs (next_run_at, id)
+  WHERE status = 'pending';
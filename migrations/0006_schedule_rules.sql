@@ -0,0 +1,13 @@
+-- Deduplicated recurrence rules in canonical form (rrule.canonicalize).
+-- New recurring jobs reference a row here and leave jobs.rrule NULL; older
+-- rows keep their inline rrule and are read via COALESCE(r.rule, j.rrule).
+CREATE TABLE schedule_rules (
+    id          BIGSERIAL PRIMARY KEY,
+    rule        TEXT        NOT NULL UNIQUE,
+    tz          TEXT,                         -- TZID of DTSTART, if any
+    freq        TEXT        NOT NULL,
+    bounded     BOOLEAN     NOT NULL,         -- COUNT / UNTIL present
+    created_at  TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+
+ALTER TABLE jobs ADD COLUMN rule_id BIGINT REFERENCES schedule_rules (id);
@@ -0,0 +1,6 @@
+-- Optimistic version for in-place ScheduleUpdate: every applied update bumps
+-- it, and an update naming a version only applies while the row still has
+-- it.  The producer's finalize does not look at it: it only finalises a
+-- fired row whose next_run_at is still the one it claimed, so only a
+-- schedule change supersedes a fire.
+ALTER TABLE jobs ADD COLUMN version INT NOT NULL DEFAULT 0;
@@ -0,0 +1,7 @@
+-- Cancels of jobs that went to a broker delay tier (no jobs row): the
+-- consumer checks and consumes these before relaying the expired message.
+CREATE TABLE delay_tombstones (
+    id          UUID        PRIMARY KEY,
+    expires_at  TIMESTAMPTZ NOT NULL
+);
+CREATE INDEX delay_tombstones_expiry_idx ON delay_tombstones (expires_at);
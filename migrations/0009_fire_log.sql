@@ -0,0 +1,15 @@
+-- Optional append-only record of every ScheduleDue the producer published
+-- (FIRE_LOG_ENABLED).  Range-partitioned by day on fired_at: the producer
+-- creates partitions ahead (job_fire_log_YYYYMMDD) and drops whole ones
+-- past FIRE_LOG_RETENTION_DAYS, so retention never DELETEs.  Rows arrive in
+-- fired_at order, which a BRIN index summarises in a few pages; there is no
+-- B-tree to maintain on the write path.
+CREATE TABLE job_fire_log (
+    fired_at    TIMESTAMPTZ NOT NULL,
+    job_id      UUID        NOT NULL,
+    job_type    TEXT        NOT NULL,
+    due_at      TIMESTAMPTZ NOT NULL,   -- next_run_at of the occurrence
+    attempt     INT         NOT NULL    -- as in the ScheduleDue event
+) PARTITION BY RANGE (fired_at);
+
+CREATE INDEX job_fire_log_fired_brin ON job_fire_log USING brin (fired_at);
@@ -0,0 +1,11 @@
+-- Requests the consumer routed to a broker delay tier (no jobs row).  A
+-- marker is inserted pending if absent before the publish and confirmed
+-- once the broker confirmed it: a redelivered request with a confirmed
+-- marker is not published again, one with a pending marker (the earlier
+-- attempt may not have published) takes the DB path instead.
+CREATE TABLE delay_markers (
+    id          UUID        PRIMARY KEY,
+    expires_at  TIMESTAMPTZ NOT NULL,
+    confirmed   BOOLEAN     NOT NULL DEFAULT false
+);
+CREATE INDEX delay_markers_expiry_idx ON delay_markers (expires_at);
@@ -1,16 +1,132 @@
 import json
 import asyncio
 from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+import aiormq
 from aio_pika import connect_robust, Message, ExchangeType
 
+import clock
+import codec
+import tracing
+
 class AMQPConfig:
-    def __init__(self, url: str):
+    """
+    Due-event routing (`due_routing`):
+        single – every event on "due" → schedule_due (default)
+        topic  – "due.<job_type>" for each type in `due_types`, each with its
+                 own schedule_due.<job_type> queue; other types stay on "due"
+        hash   – consistent-hash exchange on the job id fanning into
+                 `due_shards` queues schedule_due.0..N-1 (needs the
+                 rabbitmq_consistent_hash_exchange plugin); a job always
+                 lands on the same shard, so per-job order is kept
+
+    Due batching (`due_batch_types`): the producer may coalesce the due
+    events of these job types from one claim into a single envelope, sent on
+    "<due routing key>.batch" (e.g. "due.batch") to the same queue as the
+    type's single events.  Not available with hash routing, which needs one
+    job per message to keep per-job shard affinity.
+
+    Delay tiers (`delay_tiers`, seconds): one queue schedule_delay.<N>s per
+    tier with x-message-ttl = N s, dead-lettering into the command exchange
+    as "delayed".  Short one-shots wait there instead of in Postgres; the
+    consumer checks cancel tombstones and relays them as ScheduleDue.
+
+    Command lanes (`command_lanes()`): each command class has its own queue
+    and consumer, so cancels and delay-tier relays never wait behind a flood
+    of requests:
+        request – request, request.batch, update, update.batch → schedule_inbox
+                  (updates share the lane so they stay ordered after their request)
+        cancel  – cancel, cancel.batch, cancel.selector → schedule_inbox.cancel
+        delayed – delayed → schedule_inbox.delayed (only with delay tiers)
+    """
+    def __init__(self, url: str, *, due_routing: str = "single",
+                 due_shards: int = 4, due_types: tuple[str, ...] = (),
+                 delay_tiers: tuple[int, ...] = (), due_batch_types: tuple[str, ...] = ()):
+        if due_routing not in ("single", "topic", "hash"):
+            raise ValueError(f"Unknown due routing {due_routing!r}")
+        if due_batch_types and due_routing == "hash":
+            raise ValueError("Due batching cannot be combined with hash routing")
+        if any(t <= 0 for t in delay_tiers):
+            raise ValueError("Delay tiers must be positive seconds")
         self.url = url
         # exchange/queue names centralised here
         self.cmd_ex   = "schedule.commands"
         self.evt_ex   = "schedule.events"
         self.cmd_q    = "schedule_inbox"
+        self.cancel_q = "schedule_inbox.cancel"
+        self.delayed_q = "schedule_inbox.delayed"
         self.due_q    = "schedule_due"
+        self.dlx      = "schedule.dlq"
+        self.hash_ex  = "schedule.due.hash"
+        self.delay_ex = "schedule.delay"
+        # due-event routing
+        self.due_routing = due_routing
+        self.due_shards  = due_shards
+        self.due_types   = frozenset(due_types)
+        self.due_batch_types = frozenset(due_batch_types)
+        self.delay_tiers = tuple(sorted(set(delay_tiers)))
+
+    @classmethod
+    def from_settings(cls, settings) -> "AMQPConfig":
+        return cls(settings.RABBIT_URL, due_routing=settings.DUE_ROUTING,
+                   due_shards=settings.DUE_SHARDS, due_types=tuple(settings.DUE_TYPES),
+                   delay_tiers=tuple(settings.DELAY_TIERS),
+                   due_batch_types=tuple(settings.DUE_BATCH_TYPES))
+
+    def command_lanes(self) -> dict[str, tuple[str, tuple[str, ...]]]:
+        """Lane name → (queue, command routing keys bound to it)."""
+        lanes = {
+            "cancel": (self.cancel_q, ("cancel", "cancel.batch", "cancel.selector")),
+            "request": (self.cmd_q, ("request", "request.batch", "update", "update.batch")),
+        }
+        if self.delay_tiers:
+            lanes["delayed"] = (self.delayed_q, ("delayed",))
+        return lanes
+
+    def delay_queue(self, tier: int) -> str:
+        return f"schedule_delay.{tier}s"
+
+    def delay_tier_for(self, seconds: float) -> int | None:
+        """Smallest tier that can hold a `seconds` delay; None → too long, use the DB."""
+        for tier in self.delay_tiers:
+            if seconds <= tier:
+                return tier
+        return None
+
+    def due_routing_key(self, job_type: str) -> str:
+        """Routing key the producer uses for a ScheduleDue of `job_type`."""
+        if self.due_routing == "topic" and job_type in self.due_types:
+            return f"due.{job_type}"
+        return "due"
+
+    def due_batch_routing_key(self, job_type: str) -> str:
+        """Routing key of a coalesced envelope of `job_type` due events."""
+        return self.due_routing_key(job_type) + ".batch"
+
+    def due_queues(self) -> list[str]:
+        """Every queue ScheduleDue events can land in under this config."""
+        if self.due_routing == "hash":
+            return [f"{self.due_q}.{i}" for i in range(self.due_shards)]
+        if self.due_routing == "topic":
+            return [self.due_q, *(f"{self.due_q}.{t}" for t in sorted(self.due_types))]
+        return [self.due_q]
+
+@dataclass(frozen=True)
+class LaneSpec:
+    """Consumer sizing of one command lane: broker prefetch and handler tasks."""
+    prefetch: int = 100
+    concurrency: int = 1
+
+    @classmethod
+    def from_settings(cls, settings, lane: str) -> "LaneSpec":
+        prefix = f"{lane.upper()}_"
+        return cls(getattr(settings, prefix + "PREFETCH"), getattr(settings, prefix + "CONCURRENCY"))
+
+
+# every routing key ever bound to the shared inbox
+_COMMAND_KEYS = ("request", "request.batch", "update", "update.batch",
+                 "cancel", "cancel.batch", "cancel.selector", "delayed")
 
 # ──────────────────────────────────────────────────────────────
 @asynccontextmanager
@@ -31,47 +147,228 @@ async def declare_topology(conn, cfg: AMQPConfig):
     evt_ex = await ch.declare_exchange(cfg.evt_ex, ExchangeType.TOPIC, durable=True)
 
     # dead-letter exchange / queue
-    dlx = await ch.declare_exchange("schedule.dlq", ExchangeType.FANOUT, durable=True)
+    dlx = await ch.declare_exchange(cfg.dlx, ExchangeType.FANOUT, durable=True)
     dlq  = await ch.declare_queue("schedule_dead", durable=True)
     await dlq.bind(dlx, routing_key="#")
 
-    # inbox queue that dead-letters into the DLX
-    inbox = await ch.declare_queue(cfg.cmd_q, durable=True, arguments={"x-dead-letter-exchange": "schedule.dlq"})
+    # one inbox per command lane, each dead-lettering into the DLX
+    lanes = cfg.command_lanes()
+    inbox = None
+    for queue_name, keys in lanes.values():
+        lane_q = await ch.declare_queue(queue_name, durable=True,
+                                        arguments={"x-dead-letter-exchange": cfg.dlx})
+        for rk in keys:
+            await lane_q.bind(cmd_ex, routing_key=rk)
+        if queue_name == cfg.cmd_q:
+            inbox = lane_q
+
+    # bindings outlive restarts: drop the keys that used to share the request inbox
+    for rk in _COMMAND_KEYS:
+        if rk not in lanes["request"][1]:
+            await inbox.unbind(cmd_ex, routing_key=rk)
 
-    await inbox.bind(cmd_ex, routing_key="request")
-    await inbox.bind(cmd_ex, routing_key="cancel")
+    # delay tiers: expire back into the inbox as "delayed"
+    if cfg.delay_tiers:
+        delay_ex = await ch.declare_exchange(cfg.delay_ex, ExchangeType.TOPIC, durable=True)
+        for tier in cfg.delay_tiers:
+            name = cfg.delay_queue(tier)
+            q = await ch.declare_queue(name, durable=True, arguments={
+                "x-message-ttl": tier * 1000,
+                "x-dead-letter-exchange": cfg.cmd_ex,
+                "x-dead-letter-routing-key": "delayed",
+            })
+            await q.bind(delay_ex, routing_key=name)
     
-    # schedule due queue
-    due   = await ch.declare_queue(cfg.due_q,  durable=True)
-    await due.bind(evt_ex,   routing_key="due")
+    # schedule due queue(s)
+    if cfg.due_routing == "hash":
+        # events keep routing key "due"; the hash exchange spreads them by message_id
+        hash_ex = await ch.declare_exchange(
+            cfg.hash_ex, "x-consistent-hash", durable=True,
+            arguments={"hash-property": "message_id"})
+        await hash_ex.bind(evt_ex, routing_key="due")
+        for name in cfg.due_queues():
+            shard = await ch.declare_queue(name, durable=True)
+            await shard.bind(hash_ex, routing_key="1")     # equal weight per shard
+    else:
+        due   = await ch.declare_queue(cfg.due_q,  durable=True)
+        await due.bind(evt_ex,   routing_key="due")
+        if cfg.due_batch_types:
+            await due.bind(evt_ex, routing_key="due.batch")
+        for t in sorted(cfg.due_types) if cfg.due_routing == "topic" else ():
+            typed = await ch.declare_queue(f"{cfg.due_q}.{t}", durable=True)
+            await typed.bind(evt_ex, routing_key=f"due.{t}")
+            if t in cfg.due_batch_types:
+                await typed.bind(evt_ex, routing_key=f"due.{t}.batch")
 
     await ch.close()
 
 # ──────────────────────────────────────────────────────────────
 class JSONPublisher:
-    """Lightweight JSON publisher with confirms enabled."""
-    def __init__(self, channel, exchange_name: str):
+    """
+    Lightweight JSON publisher with confirms enabled.  Bodies of at least
+    `compress_min_bytes` (0 = never) go out compressed, with the codec named
+    in `content_encoding`; `start_consumer` undoes it.
+    """
+    def __init__(self, channel, exchange_name: str, *, compress_min_bytes: int = 0,
+                 compression: str = "auto"):
         self._ch    = channel
         self._ex    = None
         self._name  = exchange_name
+        self._compress_min = compress_min_bytes
+        self._compression  = codec.preferred(compression)
 
     async def init(self):
         self._ex = await self._ch.declare_exchange(
             self._name, ExchangeType.TOPIC, durable=True)
         await self._ch.set_qos(prefetch_count=0)      # publisher, no need to limit
 
-    async def publish(self, rk: str, payload: dict):
-        body = json.dumps(payload).encode()
-        msg = Message(body, content_type="application/json", delivery_mode=2)
-        await self._ex.publish(msg, routing_key=rk)   # confirm-mode default in aio-pika
+    async def probe(self):
+        """Cheapest broker round trip: a passive exchange declare, no message."""
+        await self._ch.declare_exchange(self._name, ExchangeType.TOPIC, passive=True)
+
+    async def publish(self, rk: str, payload: dict, *, headers: dict | None = None,
+                      message_id: str | None = None, expiration: float | None = None):
+        await self.publish_body(rk, json.dumps(payload).encode(), headers=headers,
+                                message_id=message_id, expiration=expiration)
+
+    async def publish_body(self, rk: str, body: bytes, *, headers: dict | None = None,
+                           message_id: str | None = None, expiration: float | None = None):
+        """
+        Publish an already serialised JSON body; `expiration` is a per-message
+        TTL in seconds.  Every message is stamped with its send time, as the
+        AMQP `timestamp` and (sub-second) as an `x-sent-at` header.
+        """
+        with tracing.span("amqp.publish", routing_key=rk):
+            sent = clock.now()
+            headers = tracing.inject(dict(headers or {}))
+            headers.setdefault("x-sent-at", sent.timestamp())
+            body, encoding = codec.maybe_compress(body, self._compress_min, self._compression)
+            msg = Message(body, content_type="application/json", content_encoding=encoding,
+                          delivery_mode=2, headers=headers, message_id=message_id,
+                          expiration=expiration, timestamp=sent)
+            await self._ex.publish(msg, routing_key=rk)   # confirm-mode default in aio-pika
+
+async def publish_reply(ch, reply_to: str, payload, *, correlation_id: str | None = None):
+    """Send a JSON reply straight to `reply_to` via the default exchange."""
+    body = json.dumps(payload).encode()
+    msg = Message(body, content_type="application/json", correlation_id=correlation_id)
+    await ch.default_exchange.publish(msg, routing_key=reply_to)
+
+async def dead_letter(message, cfg: AMQPConfig, *, reason: str, detail: str = ""):
+    """
+    Route a copy of `message` to the DLX with the rejection reason in its
+    headers, then ack the original (a plain reject cannot add headers).
+    """
+    ch = message.channel
+    headers = dict(message.headers or {})
+    headers.update({
+        "x-reject-reason": reason,
+        "x-reject-detail": detail[:1024],
+        "x-original-routing-key": message.routing_key or "",
+    })
+    await ch.basic_publish(
+        message.body,
+        exchange=cfg.dlx,
+        routing_key=message.routing_key or "",
+        properties=aiormq.spec.Basic.Properties(
+            content_type=message.content_type,
+            content_encoding=message.content_encoding,
+            headers=headers,
+            delivery_mode=2,
+        ),
+    )
+    await message.ack()
 
 # ──────────────────────────────────────────────────────────────
-async def start_consumer(ch, queue_name: str, handler, *, prefetch: int = 100):
-    """Subscribe to a queue; handler(message, payload) coroutine must ack/nack."""
+_STOP = object()
+
+# epoch seconds (authoritative clock) at which the message being handled reached this process
+DELIVERED_AT: ContextVar[float | None] = ContextVar("delivered_at", default=None)
+
+
+class Subscription:
+    """
+    A basic.consume feeding a local buffer that `concurrency` tasks work
+    through (one task keeps delivery order), like `queue.iterator()` but
+    stoppable without losing messages.
+
+    `drain()` sends basic.cancel so the broker stops delivering, keeps
+    handling what was already prefetched until the deadline, then nacks
+    anything left back onto the queue (requeue) for another consumer.
+    """
+    def __init__(self, queue, handler, *, decode: bool = True, concurrency: int = 1):
+        if concurrency < 1:
+            raise ValueError("Subscription concurrency must be at least 1")
+        self._queue = queue
+        self._handler = handler
+        self._decode = decode
+        self.concurrency = concurrency
+        self._buf: asyncio.Queue = asyncio.Queue()
+        self._tag = None
+        self._inflight: set = set()     # messages being handled right now
+        self.task: asyncio.Task | None = None
+        self.handled = 0
+
+    async def start(self):
+        self._tag = await self._queue.consume(self._deliver)
+        self.task = asyncio.create_task(self._run_all())
+
+    async def _deliver(self, message):
+        self._buf.put_nowait((clock.now().timestamp(), message))
+
+    async def _run_all(self):
+        if self.concurrency == 1:
+            await self._run()
+        else:
+            await asyncio.gather(*(self._run() for _ in range(self.concurrency)))
+
+    async def _run(self):
+        while (item := await self._buf.get()) is not _STOP:
+            delivered_at, message = item
+            DELIVERED_AT.set(delivered_at)
+            self._inflight.add(message)
+            async with message.process(requeue=True, ignore_processed=True):
+                body = codec.decompress(message.body, message.content_encoding)
+                payload = json.loads(body) if self._decode else body
+                await self._handler(message, payload)
+            self._inflight.discard(message)
+            self.handled += 1
+
+    async def drain(self, timeout: float) -> int:
+        """Stop deliveries and finish the buffer within `timeout`; returns # requeued unhandled."""
+        if self._tag is not None:
+            await self._queue.cancel(self._tag)
+            self._tag = None
+        abandoned = 0
+        if not self.task.done():
+            for _ in range(self.concurrency):
+                self._buf.put_nowait(_STOP)
+            try:
+                await asyncio.wait_for(self.task, timeout)
+            except asyncio.TimeoutError:
+                # in-flight messages are requeued by message.process()
+                abandoned += len(self._inflight)
+        while not self._buf.empty():
+            item = self._buf.get_nowait()
+            if item is not _STOP:
+                await item[1].nack(requeue=True)
+                abandoned += 1
+        return abandoned
+
+
+
+async def start_consumer(ch, queue_name: str, handler, *, prefetch: int = 100,
+                         decode: bool = True, concurrency: int = 1) -> Subscription:
+    """
+    Subscribe to a queue; handler(message, payload) is called for one
+    message at a time per task, `concurrency` tasks (ack / nack-requeue on
+    error is handled here).  With decode=False the handler gets the raw
+    body bytes instead of JSON.  Compressed bodies (`content_encoding`) are
+    inflated first either way.  Returns the running `Subscription`; its
+    `task` fails if a handler raises.
+    """
     await ch.set_qos(prefetch_count=prefetch)
     queue = await ch.declare_queue(queue_name, passive=True)
-    async with queue.iterator() as q:
-        async for message in q:
-            async with message.process(requeue=True):
-                payload = json.loads(message.body)
-                await handler(message, payload)
+    sub = Subscription(queue, handler, decode=decode, concurrency=concurrency)
+    await sub.start()
+    return sub
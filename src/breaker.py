@@ -0,0 +1,93 @@
+"""
+Failure containment for the producer:
+
+* `backoff()` – capped exponential delay with jitter, so replicas that
+  failed together do not retry together.
+* `CircuitBreaker` – after `failure_threshold` consecutive failures of a
+  dependency (the broker) it opens: callers stop sending work and wait
+  `retry_in()` seconds, then get one half-open trial.  A success closes it;
+  a failure re-opens it for a longer, jittered cool-down.
+
+State is exported as `circuit_breaker_state{name}` (0 closed, 1 half-open,
+2 open) and transitions as `circuit_breaker_transitions_total{name,state}`.
+"""
+from __future__ import annotations
+
+import logging
+import random
+import time
+from typing import Callable, Optional
+
+from prometheus_client import Counter, Gauge
+
+LOG = logging.getLogger("scheduler.breaker")
+
+BREAKER_STATE = Gauge("circuit_breaker_state", "0 closed, 1 half-open, 2 open", ["name"])
+BREAKER_TRANSITIONS = Counter("circuit_breaker_transitions_total", "Breaker state changes",
+                              ["name", "state"])
+
+CLOSED, HALF_OPEN, OPEN = "closed", "half_open", "open"
+_LEVEL = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+
+def backoff(attempt: int, base: float, cap: float, *,
+            rand: Callable[[], float] = random.random) -> float:
+    """Delay before retry `attempt` (0-based): 2**attempt · base up to `cap`, then ½–1× of it."""
+    delay = min(cap, base * 2 ** min(attempt, 32))
+    return delay / 2 * (1 + rand())
+
+
+class CircuitBreaker:
+    def __init__(self, name: str, *, failure_threshold: int = 5, reset_timeout: float = 1.0,
+                 max_reset_timeout: float = 60.0, clock: Callable[[], float] = time.monotonic):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.max_reset_timeout = max_reset_timeout
+        self._clock = clock
+        self._state = CLOSED
+        self._failures = 0          # consecutive, while closed
+        self._opens = 0             # consecutive opens without a success
+        self._retry_at = 0.0
+        self.last_error: Optional[BaseException] = None
+        BREAKER_STATE.labels(name).set(0)
+
+    @property
+    def state(self) -> str:
+        if self._state == OPEN and self._clock() >= self._retry_at:
+            self._to(HALF_OPEN)
+        return self._state
+
+    @property
+    def closed(self) -> bool:
+        return self.state == CLOSED
+
+    def retry_in(self) -> float:
+        """Seconds until the next trial is allowed; 0 unless open."""
+        return max(self._retry_at - self._clock(), 0.0) if self.state == OPEN else 0.0
+
+    def success(self) -> None:
+        self._failures = 0
+        self._opens = 0
+        if self._state != CLOSED:
+            self._to(CLOSED)
+
+    def failure(self, exc: Optional[BaseException] = None) -> None:
+        self.last_error = exc
+        self._failures += 1
+        state = self.state
+        if state == HALF_OPEN or (state == CLOSED and self._failures >= self.failure_threshold):
+            cool_down = backoff(self._opens, self.reset_timeout, self.max_reset_timeout)
+            self._opens += 1
+            self._retry_at = self._clock() + cool_down
+            self._to(OPEN)
+
+    def _to(self, state: str) -> None:
+        prev, self._state = self._state, state
+        BREAKER_STATE.labels(self.name).set(_LEVEL[state])
+        BREAKER_TRANSITIONS.labels(self.name, state).inc()
+        if state == OPEN:
+            LOG.warning("%s breaker %s → open for %.1fs: %s", self.name, prev,
+                        self._retry_at - self._clock(), self.last_error)
+        else:
+            LOG.info("%s breaker %s → %s", self.name, prev, state)
@@ -1,5 +1,37 @@
-from datetime import datetime, timezone
-from typing import Callable
+"""
+Authoritative time.  Claims, reschedules, delay tiers and lateness all
+compare against `now()`, which reads the installed time source:
+
+* `WallClock`      – the host clock (default).
+* `MonotonicClock` – anchored once, then advanced by `time.monotonic()`, so
+  an NTP step on the host never moves it backwards.
+* `DBClock`        – a `MonotonicClock` re-anchored every sync to the
+  database's clock (`store.db_now()`), corrected by half the round trip of
+  the fastest of a few samples.  All producers then agree on "due" however
+  far their hosts drift; `clock_skew_seconds` shows by how much.
+* `VirtualClock`   – moves only on `advance()` / `set()`; for simulations.
+
+`configure(settings, store)` installs the source picked by `CLOCK_SOURCE`;
+`use()` installs any source; `using(source)` does so for one block and
+`freeze_time(at)` pins a fixed instant.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Awaitable, Callable, Optional, Protocol, Union
+
+from prometheus_client import Gauge
+
+LOG = logging.getLogger("scheduler.clock")
+
+CLOCK_SKEW = Gauge("clock_skew_seconds", "Database clock minus host clock at the last sync")
+CLOCK_RTT = Gauge("clock_sync_rtt_seconds", "Round trip of the sample the skew was taken from")
+
+SOURCES = ("wall", "monotonic", "db")
+
 
 # Default implementation
 def _utc_now() -> datetime:
@@ -12,15 +44,162 @@ def now() -> datetime:
     """Current UTC time. Use this everywhere."""
     return _now_fn()
 
-# Testing helper
-class freeze_time:     # context-manager
-    def __init__(self, fixed: datetime):
-        self.fixed = fixed
+
+# ── Time sources ────────────────────────────────────────────────────────────
+class TimeSource(Protocol):
+    def now(self) -> datetime: ...
+
+
+class WallClock(TimeSource):
+    def now(self) -> datetime:
+        return _utc_now()
+
+
+class MonotonicClock(TimeSource):
+    """
+    `anchor + (monotonic() - anchor_mono)`.  Re-anchoring earlier than the
+    last reading holds the clock still until it catches up, so readings
+    never decrease.
+    """
+
+    def __init__(self, start: Optional[datetime] = None, *,
+                 mono: Callable[[], float] = time.monotonic):
+        self._mono = mono
+        self._last: Optional[datetime] = None
+        self.anchor(start or _utc_now())
+
+    def anchor(self, at: datetime, mono: Optional[float] = None) -> None:
+        """`at` is the time it was at monotonic instant `mono` (default: now)."""
+        self._at = at
+        self._at_mono = self._mono() if mono is None else mono
+
+    def now(self) -> datetime:
+        t = self._at + timedelta(seconds=self._mono() - self._at_mono)
+        if self._last is not None and t < self._last:
+            return self._last
+        self._last = t
+        return t
+
+
+class DBClock(MonotonicClock):
+    """
+    Follows the database clock.  `sync()` takes `samples` readings of
+    `fetch()` and anchors on the one with the smallest round trip, assuming
+    the server read its clock half-way through.  Between syncs (or when a
+    sync fails) it runs on the monotonic clock from the last good anchor.
+    """
+
+    def __init__(self, fetch: Callable[[], Awaitable[datetime]], *, samples: int = 3,
+                 skew_warn: float = 0.5, wall: Callable[[], datetime] = _utc_now,
+                 mono: Callable[[], float] = time.monotonic):
+        super().__init__(wall(), mono=mono)
+        self._fetch = fetch
+        self._wall = wall
+        self.samples = samples
+        self.skew_warn = skew_warn
+        self.skew: Optional[timedelta] = None       # db − host, None until the first sync
+        self.rtt: Optional[float] = None
+        self._task: Optional[asyncio.Task] = None
+
+    async def sync(self) -> timedelta:
+        best = None
+        for _ in range(self.samples):
+            wall0, mono0 = self._wall(), self._mono()
+            db = await self._fetch()
+            mono1 = self._mono()
+            rtt = mono1 - mono0
+            if best is None or rtt < best[0]:
+                best = (rtt, db, wall0, mono1)
+        rtt, db, wall0, mono1 = best
+        half = timedelta(seconds=rtt / 2)
+        self.anchor(db + half, mono1)
+        self.skew, self.rtt = db - (wall0 + half), rtt
+        CLOCK_SKEW.set(self.skew.total_seconds())
+        CLOCK_RTT.set(rtt)
+        if abs(self.skew.total_seconds()) >= self.skew_warn:
+            LOG.warning("Host clock is %+.3fs off the database (rtt %.1f ms)",
+                        -self.skew.total_seconds(), rtt * 1000)
+        return self.skew
+
+    def start(self, interval: float) -> None:
+        self._task = asyncio.get_running_loop().create_task(self._resync(interval))
+
+    def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+
+    async def _resync(self, interval: float) -> None:
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.sync()
+            except Exception as exc:                    # keep the last anchor
+                LOG.warning("Clock sync failed, keeping the last offset: %s", exc)
+
+
+class VirtualClock(TimeSource):
+    """Stands still until moved; may be set backwards, unlike the others."""
+
+    def __init__(self, start: Optional[datetime] = None):
+        self._t = start or _utc_now()
+
+    def now(self) -> datetime:
+        return self._t
+
+    def advance(self, delta: Union[timedelta, float]) -> datetime:
+        self._t += delta if isinstance(delta, timedelta) else timedelta(seconds=delta)
+        return self._t
+
+    def set(self, at: datetime) -> None:
+        self._t = at
+
+
+def use(source: TimeSource) -> None:
+    """Make `source` the authoritative clock for the whole process."""
+    global _now_fn
+    _now_fn = source.now
+
+
+async def configure(settings, store) -> Optional[DBClock]:
+    """
+    Install the source named by `CLOCK_SOURCE`.  "db" syncs once before
+    returning (so the first claim already uses DB time) and keeps re-syncing
+    every `CLOCK_SYNC_INTERVAL_S`; the caller stops the returned clock.
+    """
+    kind = settings.CLOCK_SOURCE.lower()
+    if kind not in SOURCES:
+        raise ValueError(f"CLOCK_SOURCE must be one of {SOURCES}, not {kind!r}")
+    if kind == "wall":
+        use(WallClock())
+        return None
+    if kind == "monotonic":
+        use(MonotonicClock())
+        return None
+    clock = DBClock(store.db_now, skew_warn=settings.CLOCK_SKEW_WARN_MS / 1000)
+    skew = await clock.sync()
+    LOG.info("Using database time (skew %+.3fs, rtt %.1f ms)",
+             skew.total_seconds(), clock.rtt * 1000)
+    use(clock)
+    clock.start(settings.CLOCK_SYNC_INTERVAL_S)
+    return clock
+
+
+# Testing / simulation helpers
+class using:           # context-manager
+    """Install `source` for the duration of a block; yields the source."""
+    def __init__(self, source: TimeSource):
+        self.source = source
         self._saved = None
     def __enter__(self):
         global _now_fn
-        self._saved = _now_fn
-        _now_fn = lambda: self.fixed
+        self._saved, _now_fn = _now_fn, self.source.now
+        return self.source
     def __exit__(self, *exc):
         global _now_fn
         _now_fn = self._saved
+
+
+class freeze_time(using):
+    def __init__(self, fixed: datetime):
+        super().__init__(VirtualClock(fixed))
+        self.fixed = fixed
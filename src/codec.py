@@ -0,0 +1,63 @@
+"""
+Size-threshold compression for job payloads (DB) and message bodies (AMQP).
+
+zstd is used when the interpreter ships `compression.zstd` (3.14+),
+otherwise stdlib zlib.  The encoding name travels with the data –
+`jobs.payload_encoding` in Postgres, `content_encoding` on AMQP – so
+readers never guess, and either side can be upgraded independently.
+"""
+from __future__ import annotations
+
+import zlib
+from typing import Optional, Tuple
+
+try:                                   # Python 3.14+
+    from compression import zstd as _zstd
+except ImportError:                    # pragma: no cover - depends on interpreter
+    _zstd = None
+
+DEFLATE = "deflate"
+ZSTD = "zstd"
+
+
+def available(encoding: str) -> bool:
+    return encoding == DEFLATE or (encoding == ZSTD and _zstd is not None)
+
+
+def preferred(name: str = "auto") -> str:
+    """`auto` → zstd when available, else deflate."""
+    if name == "auto":
+        return ZSTD if _zstd is not None else DEFLATE
+    if not available(name):
+        raise ValueError(f"Compression {name!r} is not available")
+    return name
+
+
+def compress(data: bytes, encoding: str) -> bytes:
+    if encoding == ZSTD:
+        return _zstd.compress(data)
+    if encoding == DEFLATE:
+        return zlib.compress(data, 6)
+    raise ValueError(f"Unknown encoding {encoding!r}")
+
+
+def decompress(data: bytes, encoding: Optional[str]) -> bytes:
+    if not encoding or encoding == "identity":
+        return data
+    if encoding == ZSTD:
+        if _zstd is None:
+            raise ValueError("zstd-encoded data but zstd is not available")
+        return _zstd.decompress(data)
+    if encoding == DEFLATE:
+        return zlib.decompress(data)
+    raise ValueError(f"Unknown encoding {encoding!r}")
+
+
+def maybe_compress(data: bytes, min_bytes: int, encoding: str) -> Tuple[bytes, Optional[str]]:
+    """Compress when `data` is at least `min_bytes` (0 disables) and it actually helps."""
+    if not min_bytes or len(data) < min_bytes:
+        return data, None
+    packed = compress(data, encoding)
+    if len(packed) >= len(data):
+        return data, None
+    return packed, encoding
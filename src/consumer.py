@@ -1,6 +1,6 @@
 """
-Consumes ScheduleRequest / ScheduleCancel commands from RabbitMQ
-and persists them into Postgres (or marks them cancelled).
+Consumes ScheduleRequest / ScheduleUpdate / ScheduleCancel commands from
+RabbitMQ and persists them into Postgres (or marks them cancelled).
 
 Run with:
     python -m scheduler.cmd.consumer
@@ -15,21 +15,34 @@ import json
 import logging
 import os
 import signal
+import time
 import uuid
-from typing import Any, Dict
+from datetime import timedelta, timezone
+from typing import Any, Dict, List, Mapping, Optional, Sequence, Set, Tuple
 
 from aio_pika import IncomingMessage
-# from prometheus_client import Counter, start_http_server
+from prometheus_client import Counter, Histogram, start_http_server
 
 from amqp import (
+    DELIVERED_AT,
     AMQPConfig,
+    JSONPublisher,
+    LaneSpec,
     open_connection,
     declare_topology,
+    dead_letter,
+    publish_reply,
     start_consumer,
 )
-from repo import JobRepo
-from models import Job
+import clock
+import profiling
+import runtime
+import tracing
+from store import JobStore, open_store
+from dedup import DedupFilter, build_filter
+from models import Job, JobUpdate, RequestRejected, ScheduleRequest, parse_tags
 from config import settings
+from clock import now
 
 LOG = logging.getLogger("scheduler.consumer")
 logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
@@ -41,39 +54,154 @@ logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(mess
 # JOBS_DUE        = Counter("jobs_due_total",        "ScheduleDue emitted")
 
 # start_http_server(int(os.getenv("METRICS_PORT", 8000)))
+COMMANDS_REJECTED = Counter("commands_rejected_total", "Commands dead-lettered as invalid", ["reason"])
+DELAY_ROUTED = Counter("delay_tier_jobs_total", "Short one-shots by delay-tier outcome", ["outcome"])
+CANCEL_LATENCY = Histogram(
+    "cancel_latency_seconds", "Cancel sent (or, unstamped, delivered) until applied in the DB",
+    ["routing_key"],
+    buckets=(.005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10, 30, 60, 300),
+)
 # ---------------------------------------------------------------------------
 
 class ConsumerService:
-    def __init__(self, repo: JobRepo, cfg: AMQPConfig):
+    def __init__(self, repo: JobStore, cfg: AMQPConfig, *, dedup: DedupFilter | None = None,
+                 shutdown_timeout: float = 20.0, tombstone_ttl: float = 3600.0,
+                 compress_min_bytes: int = 0, lanes: Optional[Mapping[str, LaneSpec]] = None):
         self.repo = repo
         self.cfg  = cfg
+        self.lanes = dict(lanes or {})          # lane name → LaneSpec; missing → defaults
+        self.dedup = dedup
+        self.shutdown_timeout = shutdown_timeout
+        self.tombstone_ttl = tombstone_ttl      # kept beyond the largest delay tier
+        self.compress_min_bytes = compress_min_bytes
         self._stopping = asyncio.Event()
+        self._channel = None          # set in run(); used for batch replies
+        self._conn = None
+        # set in run() when delay tiers are configured
+        self._delay_pub: JSONPublisher | None = None
+        self._due_pub: JSONPublisher | None = None
+        # requests hold back while cancels are being applied (cancel priority)
+        self._cancels_inflight = 0
+        self._no_cancels = asyncio.Event()
+        self._no_cancels.set()
 
     # ---------- Rabbit handler ---------------------------------------------
-    async def handle_command(self, message: IncomingMessage, payload: Dict[str, Any]):
+    async def handle_command(self, message: IncomingMessage, body: bytes):
         """
-        Determine whether the message is a request or cancel based on its
-        routing-key.  Assumes we bound the queue with keys 'request' + 'cancel'.
+        Determine whether the message is a request, update or cancel based on
+        its routing-key.  Every lane queue (`AMQPConfig.command_lanes`) feeds
+        this, so any command is handled whichever queue it arrived on.
+
+        The body arrives undecoded: single requests are validated straight
+        from the bytes, everything else is json-decoded here.
         """
         rk = message.routing_key
+        parent = tracing.extract(message.headers)
+        with tracing.span("consumer.handle_command", parent=parent, routing_key=rk):
+            await self._dispatch(message, rk, body)
+
+    async def handle_cancel_lane(self, message: IncomingMessage, body: bytes):
+        """Cancel lane: while any cancel is in flight the request lane waits."""
+        self._cancels_inflight += 1
+        self._no_cancels.clear()
+        try:
+            await self.handle_command(message, body)
+        finally:
+            self._cancels_inflight -= 1
+            if not self._cancels_inflight:
+                self._no_cancels.set()
+
+    async def handle_request_lane(self, message: IncomingMessage, body: bytes):
+        await self._no_cancels.wait()
+        await self.handle_command(message, body)
+
+    def _observe_cancel(self, message: IncomingMessage, rk: str) -> None:
+        """
+        Cancel-to-effect latency, from the sender's `x-sent-at` header (epoch
+        seconds), else the AMQP timestamp (whole seconds), else the delivery
+        to this process.
+        """
+        sent = None
+        try:
+            sent = float((message.headers or {})["x-sent-at"])
+        except (KeyError, TypeError, ValueError):
+            stamp = message.timestamp
+            if stamp is not None:
+                if stamp.tzinfo is None:
+                    stamp = stamp.replace(tzinfo=timezone.utc)
+                sent = stamp.timestamp()
+        if sent is None:
+            sent = DELIVERED_AT.get()
+        if sent is not None:
+            CANCEL_LATENCY.labels(rk).observe(max(now().timestamp() - sent, 0.0))
+
+    async def _dispatch(self, message: IncomingMessage, rk: str, body: bytes):
         try:
             if rk == "request":
-                await self._handle_request(payload)
-            elif rk == "cancel":
+                await self._handle_request(body)
+                return
+            payload = json.loads(body)
+            if rk == "cancel":
                 await self._handle_cancel(payload)
+                self._observe_cancel(message, rk)
+            elif rk == "update":
+                results = await self._handle_update_batch([payload], strict=True)
+                await self._reply(message, results[0])
+            elif rk == "request.batch":
+                results = await self._handle_request_batch(payload)
+                await self._reply(message, results)
+            elif rk == "update.batch":
+                results = await self._handle_update_batch(self._batch_items(payload))
+                await self._reply(message, results)
+            elif rk == "cancel.batch":
+                results = await self._handle_cancel_batch(payload)
+                self._observe_cancel(message, rk)
+                await self._reply(message, results)
+            elif rk == "cancel.selector":
+                await self._handle_cancel_selector(message, payload)
+                self._observe_cancel(message, rk)
+            elif rk == "delayed":
+                await self._handle_delayed(payload)
             else:
                 LOG.warning("Unknown routing-key %s -> drop", rk)
+        except RequestRejected as exc:
+            LOG.warning("Rejecting %s (%s): %s", rk, exc.reason, exc.detail)
+            COMMANDS_REJECTED.labels(exc.reason).inc()
+            await dead_letter(message, self.cfg, reason=exc.reason, detail=exc.detail)
         except ValueError as exc:
             LOG.exception("Rejecting bad message: %s"% exc)
-            await message.reject(requeue=False)
+            reason = "invalid_json" if isinstance(exc, json.JSONDecodeError) else "invalid"
+            COMMANDS_REJECTED.labels(reason).inc()
+            await dead_letter(message, self.cfg, reason=reason, detail=str(exc))
         except Exception as exc:
             LOG.exception("Error handling %s: %s", rk, exc)
             # Let start_consumer() nack & requeue
             raise
 
-    async def _handle_request(self, payload: Dict[str, Any]):
-        job = Job.from_request_event(payload)
+    def _seen_recently(self, evt: Any) -> bool:
+        """Cheap pre-check on the raw id, before any parsing of the schedule."""
+        if self.dedup is None or not isinstance(evt, dict):
+            return False
+        try:
+            jid = uuid.UUID(evt["id"])
+        except (KeyError, TypeError, ValueError, AttributeError):
+            return False          # let full validation report it
+        return self.dedup.is_duplicate(jid)
+
+    async def _handle_request(self, body: bytes):
+        req = ScheduleRequest.from_json(body)
+        if self.dedup is not None and self.dedup.is_duplicate(req.id):
+            LOG.info("Duplicate request %s filtered", req.id)
+            return
+        job = Job.from_request(req)
+        job.trace_id = tracing.current_trace_id()
+        if await self._delay([job]):
+            if self.dedup is not None:
+                self.dedup.remember(job.id)
+            return
         inserted = await self.repo.insert_job(job)
+        if self.dedup is not None:
+            self.dedup.remember(job.id)
         if inserted:
             LOG.info("Queued new job %s due %s", job.id, job.next_run_at.isoformat())
         else:
@@ -85,51 +213,346 @@ class ConsumerService:
         except (KeyError, ValueError):
             raise ValueError("ScheduleCancel payload must contain valid 'id'")
         rows = await self.repo.cancel_job(jid)
+        if not rows:
+            await self._tombstone([jid])
         LOG.info("Cancelled job %s (rows=%d)", jid, rows)
 
+    # ---------- Delay tiers ------------------------------------------------
+    async def _delay(self, jobs: Sequence[Job]) -> Set[uuid.UUID]:
+        """
+        Publish the short one-shots among `jobs` straight into broker delay
+        tiers instead of Postgres; returns the ids now (or already) in a tier.
+        The rest take the DB path: recurring, beyond the largest tier, tiers
+        off, a failed publish, or a redelivery whose earlier attempt may not
+        have published.
+
+        One statement inserts a pending marker per id if absent, the tier
+        publishes are confirmed together, and one statement confirms their
+        markers.  A redelivered request with a confirmed marker is not
+        published again; one with a marker still pending (crash or broker
+        failure in between) goes to the DB, so it may fire twice but is
+        never lost.
+        """
+        if self._delay_pub is None:
+            return set()
+        t = now()
+        routed: Dict[uuid.UUID, Tuple[Job, int, float]] = {}
+        for job in jobs:
+            if job.is_recurring or job.id in routed:
+                continue
+            delay = (job.next_run_at - t).total_seconds()
+            tier = self.cfg.delay_tier_for(delay)
+            if tier is not None:
+                routed[job.id] = (job, tier, delay)
+        if not routed:
+            return set()
+        longest = max(delay for _, _, delay in routed.values())
+        expires_at = t + timedelta(seconds=max(longest, 0) + self.tombstone_ttl)
+        added, confirmed = await self.repo.add_delay_markers(routed, expires_at=expires_at)
+        for jid in confirmed:
+            LOG.info("Duplicate request %s already in a delay tier", jid)
+        for jid in routed.keys() - added - confirmed:
+            LOG.warning("Request %s has an unconfirmed delay marker, using the DB", jid)
+            DELAY_ROUTED.labels("fallback").inc()
+
+        sending = [item for jid, item in routed.items() if jid in added]
+        outcomes = await asyncio.gather(*(self._publish_delayed(*item) for item in sending),
+                                        return_exceptions=True)
+        published = set()
+        for (job, tier, delay), exc in zip(sending, outcomes):
+            if exc is not None:
+                # the marker stays pending: a redelivery takes the DB path too
+                LOG.warning("Delay tier publish failed for %s, using the DB: %s", job.id, exc)
+                DELAY_ROUTED.labels("fallback").inc()
+                continue
+            published.add(job.id)
+            DELAY_ROUTED.labels("delayed").inc()
+            LOG.info("Delayed job %s %.1fs in tier %ds", job.id, delay, tier)
+        await self.repo.confirm_delay_markers(published)
+        return published | confirmed
+
+    async def _publish_delayed(self, job: Job, tier: int, delay: float) -> None:
+        event = {
+            "id": str(job.id),
+            "job_type": job.job_type,
+            "payload": job.payload,
+            "due_at": job.next_run_at.isoformat(),
+        }
+        # per-message TTL = the exact delay; the tier's queue TTL caps it
+        await self._delay_pub.publish(self.cfg.delay_queue(tier), event,
+                                      message_id=event["id"], expiration=max(delay, 0.001))
+
+    async def _tombstone(self, ids: List[uuid.UUID]) -> None:
+        """
+        A cancel that matched no row may target a job waiting in a delay tier,
+        or one whose request is still queued in the request lane: the relay
+        drops it and the insert lands it cancelled.
+        """
+        ttl = (self.cfg.delay_tiers[-1] if self.cfg.delay_tiers else 0) + self.tombstone_ttl
+        await self.repo.add_tombstones(ids, expires_at=now() + timedelta(seconds=ttl))
+
+    async def _handle_delayed(self, payload: Dict[str, Any]):
+        """A delay-tier message expired: relay it as ScheduleDue unless it was cancelled."""
+        jid = uuid.UUID(payload["id"])
+        if await self.repo.take_tombstones([jid]):
+            DELAY_ROUTED.labels("cancelled").inc()
+            LOG.info("Delayed job %s was cancelled; dropped", jid)
+            return
+        event = {
+            "id": payload["id"],
+            "job_type": payload["job_type"],
+            "payload": payload["payload"],
+            "fired_at": now().isoformat(),
+            "attempt": 1,
+        }
+        await self._due_pub.publish(self.cfg.due_routing_key(event["job_type"]), event,
+                                    message_id=event["id"])
+        DELAY_ROUTED.labels("fired").inc()
+
+    # ---------- Batch envelopes --------------------------------------------
+    @staticmethod
+    def _batch_items(payload: Any) -> List[Any]:
+        """A batch body is either a bare JSON array or {"items": [...]}."""
+        items = payload.get("items") if isinstance(payload, dict) else payload
+        if not isinstance(items, list):
+            raise ValueError("Batch payload must be an array or contain 'items'")
+        return items
+
+    async def _handle_request_batch(self, payload: Any) -> List[Dict[str, Any]]:
+        """
+        Validate every ScheduleRequest in the envelope, then insert the valid
+        ones with a single multi-row statement.  Invalid items are reported,
+        not fatal: the rest of the batch still goes through.
+        """
+        results: List[Dict[str, Any]] = []
+        jobs: List[Job] = []
+        for evt in self._batch_items(payload):
+            if self._seen_recently(evt):
+                results.append({"id": evt["id"], "status": "duplicate"})
+                continue
+            try:
+                jobs.append(Job.from_request_event(evt))
+            except RequestRejected as exc:
+                jid = evt.get("id") if isinstance(evt, dict) else None
+                COMMANDS_REJECTED.labels(exc.reason).inc()
+                results.append({"id": jid, "status": "invalid",
+                                "reason": exc.reason, "error": exc.detail})
+
+        trace_id = tracing.current_trace_id()
+        for job in jobs:
+            job.trace_id = trace_id
+        delayed = await self._delay(jobs)
+        inserted = await self.repo.insert_jobs([j for j in jobs if j.id not in delayed])
+        if self.dedup is not None:
+            for job in jobs:
+                self.dedup.remember(job.id)
+        seen = set()
+        for job in jobs:
+            if job.id in seen:
+                status = "duplicate"
+            elif job.id in delayed:
+                status = "delayed"
+            else:
+                status = "inserted" if job.id in inserted else "duplicate"
+            seen.add(job.id)
+            results.append({"id": str(job.id), "status": status})
+
+        LOG.info("Batch request: %d inserted, %d delayed, %d neither (duplicate or invalid)",
+                 len(inserted), len(delayed), len(results) - len(inserted) - len(delayed))
+        return results
+
+    async def _handle_update_batch(
+        self, items: List[Any], *, strict: bool = False
+    ) -> List[Dict[str, Any]]:
+        """
+        Validate ScheduleUpdates and apply the valid ones in one statement.
+        Per item: `updated` (with the new `version`), `conflict` (the job
+        moved past the expected `version`), `not_pending`, `superseded` (a
+        later item in the same batch targets the same id) or `invalid`.
+        With `strict` (single update) an invalid item is dead-lettered instead.
+        """
+        results: List[Dict[str, Any]] = []
+        latest: Dict[uuid.UUID, Tuple[JobUpdate, Dict[str, Any]]] = {}
+        for evt in items:
+            try:
+                upd = JobUpdate.from_update_event(evt)
+            except RequestRejected as exc:
+                if strict:
+                    raise
+                jid = evt.get("id") if isinstance(evt, dict) else None
+                COMMANDS_REJECTED.labels(exc.reason).inc()
+                results.append({"id": jid, "status": "invalid",
+                                "reason": exc.reason, "error": exc.detail})
+                continue
+            if upd.id in latest:
+                latest[upd.id][1]["status"] = "superseded"
+            res = {"id": str(upd.id)}
+            latest[upd.id] = (upd, res)
+            results.append(res)
+
+        applied, conflicts = await self.repo.update_jobs([upd for upd, _ in latest.values()])
+        for jid, (_, res) in latest.items():
+            if jid in applied:
+                res.update(status="updated", version=applied[jid])
+            else:
+                res["status"] = "conflict" if jid in conflicts else "not_pending"
+
+        LOG.info("Update: %d applied, %d conflicts, %d items",
+                 len(applied), len(conflicts), len(results))
+        return results
+
+    async def _handle_cancel_batch(self, payload: Any) -> List[Dict[str, Any]]:
+        results: List[Dict[str, Any]] = []
+        ids: List[uuid.UUID] = []
+        for item in self._batch_items(payload):
+            raw = item.get("id") if isinstance(item, dict) else item
+            try:
+                ids.append(uuid.UUID(raw))
+            except (TypeError, ValueError, AttributeError):
+                results.append({"id": raw, "status": "invalid",
+                                "error": "ScheduleCancel item must contain valid 'id'"})
+
+        cancelled = await self.repo.cancel_jobs(ids)
+        missed = "tombstoned" if self._delay_pub is not None else "not_pending"
+        await self._tombstone([jid for jid in ids if jid not in cancelled])
+        for jid in ids:
+            results.append({"id": str(jid), "status": "cancelled" if jid in cancelled else missed})
+
+        LOG.info("Batch cancel: %d cancelled of %d", len(cancelled), len(ids))
+        return results
+
+    async def _handle_cancel_selector(self, message: IncomingMessage, payload: Any):
+        """
+        Cancel every pending job whose tags match `payload["selector"]`.
+        The running count is streamed to reply_to after each chunk.
+        """
+        if not isinstance(payload, dict):
+            raise ValueError("ScheduleCancel selector payload must be an object")
+        selector = parse_tags(payload.get("selector"))
+        if not selector:
+            raise ValueError("ScheduleCancel selector must not be empty")
+
+        total = 0
+        async for total in self.repo.cancel_by_selector(selector):
+            await self._reply(message, {"selector": selector, "cancelled": total, "done": False})
+        await self._reply(message, {"selector": selector, "cancelled": total, "done": True})
+        LOG.info("Cancelled %d jobs by selector %s", total, selector)
+
+    async def _reply(self, message: IncomingMessage, body: Any):
+        """Results go back only when the sender asked via reply_to."""
+        if not message.reply_to or self._channel is None:
+            return
+        if isinstance(body, list):
+            body = {"results": body}
+        await publish_reply(self._channel, message.reply_to, body,
+                            correlation_id=message.correlation_id)
+
     # ---------- Bootstrap / main loop --------------------------------------
     async def run(self):
         async with open_connection(self.cfg) as conn:
+            self._conn = conn
             await declare_topology(conn, self.cfg)
 
-            channel = await conn.channel()
-            # Commands are incoming only → set smallish prefetch for fairness
-            await start_consumer(
-                channel,
-                queue_name=self.cfg.cmd_q,
-                handler=self.handle_command,
-                prefetch=256,
-            )
-            # The iterator inside start_consumer() blocks; we park here
-            await self._stopping.wait()
+            # ScheduleDue relays of expired delay-tier jobs, and the tiers themselves
+            pub_ch = await conn.channel(publisher_confirms=True)
+            self._due_pub = JSONPublisher(pub_ch, self.cfg.evt_ex,
+                                          compress_min_bytes=self.compress_min_bytes)
+            await self._due_pub.init()
+            if self.cfg.delay_tiers:
+                delay_pub = JSONPublisher(pub_ch, self.cfg.delay_ex,
+                                          compress_min_bytes=self.compress_min_bytes)
+                await delay_pub.init()
+                self._delay_pub = delay_pub
+
+            self._channel = await conn.channel()        # batch replies
+            # One channel + consumer per lane, cancels first: each lane has its
+            # own prefetch, so a request flood never sits in front of a cancel.
+            handlers = {"cancel": self.handle_cancel_lane, "request": self.handle_request_lane}
+            subs = []
+            for name, (queue_name, _) in self.cfg.command_lanes().items():
+                spec = self.lanes.get(name, LaneSpec())
+                subs.append(await start_consumer(
+                    await conn.channel(),
+                    queue_name=queue_name,
+                    handler=handlers.get(name, self.handle_command),
+                    prefetch=spec.prefetch,
+                    concurrency=spec.concurrency,
+                    decode=False,
+                ))
+            stopping = asyncio.create_task(self._stopping.wait())
+            await asyncio.wait({*(s.task for s in subs), stopping},
+                               return_when=asyncio.FIRST_COMPLETED)
+            crashed = [s for s in subs if s.task.done()]
+            if crashed:
+                stopping.cancel()
+                crashed[0].task.result()    # a handler crashed: surface it
+                return
+
+            # Graceful drain before open_connection() closes the connection:
+            # no new deliveries, finish the prefetched ones, requeue the rest.
+            t0 = time.monotonic()
+            requeued = await asyncio.gather(*(s.drain(self.shutdown_timeout) for s in subs))
+            runtime.report_shutdown("consumer", time.monotonic() - t0,
+                                    {"requeued": sum(requeued)})
+
+    @property
+    def stopping(self) -> bool:
+        return self._stopping.is_set()
 
     def stop(self):
         self._stopping.set()
 
+    def amqp_ready(self) -> bool:
+        return self._conn is not None and not self._conn.is_closed
+
 
 # ---------------------------------------------------------------------------
 
 async def main():
     # 1) Config -----------------------------------------------------------------
-    pg_dsn     = settings.PG_DSN
-    rabbit_url = settings.RABBIT_URL
-    cfg        = AMQPConfig(rabbit_url)
+    cfg = AMQPConfig.from_settings(settings)
+
+    tracing.configure(settings)
+
+    # 2) Job store --------------------------------------------------------------
+    repo = await open_store(settings, roles=("ingest",))
+    db_clock = await clock.configure(settings, repo)
 
-    # 2) DB pool -----------------------------------------------------------------
-    repo = await JobRepo.create(pg_dsn, min_size=2, max_size=10)
+    # 3) Dedup filter -----------------------------------------------------------
+    dedup = build_filter(settings)
+    if dedup is not None and settings.DEDUP_PREWARM:
+        since = now() - timedelta(seconds=settings.DEDUP_WINDOW_S)
+        n = dedup.prewarm(await repo.recent_job_ids(since))
+        LOG.info("Dedup filter pre-warmed with %d ids", n)
 
-    # 3) Service -----------------------------------------------------------------
-    svc = ConsumerService(repo, cfg)
+    # 4) Service ----------------------------------------------------------------
+    svc = ConsumerService(repo, cfg, dedup=dedup, shutdown_timeout=settings.SHUTDOWN_TIMEOUT_S,
+                          tombstone_ttl=settings.DELAY_TOMBSTONE_TTL_S,
+                          compress_min_bytes=settings.AMQP_COMPRESS_MIN_BYTES,
+                          lanes={name: LaneSpec.from_settings(settings, name)
+                                 for name in cfg.command_lanes()})
+    start_http_server(settings.METRICS_PORT)
+    health = await runtime.start_runtime(settings)
+    health.add_check("db", repo.ping)
+    health.add_check("amqp", svc.amqp_ready)
+    health.add_check("accepting", lambda: not svc.stopping)
+    profiling.install("consumer", settings, health)
 
-    # 4) Graceful-shutdown plumbing ---------------------------------------------
+    # 5) Graceful-shutdown plumbing ---------------------------------------------
     loop = asyncio.get_running_loop()
     for sig in (signal.SIGINT, signal.SIGTERM):
         loop.add_signal_handler(sig, svc.stop)
 
     LOG.info("Consumer starting…")
-    await svc.run()
+    try:
+        await svc.run()
+    finally:
+        await health.stop()
+        if db_clock is not None:
+            db_clock.stop()
+        await repo.close()
     LOG.info("Consumer shut down.")
 
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    runtime.run(main(), use_uvloop=settings.USE_UVLOOP)
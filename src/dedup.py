@@ -0,0 +1,166 @@
+"""
+Consumer-side filter of recently inserted job ids.
+
+After a broker failover RabbitMQ redelivers large parts of the inbox; every
+redelivered ScheduleRequest would otherwise cost an INSERT … ON CONFLICT
+round trip.  `RecentIds` (exact, bounded) and `RecentBloom` (approximate,
+fixed memory) remember ids for a time window and are consulted first.
+
+`check()` answers:
+    HIT    – definitely seen, skip the DB
+    MAYBE  – Bloom filter says "probably"; the policy decides (DB or skip)
+    MISS   – not seen, go to the DB
+"""
+from __future__ import annotations
+
+import hashlib
+import math
+import time
+import uuid
+from collections import OrderedDict
+from enum import Enum
+from typing import Callable, Iterable, Optional
+
+from prometheus_client import Counter, Gauge
+
+DEDUP_LOOKUPS = Counter("dedup_lookups_total", "Dedup filter lookups", ["result"])
+DEDUP_SKIPPED = Counter("dedup_skipped_total", "ScheduleRequests answered without touching the DB")
+DEDUP_SIZE    = Gauge("dedup_tracked_ids", "Ids currently tracked by the dedup filter")
+
+
+class Verdict(str, Enum):
+    HIT   = "hit"
+    MAYBE = "maybe"
+    MISS  = "miss"
+
+
+class RecentIds:
+    """Exact set of ids seen in the last `window_s` seconds, capped at `max_ids`."""
+
+    def __init__(self, *, window_s: float, max_ids: int,
+                 clock: Callable[[], float] = time.monotonic):
+        self.window_s = window_s
+        self.max_ids = max_ids
+        self._clock = clock
+        self._seen: OrderedDict[uuid.UUID, float] = OrderedDict()
+
+    def _expire(self, now: float) -> None:
+        cutoff = now - self.window_s
+        seen = self._seen
+        while seen:
+            jid, ts = next(iter(seen.items()))
+            if ts > cutoff and len(seen) <= self.max_ids:
+                break
+            seen.popitem(last=False)
+
+    def add(self, jid: uuid.UUID) -> None:
+        now = self._clock()
+        self._seen[jid] = now
+        self._seen.move_to_end(jid)
+        self._expire(now)
+        DEDUP_SIZE.set(len(self._seen))
+
+    def check(self, jid: uuid.UUID) -> Verdict:
+        self._expire(self._clock())
+        return Verdict.HIT if jid in self._seen else Verdict.MISS
+
+
+class RecentBloom:
+    """
+    Two-generation Bloom filter: ids land in the current generation, lookups
+    consult both, and generations rotate every `window_s / 2` – so an id is
+    remembered for between half and one full window in constant memory.
+    """
+
+    def __init__(self, *, window_s: float, max_ids: int, fp_rate: float = 0.001,
+                 clock: Callable[[], float] = time.monotonic):
+        # classic sizing for `max_ids` per generation at the requested fp rate
+        self._m = max(8, int(-max_ids * math.log(fp_rate) / (math.log(2) ** 2)))
+        self._k = max(1, round(self._m / max_ids * math.log(2)))
+        self._half = window_s / 2
+        self._clock = clock
+        self._cur = bytearray((self._m + 7) // 8)
+        self._prev = bytearray(len(self._cur))
+        self._rotated_at = clock()
+        self._count = 0
+
+    def _positions(self, jid: uuid.UUID) -> Iterable[int]:
+        d = hashlib.blake2b(jid.bytes, digest_size=16).digest()
+        h1 = int.from_bytes(d[:8], "little")
+        h2 = int.from_bytes(d[8:], "little") | 1
+        m = self._m
+        return ((h1 + i * h2) % m for i in range(self._k))
+
+    def _maybe_rotate(self) -> None:
+        now = self._clock()
+        if now - self._rotated_at >= self._half:
+            # after a long idle period both generations are stale
+            stale = now - self._rotated_at >= 2 * self._half
+            self._prev = bytearray(len(self._cur)) if stale else self._cur
+            self._cur = bytearray(len(self._prev))
+            self._rotated_at = now
+            self._count = 0
+
+    def add(self, jid: uuid.UUID) -> None:
+        self._maybe_rotate()
+        cur = self._cur
+        for p in self._positions(jid):
+            cur[p >> 3] |= 1 << (p & 7)
+        self._count += 1
+        DEDUP_SIZE.set(self._count)
+
+    def check(self, jid: uuid.UUID) -> Verdict:
+        self._maybe_rotate()
+        pos = list(self._positions(jid))
+        for bits in (self._cur, self._prev):
+            if all(bits[p >> 3] & (1 << (p & 7)) for p in pos):
+                return Verdict.MAYBE
+        return Verdict.MISS
+
+
+class DedupFilter:
+    """
+    Policy wrapper used by ConsumerService.
+
+    on_maybe="db"   – a Bloom "maybe" still goes to the DB (never drops a job)
+    on_maybe="skip" – trust the filter; a false positive drops that request
+    """
+
+    def __init__(self, impl, *, on_maybe: str = "db"):
+        if on_maybe not in ("db", "skip"):
+            raise ValueError("on_maybe must be 'db' or 'skip'")
+        self._impl = impl
+        self.on_maybe = on_maybe
+
+    def is_duplicate(self, jid: uuid.UUID) -> bool:
+        verdict = self._impl.check(jid)
+        DEDUP_LOOKUPS.labels(verdict.value).inc()
+        skip = verdict is Verdict.HIT or (verdict is Verdict.MAYBE and self.on_maybe == "skip")
+        if skip:
+            DEDUP_SKIPPED.inc()
+        return skip
+
+    def remember(self, jid: uuid.UUID) -> None:
+        self._impl.add(jid)
+
+    def prewarm(self, ids: Iterable[uuid.UUID]) -> int:
+        n = 0
+        for jid in ids:
+            self._impl.add(jid)
+            n += 1
+        return n
+
+
+def build_filter(settings) -> Optional[DedupFilter]:
+    """Factory from `config.Settings`; returns None when DEDUP_MODE=off."""
+    mode = settings.DEDUP_MODE.lower()
+    if mode == "off":
+        return None
+    if mode == "exact":
+        impl = RecentIds(window_s=settings.DEDUP_WINDOW_S, max_ids=settings.DEDUP_MAX_IDS)
+    elif mode == "bloom":
+        impl = RecentBloom(window_s=settings.DEDUP_WINDOW_S, max_ids=settings.DEDUP_MAX_IDS,
+                           fp_rate=settings.DEDUP_BLOOM_FP)
+    else:
+        raise ValueError(f"Unknown DEDUP_MODE {settings.DEDUP_MODE!r}")
+    return DedupFilter(impl, on_maybe=settings.DEDUP_ON_MAYBE)
@@ -0,0 +1,172 @@
+"""
+Backlog drain: a streaming claim → publish → finalize pipeline the producer
+switches to when the overdue set is large (after an outage, or a bulk import
+with past timestamps).
+
+The normal loop claims, publishes and finalizes one batch at a time.  Here
+the three run as concurrent stages joined by bounded queues, so the next
+claim and the previous finalize overlap the publishes.  Claims are keyset-
+paginated on (next_run_at, id) up to a cutoff fixed when the drain starts;
+they never revisit rows still in flight.  At most `depth` batches sit in
+each queue, so memory stays flat however large the backlog is.  Publishing
+is paced to `rate` messages/s so the broker is not flooded.
+
+Progress (`backlog_overdue_jobs`, the ETA) counts down from a probe capped
+at `count_cap` rows, so a huge backlog is never counted in full on the
+claim pool; the probe is repeated when a capped count runs out.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from datetime import datetime
+from typing import TYPE_CHECKING, List, Optional, Tuple
+
+from prometheus_client import Gauge
+
+from clock import now
+
+if TYPE_CHECKING:                      # pragma: no cover
+    from producer import ProducerService
+
+LOG = logging.getLogger("scheduler.drain")
+
+BACKLOG_SIZE = Gauge("backlog_overdue_jobs", "Overdue pending jobs left in the current drain")
+BACKLOG_ETA  = Gauge("backlog_drain_eta_seconds", "Estimated time to finish the current drain")
+
+_DONE = object()
+
+
+class RateLimiter:
+    """Pace calls to `rate`/s with a small burst allowance; rate 0 = unlimited."""
+
+    def __init__(self, rate: float, *, burst: int = 100):
+        self.rate = rate
+        self._slack = burst / rate if rate else 0.0
+        self._next = time.monotonic()
+
+    async def acquire(self) -> None:
+        if not self.rate:
+            return
+        t = time.monotonic()
+        self._next = max(self._next, t - self._slack) + 1 / self.rate
+        wait = self._next - t - self._slack
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+
+class BacklogDrain:
+    def __init__(
+        self,
+        svc: "ProducerService",
+        *,
+        threshold: int = 50_000,
+        batch: int = 2000,
+        depth: int = 4,
+        rate: float = 0,
+        report_s: float = 10,
+        count_cap: int = 1_000_000,
+    ):
+        self.svc = svc
+        self.threshold = threshold
+        self.batch = batch
+        self.depth = depth
+        self.limiter = RateLimiter(rate)
+        self.report_s = report_s
+        self.count_cap = count_cap
+        self.remaining = 0
+        self._capped = False                # remaining is a lower bound
+        self.fired = 0
+
+    async def should_drain(self) -> bool:
+        """Cheap probe: stops counting once the threshold is reached."""
+        if not self.threshold:
+            return False
+        return await self.svc.repo.count_overdue(cap=self.threshold) >= self.threshold
+
+    # ------------------------------------------------------------------
+    async def run(self) -> int:
+        """Drain everything due as of now; returns the number of jobs fired."""
+        cutoff = now()
+        await self._count(cutoff)
+        self.fired = 0
+        LOG.info("Backlog drain started: %s%d overdue jobs (cutoff %s)",
+                 "≥" if self._capped else "", self.remaining, cutoff.isoformat())
+        to_fire: asyncio.Queue = asyncio.Queue(self.depth)
+        to_finalize: asyncio.Queue = asyncio.Queue(self.depth)
+        t0 = time.monotonic()
+        async with asyncio.TaskGroup() as tg:
+            tg.create_task(self._claim(cutoff, to_fire))
+            tg.create_task(self._publish(to_fire, to_finalize))
+            tg.create_task(self._finalize(to_finalize, t0, cutoff))
+        BACKLOG_SIZE.set(0)
+        BACKLOG_ETA.set(0)
+        LOG.info("Backlog drain finished: %d jobs in %.1fs", self.fired, time.monotonic() - t0)
+        return self.fired
+
+    async def _claim(self, cutoff: datetime, out: asyncio.Queue) -> None:
+        repo, phases = self.svc.repo, self.svc.phases
+        after: Optional[Tuple[datetime, object]] = None
+        while not self.svc.stopping and self.svc.breaker.closed:
+            t0 = time.perf_counter()
+            jobs = await repo.lock_due_jobs(now=cutoff, limit=self.batch, after=after)
+            if not jobs:
+                break
+            await repo.load_payloads(jobs)
+            phases.add("claim", time.perf_counter() - t0)
+            after = (jobs[-1].next_run_at, jobs[-1].id)
+            await out.put(jobs)
+        await out.put(_DONE)
+
+    async def _publish(self, inp: asyncio.Queue, out: asyncio.Queue) -> None:
+        svc = self.svc
+        while (jobs := await inp.get()) is not _DONE:
+            rescheduled: List = []
+            done: List = []
+            for i, job in enumerate(jobs):
+                if svc.stopping:              # leave the rest pending for the next claim
+                    svc.abandoned["unfired"] += len(jobs) - i
+                    break
+                if not svc.breaker.closed:    # broker down: pending again; run() waits it out
+                    break
+                await self.limiter.acquire()
+                await svc._fire_into(job, rescheduled, done)
+            await svc._flush_envelopes(rescheduled, done)
+            await out.put((rescheduled, done))
+        await out.put(_DONE)
+
+    async def _count(self, cutoff: datetime) -> None:
+        self.remaining = await self.svc.repo.count_overdue(now=cutoff, cap=self.count_cap)
+        self._capped = self.remaining >= self.count_cap
+
+    async def _finalize(self, inp: asyncio.Queue, t0: float, cutoff: datetime) -> None:
+        svc = self.svc
+        last_report = t0
+        while (item := await inp.get()) is not _DONE:
+            rescheduled, done = item
+            t = time.perf_counter()
+            try:
+                await svc.repo.finalize_batch(rescheduled, done)
+            except asyncio.CancelledError:
+                svc.abandoned["unfinalized"] += len(rescheduled) + len(done)
+                raise
+            svc.phases.add("finalize", time.perf_counter() - t)
+            svc.phases.flush()
+            svc.last_tick = time.monotonic()
+
+            n = len(rescheduled) + len(done)
+            self.fired += n
+            # rescheduled occurrences may still be overdue; never report < 0
+            self.remaining = max(self.remaining - n, 0)
+            if self._capped and not self.remaining:
+                await self._count(cutoff)
+            elapsed = time.monotonic() - t0
+            rate = self.fired / elapsed if elapsed else 0.0
+            eta = self.remaining / rate if rate else 0.0
+            BACKLOG_SIZE.set(self.remaining)
+            BACKLOG_ETA.set(eta)
+            if time.monotonic() - last_report >= self.report_s:
+                last_report = time.monotonic()
+                LOG.info("Draining: %d fired, ~%d left, %.0f jobs/s, ETA %.0fs",
+                         self.fired, self.remaining, rate, eta)
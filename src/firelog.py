@@ -0,0 +1,162 @@
+"""
+Append-only fire log: one row per published ScheduleDue (job, due_at,
+fired_at, attempt) in `job_fire_log`, for lateness and SLA audits.
+
+The producer hands each claimed batch's fires to `FireLog.add()`, which
+only appends to a bounded in-memory buffer.  A background task writes the
+buffer out with `store.write_fire_log()` (COPY on Postgres) every
+`flush_rows` rows or `flush_interval` seconds, whichever comes first, so
+firing never waits on the log's round trips.  When the database falls
+behind and the buffer reaches `capacity` rows, `on_full` decides:
+
+* "drop"  – the new records are discarded and counted (firing unaffected)
+* "block" – `add()` waits for a flush to make room (the log stays complete,
+  firing slows down to the log's write rate)
+
+Once per UTC day (and at start) it creates the next `partitions_ahead` day
+partitions and drops the ones older than `retention_days`.
+
+Exported as `fire_log_rows_total{outcome}` (written, dropped, failed),
+`fire_log_buffered` and `fire_log_flush_seconds`.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from datetime import date, timedelta
+from typing import List, Optional, Sequence
+
+from prometheus_client import Counter, Gauge, Histogram
+
+from clock import now
+from models import FireRecord
+from store import JobStore
+
+LOG = logging.getLogger("scheduler.firelog")
+
+FIRE_LOG_ROWS = Counter("fire_log_rows_total", "Fire-log records by outcome", ["outcome"])
+FIRE_LOG_BUFFERED = Gauge("fire_log_buffered", "Fire-log records waiting to be written")
+FIRE_LOG_FLUSH = Histogram("fire_log_flush_seconds", "Duration of one fire-log write",
+                           buckets=(.001, .005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5))
+
+POLICIES = ("drop", "block")
+
+
+class FireLog:
+    def __init__(self, store: JobStore, *, capacity: int = 100_000, flush_rows: int = 5000,
+                 flush_interval: float = 1.0, on_full: str = "drop",
+                 retention_days: int = 14, partitions_ahead: int = 2):
+        if on_full not in POLICIES:
+            raise ValueError(f"FIRE_LOG_ON_FULL must be one of {POLICIES}, not {on_full!r}")
+        self.store = store
+        self.capacity = capacity
+        self.flush_rows = min(flush_rows, capacity)
+        self.flush_interval = flush_interval
+        self.on_full = on_full
+        self.retention_days = retention_days
+        self.partitions_ahead = partitions_ahead
+        self._buf: List[FireRecord] = []
+        self._writing = 0                   # rows taken by the flush in progress
+        self._wake = asyncio.Event()        # buffer reached flush_rows
+        self._room = asyncio.Event()        # a flush finished ("block" waiters)
+        self._stopping = False
+        self._task: Optional[asyncio.Task] = None
+        self._maintained: Optional[date] = None
+
+    @property
+    def buffered(self) -> int:
+        return len(self._buf) + self._writing
+
+    async def add(self, records: Sequence[FireRecord]) -> None:
+        """Queue records for the next flush; never touches the database itself."""
+        records = list(records)
+        while records:
+            room = self.capacity - self.buffered
+            if room <= 0:
+                if self.on_full == "drop" or self._stopping:
+                    FIRE_LOG_ROWS.labels("dropped").inc(len(records))
+                    break
+                self._wake.set()
+                self._room.clear()
+                await self._room.wait()
+                continue
+            self._buf.extend(records[:room])
+            records = records[room:]
+            if len(self._buf) >= self.flush_rows:
+                self._wake.set()
+        FIRE_LOG_BUFFERED.set(self.buffered)
+
+    # ------------------------------------------------------------------
+    async def start(self) -> None:
+        await self.maintain()
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def close(self, timeout: float = 10.0) -> None:
+        """Stop the background task and write what is left within `timeout`."""
+        self._stopping = True
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        try:
+            await asyncio.wait_for(self._flush_all(), timeout)
+        except asyncio.TimeoutError:
+            LOG.warning("Fire log: %d records not written at shutdown", self.buffered)
+            FIRE_LOG_ROWS.labels("dropped").inc(self.buffered)
+        self._room.set()
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            try:
+                if self._maintained != now().date():
+                    await self.maintain()
+                await self._flush_all()
+            except Exception as exc:        # never take the producer down
+                LOG.warning("Fire log upkeep failed: %s", exc)
+
+    async def _flush_all(self) -> None:
+        while self._buf:
+            await self.flush()
+
+    async def flush(self) -> int:
+        """Write up to `flush_rows` buffered records; returns how many were written."""
+        batch = self._buf[:self.flush_rows]
+        if not batch:
+            return 0
+        del self._buf[:len(batch)]
+        self._writing = len(batch)
+        t0 = time.perf_counter()
+        try:
+            await self.store.write_fire_log(batch)
+        except Exception as exc:
+            # e.g. no partition yet for a day; records are lost, firing is not
+            LOG.warning("Fire log write of %d records failed: %s", len(batch), exc)
+            FIRE_LOG_ROWS.labels("failed").inc(len(batch))
+            self._maintained = None         # re-check partitions next round
+            return 0
+        finally:
+            self._writing = 0
+            FIRE_LOG_BUFFERED.set(self.buffered)
+            self._room.set()
+        FIRE_LOG_FLUSH.observe(time.perf_counter() - t0)
+        FIRE_LOG_ROWS.labels("written").inc(len(batch))
+        return len(batch)
+
+    async def maintain(self) -> None:
+        """Create partitions from today on and drop those past retention."""
+        today = now().date()
+        created = await self.store.ensure_fire_log_partitions(today, self.partitions_ahead + 1)
+        dropped = 0
+        if self.retention_days > 0:
+            dropped = await self.store.prune_fire_log(today - timedelta(days=self.retention_days))
+        if created or dropped:
+            LOG.info("Fire log: %d partitions created, %d days dropped", len(created), dropped)
+        self._maintained = today
@@ -0,0 +1,173 @@
+"""
+Fire-load forecast: how many ScheduleDue events will fire per bucket
+(default one minute) over a horizon, in total and per `job_type`.
+
+The store streams pending jobs as (job_type, rrule, next_run_at, count)
+groups ordered by rule (`JobStore.fire_groups`).  Each distinct rule is
+expanded once over the window into per-bucket counts, and every group
+sharing it is added with its count as a weight.  Each group costs two
+bisects and a dictionary update, and each rule one pass over the buckets,
+so the number of jobs behind a rule does not matter.
+
+Model: a job fires at `max(next_run_at, start)` – overdue jobs fire once,
+right away – and then at every occurrence of its rule after `next_run_at`.
+
+Usage:
+    fc = await forecast(store, horizon=timedelta(hours=24))
+    fc.peak()          # (bucket start, fires)
+    fc.to_dict()
+"""
+from __future__ import annotations
+
+import logging
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from clock import now as clock_now
+from models import parse_rule
+
+LOG = logging.getLogger("scheduler.forecast")
+
+
+class Forecast:
+    def __init__(self, start: datetime, horizon: timedelta, bucket: timedelta = timedelta(minutes=1)):
+        self.bucket_s = int(bucket.total_seconds())
+        if self.bucket_s < 1:
+            raise ValueError("bucket must be at least one second")
+        # align to the epoch so one-shots bucketed by the store line up
+        ts = int(start.timestamp()) // self.bucket_s * self.bucket_s
+        self.start = datetime.fromtimestamp(ts, timezone.utc)
+        self.n = -(-int(horizon.total_seconds()) // self.bucket_s)
+        self.end = self.start + timedelta(seconds=self.n * self.bucket_s)
+        self.total: List[int] = [0] * self.n
+        self.by_type: Dict[str, List[int]] = {}
+        self.groups = 0
+        self.rules_expanded = 0
+        self.bad_rules = 0
+        # state for the rule currently being streamed
+        self._rule: Optional[str] = None
+        self._counts: Optional[List[int]] = None
+        self._occ = array("d")                  # occurrence timestamps of that rule
+        self._starts: Dict[str, Dict[int, int]] = {}
+
+    # ------------------------------------------------------------------
+    def _index(self, dt: datetime) -> int:
+        return int(dt.timestamp() - self.start.timestamp()) // self.bucket_s
+
+    def _hist(self, job_type: str) -> List[int]:
+        hist = self.by_type.get(job_type)
+        if hist is None:
+            hist = self.by_type[job_type] = [0] * self.n
+        return hist
+
+    def _bump(self, job_type: str, idx: int, count: int) -> None:
+        self.total[idx] += count
+        self._hist(job_type)[idx] += count
+
+    def add(self, job_type: str, rule: Optional[str], at: datetime, count: int) -> None:
+        """Add one group; groups sharing a rule should arrive consecutively."""
+        self.groups += 1
+        if at >= self.end:
+            return
+        self._bump(job_type, max(self._index(at), 0), count)      # the next fire
+        if rule is None:
+            return
+        if rule != self._rule:
+            self._flush()
+            self._expand(rule)
+        if self._counts is None:                                  # unparsable rule
+            return
+        if at < self.start:
+            self._starts[job_type][-1] += count
+            return
+        # occurrences after `at` inside its own bucket, then every later bucket
+        idx = self._index(at)
+        bucket_end = self.start.timestamp() + (idx + 1) * self.bucket_s
+        in_bucket = bisect_left(self._occ, bucket_end) - bisect_right(self._occ, at.timestamp())
+        self._bump(job_type, idx, count * in_bucket)
+        self._starts[job_type][idx] += count
+
+    def _expand(self, rule: str) -> None:
+        self._rule = rule
+        self._starts = defaultdict(lambda: defaultdict(int))
+        counts = [0] * self.n
+        occ = self._occ = array("d")
+        start_ts, step = self.start.timestamp(), self.bucket_s
+        try:
+            for dt in parse_rule(rule).xafter(self.start, inc=True):
+                if dt >= self.end:
+                    break
+                ts = dt.timestamp()
+                occ.append(ts)
+                counts[int(ts - start_ts) // step] += 1
+        except (ValueError, TypeError) as exc:
+            LOG.warning("Skipping unparsable rule %r: %s", rule, exc)
+            self.bad_rules += 1
+            self._counts = None
+            return
+        self.rules_expanded += 1
+        self._counts = counts
+
+    def _flush(self) -> None:
+        """Fold the current rule's groups into the histograms."""
+        counts = self._counts
+        if counts is None:
+            return
+        for job_type, starts in self._starts.items():
+            hist = self._hist(job_type)
+            running = starts.pop(-1, 0)
+            first = 0 if running else min(starts)
+            for b in range(first, self.n):
+                if running and counts[b]:
+                    fires = running * counts[b]
+                    hist[b] += fires
+                    self.total[b] += fires
+                running += starts.get(b, 0)
+        self._starts = {}
+        self._counts = None
+        self._occ = array("d")
+        self._rule = None
+
+    def finish(self) -> "Forecast":
+        self._flush()
+        return self
+
+    # ------------------------------------------------------------------
+    def bucket_starts(self) -> Iterator[datetime]:
+        step = timedelta(seconds=self.bucket_s)
+        return (self.start + i * step for i in range(self.n))
+
+    def peak(self) -> Tuple[datetime, int]:
+        idx = max(range(self.n), key=self.total.__getitem__)
+        return self.start + timedelta(seconds=idx * self.bucket_s), self.total[idx]
+
+    def to_dict(self) -> Dict:
+        peak_at, peak = self.peak() if self.n else (self.start, 0)
+        return {
+            "start": self.start.isoformat(),
+            "bucket_s": self.bucket_s,
+            "buckets": self.n,
+            "fires": sum(self.total),
+            "peak": {"at": peak_at.isoformat(), "fires": peak},
+            "total": self.total,
+            "by_type": self.by_type,
+            "stats": {"groups": self.groups, "rules_expanded": self.rules_expanded,
+                      "bad_rules": self.bad_rules},
+        }
+
+
+async def forecast(
+    store,
+    *,
+    horizon: timedelta = timedelta(hours=24),
+    bucket: timedelta = timedelta(minutes=1),
+    start: Optional[datetime] = None,
+) -> Forecast:
+    """Stream `store.fire_groups()` into a `Forecast`."""
+    fc = Forecast(start or clock_now(), horizon, bucket)
+    async for job_type, rule, at, count in store.fire_groups(until=fc.end, bucket_s=fc.bucket_s):
+        fc.add(job_type, rule, at, count)
+    return fc.finish()
@@ -4,10 +4,54 @@ import uuid
 from dataclasses import dataclass, field
 from datetime import datetime, timezone
 from enum import Enum
-from typing import Any, Dict, Optional
+from functools import lru_cache
+from typing import Annotated, Any, Dict, NamedTuple, Optional, Tuple, Union
 
 from dateutil.rrule import rrulestr, rruleset, rrule
 from dateutil.parser import isoparse
+from pydantic import BaseModel, BeforeValidator, ConfigDict, Field, ValidationError, model_validator
+
+from clock import now as clock_now
+from rrule import canonicalize
+
+
+@lru_cache(maxsize=4096)
+def parse_rule(text: str) -> rruleset:
+    """
+    Parsed rules are immutable for our purposes (`after()` does not mutate),
+    so identical RRULE strings share one parsed object.
+    """
+    return rrulestr(text, forceset=True)  # forceset handles RRULE+EXDATE
+
+
+class CompiledRule:
+    """
+    A parsed rule plus a one-entry memo of its last `after()` answer.
+
+    dateutil expands from DTSTART on every `after()` call.  If the previous
+    query was `lo` with answer `hi`, then for any `lo <= dt <= hi` the first
+    occurrence >= dt is still `hi` – so a burst of requests sharing a rule
+    pays for one expansion.  The answer is always identical to dateutil's.
+    """
+    __slots__ = ("rule", "_lo", "_hi")
+
+    def __init__(self, text: str):
+        self.rule = parse_rule(text)
+        self._lo: Optional[datetime] = None
+        self._hi: Optional[datetime] = None
+
+    def after(self, dt: datetime) -> Optional[datetime]:
+        lo, hi = self._lo, self._hi
+        if lo is not None and lo <= dt and (hi is None or dt <= hi):
+            return hi
+        hi = self.rule.after(dt, inc=True)
+        self._lo, self._hi = dt, hi
+        return hi
+
+
+@lru_cache(maxsize=4096)
+def compiled_rule(text: str) -> CompiledRule:
+    return CompiledRule(text)
 
 
 class JobStatus(str, Enum):
@@ -32,20 +76,40 @@ class ScheduleSpec:
     def next_after(self, now: datetime) -> Optional[datetime]:
         if self.at:
             return self.at if self.at > now else None
-        _rule = rrulestr(self.rrule, forceset=True)  # forceset handles RRULE+EXDATE
-        return _rule.after(now, inc=True)
+        return compiled_rule(self.rrule).after(now)
+
+
+def _evaluate_schedule(schedule: "RequestSchedule") -> Tuple[ScheduleSpec, datetime]:
+    """
+    Spec and first fire time of a validated request schedule.
+    Rules are stored in canonical form, so equivalent spellings share one
+    `schedule_rules` row and one parsed-rule cache entry.
+    """
+    try:
+        rule = schedule.rrule and canonicalize(schedule.rrule).text
+        spec = ScheduleSpec(at=schedule.at, rrule=rule)
+        next_time = spec.next_after(clock_now())
+    except (ValueError, TypeError) as exc:
+        # e.g. unparsable RRULE, or a naive DTSTART compared to aware now
+        raise RequestRejected("bad_rrule", str(exc)) from None
+    if next_time is None:
+        raise RequestRejected("in_past", "Schedule is already in the past")
+    return spec, next_time
 
 
 @dataclass(slots=True)
 class Job:
     id: uuid.UUID
     job_type: str
-    payload: Dict[str, Any]
+    payload: Optional[Dict[str, Any]]   # None on claimed rows until store.load_payloads()
     spec: ScheduleSpec
     next_run_at: datetime
     retries: int            = 0
     status: JobStatus       = JobStatus.PENDING
     created_at: datetime    = field(default_factory=lambda: datetime.now(timezone.utc))
+    tags: Dict[str, str]    = field(default_factory=dict)
+    trace_id: Optional[str] = None      # originating ScheduleRequest trace
+    version: int            = 0         # bumped by every applied ScheduleUpdate
 
     # ------------ Convenience ------------
     @property
@@ -55,33 +119,35 @@ class Job:
     @classmethod
     def from_request_event(cls, evt: Dict[str, Any]) -> "Job":
         """
-        Build a Job from the JSON of a ScheduleRequest event.
+        Build a Job from the decoded JSON of a ScheduleRequest event.
+        Raises RequestRejected (a ValueError) with a structured reason.
         Expects:
             {
               "id": "<uuid>",
               "job_type": "notification",
               "payload": {...},
-              "schedule": {"at": "..."} | {"rrule": "..."}
+              "schedule": {"at": "..."} | {"rrule": "..."},
+              "tags": {"user_id": "42", ...}          # optional
             }
         """
-        jid = uuid.UUID(evt["id"])
-        schedule = evt["schedule"]
-        spec = ScheduleSpec(
-            at=isoparse(schedule["at"]).astimezone(timezone.utc)
-                if "at" in schedule else None,
-            rrule=schedule.get("rrule"),
-        )
-        now = datetime.now(timezone.utc)
-        next_time = spec.next_after(now)
-        if next_time is None:
-            raise ValueError("Schedule is already in the past")
+        return cls.from_request(ScheduleRequest.from_event(evt))
+
+    @classmethod
+    def from_request_json(cls, raw: bytes | str) -> "Job":
+        """Same as `from_request_event`, validating straight from the AMQP body."""
+        return cls.from_request(ScheduleRequest.from_json(raw))
 
+    @classmethod
+    def from_request(cls, req: "ScheduleRequest") -> "Job":
+        """Turn an already validated request into a Job (evaluates the schedule)."""
+        spec, next_time = _evaluate_schedule(req.schedule)
         return cls(
-            id=jid,
-            job_type=evt["job_type"],
-            payload=evt.get("payload", {}),
+            id=req.id,
+            job_type=req.job_type,
+            payload=req.payload,
             spec=spec,
             next_run_at=next_time,
+            tags=req.tags,
         )
 
     def to_dict(self) -> Dict[str, Any]:
@@ -99,4 +165,226 @@ class Job:
             "status": self.status.value,
             "retries": self.retries,
             "created_at": self.created_at.isoformat(),
+            "tags": self.tags,
         }
+
+
+@dataclass(slots=True)
+class JobUpdate:
+    """
+    A validated partial update of a pending job.  Fields left as None are
+    not touched; `version` is the version the sender expects the row to be
+    at (None = apply whatever the current version is).
+    """
+    id: uuid.UUID
+    spec: Optional[ScheduleSpec]         = None
+    next_run_at: Optional[datetime]      = None   # set together with `spec`
+    payload: Optional[Dict[str, Any]]    = None
+    tags: Optional[Dict[str, str]]       = None
+    version: Optional[int]               = None
+
+    @classmethod
+    def from_update_event(cls, evt: Dict[str, Any]) -> "JobUpdate":
+        """
+        Build from the decoded JSON of a ScheduleUpdate event.
+        Raises RequestRejected (a ValueError) with a structured reason.
+        Expects:
+            {
+              "id": "<uuid>",
+              "schedule": {"at": "..."} | {"rrule": "..."},   # optional
+              "payload": {...},                               # optional
+              "tags": {...},                                  # optional
+              "version": 3                                    # optional
+            }
+        with at least one of schedule / payload / tags.
+        """
+        return cls.from_update(ScheduleUpdate.from_event(evt))
+
+    @classmethod
+    def from_update_json(cls, raw: bytes | str) -> "JobUpdate":
+        return cls.from_update(ScheduleUpdate.from_json(raw))
+
+    @classmethod
+    def from_update(cls, upd: "ScheduleUpdate") -> "JobUpdate":
+        spec = next_time = None
+        if upd.schedule is not None:
+            spec, next_time = _evaluate_schedule(upd.schedule)
+        return cls(id=upd.id, spec=spec, next_run_at=next_time, payload=upd.payload,
+                   tags=upd.tags, version=upd.version)
+
+
+class DueJob:
+    """
+    What the producer needs from a claimed row, without a full `Job`:
+    built by tuple-unpacking the claim query's row in column order
+    `(id, job_type, rrule, next_run_at, retries, trace_id, version)`.  The
+    `ScheduleSpec` is only created if something asks for `spec`.
+    """
+    __slots__ = ("id", "job_type", "rrule", "next_run_at", "retries", "trace_id",
+                 "version", "payload", "_spec")
+
+    def __init__(self, id: uuid.UUID, job_type: str, rrule: Optional[str],
+                 next_run_at: datetime, retries: int, trace_id: Optional[str] = None,
+                 version: int = 0, payload: Optional[Dict[str, Any]] = None):
+        self.id = id
+        self.job_type = job_type
+        self.rrule = rrule
+        self.next_run_at = next_run_at
+        self.retries = retries
+        self.trace_id = trace_id
+        self.version = version          # row version when claimed
+        self.payload = payload          # filled by store.load_payloads()
+        self._spec: Optional[ScheduleSpec] = None
+
+    @property
+    def is_recurring(self) -> bool:
+        return self.rrule is not None
+
+    @property
+    def spec(self) -> ScheduleSpec:
+        if self._spec is None:
+            self._spec = (ScheduleSpec(rrule=self.rrule) if self.rrule is not None
+                          else ScheduleSpec(at=self.next_run_at))
+        return self._spec
+
+    def next_after(self, dt: datetime) -> Optional[datetime]:
+        """`spec.next_after` for recurring rows, skipping the spec object."""
+        if self.rrule is None:
+            return self.next_run_at if self.next_run_at > dt else None
+        return compiled_rule(self.rrule).after(dt)
+
+    def __repr__(self) -> str:
+        return f"DueJob(id={self.id!s}, job_type={self.job_type!r}, next_run_at={self.next_run_at!s})"
+
+
+class FireRecord(NamedTuple):
+    """One published occurrence, in `job_fire_log` column order (COPY-ready)."""
+    fired_at: datetime
+    job_id: uuid.UUID
+    job_type: str
+    due_at: datetime
+    attempt: int
+
+
+def parse_tags(raw: Any) -> Dict[str, str]:
+    """
+    Tags / selectors are a flat object of scalar values; everything is stored
+    as a string so `{"user_id": 42}` and `{"user_id": "42"}` match each other.
+    """
+    if raw is None:
+        return {}
+    if not isinstance(raw, dict):
+        raise ValueError("'tags' must be an object")
+    tags = {}
+    for k, v in raw.items():
+        if isinstance(v, (dict, list)) or v is None:
+            raise ValueError(f"tag {k!r} must be a scalar")
+        tags[str(k)] = str(v)
+    return tags
+
+
+# ── Inbound ScheduleRequest validation ──────────────────────────────────────
+class RequestRejected(ValueError):
+    """A command that can never succeed; `reason` is a short metric-friendly code."""
+
+    def __init__(self, reason: str, detail: str = ""):
+        super().__init__(f"{reason}: {detail}" if detail else reason)
+        self.reason = reason
+        self.detail = detail
+
+    @classmethod
+    def from_validation_error(cls, exc: ValidationError) -> "RequestRejected":
+        err = exc.errors(include_url=False)[0]
+        loc = ".".join(str(p) for p in err["loc"])
+        if err["type"] == "json_invalid":
+            reason = "invalid_json"
+        elif err["type"] == "missing":
+            reason = "missing_field"
+        elif loc.startswith("schedule"):
+            reason = "bad_schedule"
+        else:
+            reason = "invalid_field"
+        return cls(reason, f"{loc}: {err['msg']}" if loc else err["msg"])
+
+
+def _parse_at(value: Any) -> Any:
+    """`datetime.fromisoformat` covers almost every sender; isoparse the rest."""
+    if isinstance(value, str):
+        try:
+            value = datetime.fromisoformat(value)
+        except ValueError:
+            value = isoparse(value)
+    if isinstance(value, datetime):
+        return value.astimezone(timezone.utc)
+    return value
+
+
+UTCDateTime = Annotated[datetime, BeforeValidator(_parse_at)]
+Tags = Annotated[Dict[str, str], BeforeValidator(parse_tags)]
+
+
+class RequestSchedule(BaseModel):
+    at: Optional[UTCDateTime] = None
+    rrule: Optional[str] = None
+
+    @model_validator(mode="after")
+    def _exactly_one(self) -> "RequestSchedule":
+        if (self.at is None) == (self.rrule is None):
+            raise ValueError("Must supply exactly one of 'at' or 'rrule'")
+        return self
+
+
+class ScheduleRequest(BaseModel):
+    """Wire format of a ScheduleRequest; validation runs in pydantic-core."""
+    model_config = ConfigDict(extra="ignore")
+
+    id: uuid.UUID
+    job_type: str
+    payload: Dict[str, Any] = Field(default_factory=dict)
+    schedule: RequestSchedule
+    tags: Tags = Field(default_factory=dict)
+
+    @classmethod
+    def from_json(cls, raw: Union[bytes, str]) -> "ScheduleRequest":
+        try:
+            return cls.model_validate_json(raw)
+        except ValidationError as exc:
+            raise RequestRejected.from_validation_error(exc) from None
+
+    @classmethod
+    def from_event(cls, evt: Any) -> "ScheduleRequest":
+        try:
+            return cls.model_validate(evt)
+        except ValidationError as exc:
+            raise RequestRejected.from_validation_error(exc) from None
+
+
+class ScheduleUpdate(BaseModel):
+    """Wire format of a ScheduleUpdate: a partial change to a pending job."""
+    model_config = ConfigDict(extra="ignore")
+
+    id: uuid.UUID
+    schedule: Optional[RequestSchedule] = None
+    payload: Optional[Dict[str, Any]] = None
+    tags: Optional[Tags] = None
+    version: Optional[int] = Field(default=None, ge=0)
+
+    @model_validator(mode="after")
+    def _changes_something(self) -> "ScheduleUpdate":
+        if self.schedule is None and self.payload is None and self.tags is None:
+            raise ValueError("Must supply at least one of 'schedule', 'payload' or 'tags'")
+        return self
+
+    @classmethod
+    def from_json(cls, raw: Union[bytes, str]) -> "ScheduleUpdate":
+        try:
+            return cls.model_validate_json(raw)
+        except ValidationError as exc:
+            raise RequestRejected.from_validation_error(exc) from None
+
+    @classmethod
+    def from_event(cls, evt: Any) -> "ScheduleUpdate":
+        try:
+            return cls.model_validate(evt)
+        except ValidationError as exc:
+            raise RequestRejected.from_validation_error(exc) from None
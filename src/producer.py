@@ -5,16 +5,23 @@ and reschedules or completes the job row.
 Environment variables:
     LOCK_BATCH      (optional)  max rows per SELECT ... SKIP LOCKED   [default 500]
     TICK_MS         (optional)  sleep time when no work (milliseconds) [default 500]
+    DRAIN_THRESHOLD (optional)  overdue rows that trigger drain mode   [default 50000]
 """
 from __future__ import annotations
 
 import asyncio
+import json
 import logging
 import os
 import signal
-from datetime import timedelta
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from time import perf_counter
+from typing import Dict, List, Optional
 
-# from prometheus_client import Counter, start_http_server
+from prometheus_client import Counter, Histogram, start_http_server
 
 from amqp import (
     AMQPConfig,
@@ -22,8 +29,15 @@ from amqp import (
     declare_topology,
     JSONPublisher,
 )
-from repo import JobRepo
-from models import Job
+import clock
+import profiling
+import runtime
+from breaker import OPEN, CircuitBreaker, backoff
+import tracing
+from drain import BacklogDrain
+from firelog import FireLog
+from store import JobStore, open_store
+from models import DueJob, FireRecord
 from clock import now
 from config import settings
 
@@ -38,37 +52,216 @@ logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(mess
 
 # start_http_server(int(os.getenv("METRICS_PORT", 8000)))
 
+JOB_FAILURES = Counter("producer_job_failures_total",
+                       "Jobs that raised while firing and were retried later with backoff")
+
+ENVELOPE_EVENTS = Histogram(
+    "due_envelope_events", "ScheduleDue events per coalesced envelope", ["job_type"],
+    buckets=(1, 2, 5, 10, 25, 50, 100, 250, 500, 1000),
+)
+ENVELOPE_FLUSHES = Counter("due_envelope_flushes_total", "Envelopes published, by what closed them",
+                           ["reason"])
+
+FIRE_LATENESS = Histogram(
+    "job_fire_lateness_seconds",
+    "fired_at − next_run_at, both on the authoritative clock (see clock.py)",
+    buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300),
+)
+
 # ────────────────────────────────────────────────────────────────────────────────
+class _Unpublished(Exception):
+    """The broker refused or dropped the publish; the row stays pending untouched."""
+
+
+class _Envelope:
+    """Serialised due events of one job type waiting to go out as one message."""
+    __slots__ = ("job_type", "ids", "bodies", "size", "opened")
+
+    def __init__(self, job_type: str):
+        self.job_type = job_type
+        self.ids: List[str] = []
+        self.bodies: List[bytes] = []
+        self.size = 0
+        self.opened = time.monotonic()
+
+    def add(self, job_id: str, body: bytes) -> None:
+        self.ids.append(job_id)
+        self.bodies.append(body)
+        self.size += len(body) + 1
+
+    def body(self, batch_id: str, fired_at: str) -> bytes:
+        # events are already JSON; splice them in instead of re-serialising
+        head = json.dumps({"batch_id": batch_id, "job_type": self.job_type,
+                           "fired_at": fired_at, "count": len(self.ids), "ids": self.ids})
+        return b"".join((head[:-1].encode(), b', "events": [', b",".join(self.bodies), b"]}"))
+
+
 class ProducerService:
     def __init__(
         self,
-        repo: JobRepo,
+        repo: JobStore,
         publisher: JSONPublisher,
         *,
+        cfg: AMQPConfig | None = None,
         lock_batch: int = 500,
         tick_ms: int = 500,
+        shutdown_timeout: float = 20.0,
+        batch_max: int = 200,
+        batch_max_bytes: int = 262_144,
+        batch_linger_ms: int = 50,
+        breaker: CircuitBreaker | None = None,
+        retry_base: float = 1.0,
+        retry_max: float = 300.0,
+        fire_log: FireLog | None = None,
+        failures_max: int = 10_000,
     ):
         self.repo = repo
         self.pub = publisher
+        self.cfg = cfg or AMQPConfig("")          # only used for due routing
         self.lock_batch = lock_batch
         self.tick_ms = tick_ms
+        self.shutdown_timeout = shutdown_timeout
+        # due events of cfg.due_batch_types are coalesced per claimed batch
+        self.batch_max = batch_max
+        self.batch_max_bytes = batch_max_bytes
+        self.batch_linger = batch_linger_ms / 1000
+        self._envelopes: Dict[str, _Envelope] = {}
+        self._unpublished: set = set()        # ids of members of envelopes that failed
+        # failure containment: broker breaker, per-job and per-batch backoff
+        self.breaker = breaker or CircuitBreaker("broker")
+        self.retry_base = retry_base
+        self.retry_max = retry_max
+        self._errors = 0                      # consecutive failed iterations of run()
+        # job id → consecutive failed fires; LRU-bounded, since a failing job
+        # may be cancelled or fired elsewhere without this producer seeing it
+        self._failures: "OrderedDict[object, int]" = OrderedDict()
+        self.failures_max = failures_max
+        self._batch_limit = lock_batch        # ramps back up after the breaker closes
+        # published fires of the current claim, handed to the fire log at its end
+        self.fire_log = fire_log
+        self._fired: List[FireRecord] = []
         self._stop_event = asyncio.Event()
+        self._stop_at: Optional[float] = None
+        self._task: Optional[asyncio.Task] = None
+        self._deadline: Optional[asyncio.TimerHandle] = None
+        self._deadline_hit = False
+        self.last_tick = time.monotonic()     # readiness: loop is making progress
+        self.phases = profiling.PhaseTimer("producer")
+        self.drain: Optional[BacklogDrain] = None
+        # claimed rows left for the next claim (unfired) / fired but not finalized
+        self.abandoned: Dict[str, int] = {"unfired": 0, "unfinalized": 0}
+
+    @property
+    def stopping(self) -> bool:
+        return self._stop_event.is_set()
 
     # -------------------------------------------------------------------------
-    async def _process_batch(self):
-        """Grab due rows, emit events, and reschedule / mark done."""
-        due_jobs = await self.repo.lock_due_jobs(limit=self.lock_batch)
+    async def _process_batch(self) -> int:
+        """Grab due rows, emit events, and reschedule / mark done; returns the count."""
+        t0 = perf_counter()
+        due_jobs = await self.repo.lock_due_jobs(limit=self._batch_limit)
+        self.phases.add("claim", perf_counter() - t0)
         if not due_jobs:
-            return False   # nothing processed
+            self.phases.flush()
+            return 0       # nothing processed
+
+        t0 = perf_counter()
+        await self.repo.load_payloads(due_jobs)
+        self.phases.add("load_payload", perf_counter() - t0)
+
+        with tracing.span("producer.process_batch", size=len(due_jobs)):
+            await self._fire_batch(due_jobs)
+        self.phases.flush()
+        if self.breaker.closed and self._batch_limit < self.lock_batch:
+            self._batch_limit = min(self._batch_limit * 2, self.lock_batch)
+        return len(due_jobs)
+
+    async def _fire_batch(self, due_jobs):
+        rescheduled, done = [], []
+        started = 0
+        try:
+            for job in due_jobs:
+                if self.stopping or not self.breaker.closed:
+                    break
+                started += 1
+                await self._fire_into(job, rescheduled, done)
+
+            # envelopes go out before any member row is finalized
+            await self._flush_envelopes(rescheduled, done)
+
+            # one round trip for the whole batch instead of one UPDATE per job
+            t0 = perf_counter()
+            stale = await self.repo.finalize_batch(rescheduled, done)
+            self.phases.add("finalize", perf_counter() - t0)
+        except asyncio.CancelledError:
+            # shutdown deadline: these may have been published and will fire again
+            self.abandoned["unfinalized"] += started
+            self._envelopes.clear()
+            raise
+        finally:
+            # a claim leaves the row untouched, so unfired jobs are simply
+            # still pending for the next producer
+            if self.stopping:
+                self.abandoned["unfired"] += len(due_jobs) - started
+        if stale:
+            LOG.info("%d fired jobs were updated meanwhile; kept their new schedule", stale)
 
-        for job in due_jobs:
-            await self._fire_job(job)
+    async def _fire_into(self, job: DueJob, rescheduled: List, done: List) -> None:
+        """
+        Fire one job and file it for finalize.  A failure stays with the job:
+        an unpublished one is left pending, one that raised is retried after
+        a jittered exponential backoff on its consecutive failures (kept in
+        memory; `retries` counts fired occurrences and is left alone).
+        """
+        try:
+            nxt = await self._fire_job(job)
+        except _Unpublished:
+            return
+        except Exception as exc:
+            failures = self._failures.pop(job.id, 0)
+            delay = backoff(failures, self.retry_base, self.retry_max)
+            self._failures[job.id] = failures + 1
+            if len(self._failures) > self.failures_max:
+                self._failures.popitem(last=False)
+            LOG.warning("Job %s failed %d times in a row (%s: %s); retry in %.1fs",
+                        job.id, failures + 1, type(exc).__name__, exc, delay)
+            JOB_FAILURES.inc()
+            rescheduled.append((job, now() + timedelta(seconds=delay)))
+            return
+        self._failures.pop(job.id, None)
+        if nxt:
+            rescheduled.append((job, nxt))
+        else:
+            done.append(job)
 
-        return True        # processed at least one job
+    async def _publish(self, rk: str, body: bytes, **kw) -> bool:
+        """Publish through the breaker; False if the broker failed."""
+        try:
+            await self.pub.publish_body(rk, body, **kw)
+        except asyncio.CancelledError:
+            raise
+        except Exception as exc:
+            self.breaker.failure(exc)
+            return False
+        self.breaker.success()
+        return True
 
-    async def _fire_job(self, job: Job):
-        """Publish ScheduleDue and update DB row accordingly."""
+    async def _fire_job(self, job: DueJob) -> Optional[datetime]:
+        """
+        Publish ScheduleDue and work out what happens to the row next.
+        Returns the next occurrence for a live series, None when finished.
+        The span joins the trace of the ScheduleRequest that created the job.
+        """
+        with tracing.span("producer.fire_job", trace_id=job.trace_id, job_id=str(job.id)) as sp:
+            return await self._fire(job, sp)
+
+    async def _fire(self, job: DueJob, sp) -> Optional[datetime]:
+        phases = self.phases
+        t0 = perf_counter()
         fired_at = now()
+        lateness = (fired_at - job.next_run_at).total_seconds()
+        FIRE_LATENESS.observe(max(lateness, 0.0))
+        sp.set_attribute("lateness_ms", lateness * 1000)
         event = {
             "id": str(job.id),
             "job_type": job.job_type,
@@ -76,67 +269,254 @@ class ProducerService:
             "fired_at": fired_at.isoformat(),
             "attempt": job.retries + 1,
         }
+        body = json.dumps(event).encode()
+        t1 = perf_counter()
+        phases.add("serialize", t1 - t0)
 
-        await self.pub.publish("due", event)
+        if job.job_type in self.cfg.due_batch_types:
+            await self._coalesce(job.job_type, event["id"], body)
+        else:
+            if not await self._publish(self.cfg.due_routing_key(job.job_type), body,
+                                       message_id=event["id"]):
+                raise _Unpublished()
+        t2 = perf_counter()
+        phases.add("publish", t2 - t1)
+        if self.fire_log is not None:
+            self._fired.append(FireRecord(fired_at, job.id, job.job_type, job.next_run_at,
+                                          event["attempt"]))
 
         # ── Reschedule or finish ────────────────────────────────────────────
         if job.is_recurring:
-            nxt = job.spec.next_after(job.next_run_at + timedelta(microseconds=1))
+            nxt = job.next_after(job.next_run_at + timedelta(microseconds=1))
+            phases.add("rule_eval", perf_counter() - t2)
             if nxt:
                 job.retries += 1
-                await self.repo.reschedule(job, nxt)
                 LOG.info("Rescheduled %s → next %s", job.id, nxt.isoformat())
-            else:
-                await self.repo.mark_done(job.id)
-                LOG.info("Series finished %s", job.id)
+                return nxt
+            LOG.info("Series finished %s", job.id)
         else:
-            await self.repo.mark_done(job.id)
             LOG.info("Done one-shot %s", job.id)
+        return None
+
+    # ---------- Coalesced envelopes ------------------------------------------
+    async def _coalesce(self, job_type: str, job_id: str, body: bytes) -> None:
+        """Add an event to its type's envelope; publish envelopes that are full or too old."""
+        env = self._envelopes.get(job_type)
+        if env is not None and env.size + len(body) > self.batch_max_bytes:
+            await self._publish_envelope(env, "bytes")
+            env = None
+        if env is None:
+            env = self._envelopes[job_type] = _Envelope(job_type)
+        env.add(job_id, body)
+        if len(env.ids) >= self.batch_max:
+            await self._publish_envelope(env, "count")
+        if self.batch_linger and self._envelopes:
+            oldest = time.monotonic() - self.batch_linger
+            for env in [e for e in self._envelopes.values() if e.opened <= oldest]:
+                await self._publish_envelope(env, "linger")
+
+    async def _flush_envelopes(self, rescheduled: List, done: List) -> None:
+        """
+        End of a claimed batch: nothing is held across claims.  Members of
+        envelopes that failed are taken out of `rescheduled` / `done`, so
+        their rows stay pending; the rest go to the fire log.
+        """
+        for env in list(self._envelopes.values()):
+            await self._publish_envelope(env, "batch_end")
+        if self._unpublished:
+            lost = self._unpublished
+            rescheduled[:] = [(j, n) for j, n in rescheduled if str(j.id) not in lost]
+            done[:] = [j for j in done if str(j.id) not in lost]
+            self._fired = [r for r in self._fired if str(r.job_id) not in lost]
+            self._unpublished = set()
+        if self._fired:
+            fired, self._fired = self._fired, []
+            await self.fire_log.add(fired)
+
+    async def _publish_envelope(self, env: _Envelope, reason: str) -> None:
+        del self._envelopes[env.job_type]
+        batch_id = uuid.uuid4().hex
+        if not await self._publish(self.cfg.due_batch_routing_key(env.job_type),
+                                   env.body(batch_id, now().isoformat()),
+                                   headers={"x-due-count": len(env.ids)}, message_id=batch_id):
+            self._unpublished.update(env.ids)
+            return
+        ENVELOPE_EVENTS.labels(env.job_type).observe(len(env.ids))
+        ENVELOPE_FLUSHES.labels(reason).inc()
+
+    async def _idle_sleep(self):
+        """Sleep one tick, or less if the next job is due sooner."""
+        delay = self.tick_ms / 1000
+        nxt = await self.repo.earliest_due()
+        if nxt is not None:
+            delay = min(delay, max((nxt - now()).total_seconds(), 0))
+        await self._pause(delay)
+
+    async def _pause(self, seconds: float):
+        try:    # wake up early on stop()
+            await asyncio.wait_for(self._stop_event.wait(), seconds)
+        except asyncio.TimeoutError:
+            pass
+
+    async def _await_broker(self):
+        """
+        Breaker open: claim nothing, wait out the cool-down, then spend the
+        half-open trial on a cheap probe instead of a batch of real jobs.
+        Once closed, claims restart at 1/8 of `lock_batch` and double per batch.
+        """
+        while not self.stopping and not self.breaker.closed:
+            wait = self.breaker.retry_in()
+            if wait:
+                await self._pause(wait)
+                continue
+            try:
+                await self.pub.probe()
+            except Exception as exc:
+                self.breaker.failure(exc)
+                continue
+            self.breaker.success()
+            self._batch_limit = max(self.lock_batch // 8, 1)
+            self.last_tick = time.monotonic()
 
     # -------------------------------------------------------------------------
     async def run(self):
-        """Main loop until stop requested."""
+        """
+        Main loop until stop requested.  On stop the job being published
+        finishes (confirm included), the rest of the batch is released
+        unfired and the fired part finalized.  If that takes longer than
+        `shutdown_timeout` the loop is cancelled where it stands.
+        """
         LOG.info("Producer started (batch=%d, tick=%d ms)", self.lock_batch, self.tick_ms)
-
-        while not self._stop_event.is_set():
-            worked = await self._process_batch()
-            if not worked:
-                await asyncio.sleep(self.tick_ms / 1000)
+        self._task = asyncio.current_task()
+        try:
+            while not self._stop_event.is_set():
+                if not self.breaker.closed:
+                    await self._await_broker()
+                    continue
+                try:
+                    await self._iteration()
+                except Exception as exc:    # claim / finalize / probes: retried next round
+                    delay = backoff(self._errors, self.retry_base, self.retry_max)
+                    self._errors += 1
+                    LOG.exception("Producer iteration failed (%d in a row); retry in %.1fs",
+                                  self._errors, delay)
+                    await self._pause(delay)
+                    continue
+                self._errors = 0
+        except asyncio.CancelledError:
+            if not self._deadline_hit:
+                raise
+            self._task.uncancel()
+            LOG.warning("Shutdown deadline of %.0fs hit; in-flight batch abandoned",
+                        self.shutdown_timeout)
+        finally:
+            if self._deadline is not None:
+                self._deadline.cancel()
 
         LOG.info("Producer stopping…")
+        if self._stop_at is not None:
+            runtime.report_shutdown("producer", time.monotonic() - self._stop_at, self.abandoned)
+
+    async def _iteration(self) -> None:
+        """One claim/fire/finalize round, then idle sleep or a backlog drain."""
+        worked = await self._process_batch()
+        self.last_tick = time.monotonic()
+        if not worked:
+            await self._idle_sleep()
+        elif (worked == self.lock_batch and self.drain is not None
+              and await self.drain.should_drain()):
+            await self.drain.run()
 
     def stop(self):
+        if self._stop_event.is_set():
+            return
+        self._stop_at = time.monotonic()
         self._stop_event.set()
+        if self._task is not None and not self._task.done():
+            self._deadline = asyncio.get_running_loop().call_later(
+                self.shutdown_timeout, self._hit_deadline)
+
+    def _hit_deadline(self):
+        self._deadline_hit = True
+        self._task.cancel()
 
 
 # ────────────────────────────────────────────────────────────────────────────────
+async def _phases_route(svc: ProducerService):
+    """Cumulative seconds per phase since start (cheap, no Prometheus needed)."""
+    return 200, {k: round(v, 6) for k, v in svc.phases.totals.items()}
+
+
 async def main():
     # 1) Config ----------------------------------------------------------------
-    pg_dsn     = settings.PG_DSN
-    rabbit_url = settings.RABBIT_URL
     lock_batch = settings.LOCK_BATCH
     tick_ms    = settings.TICK_MS
 
-    cfg = AMQPConfig(rabbit_url)
+    cfg = AMQPConfig.from_settings(settings)
+    tracing.configure(settings)
 
-    # 2) Postgres --------------------------------------------------------------
-    repo = await JobRepo.create(pg_dsn, min_size=2, max_size=10)
+    # 2) Job store -------------------------------------------------------------
+    roles = ("claim", "finalize", "firelog") if settings.FIRE_LOG_ENABLED else ("claim", "finalize")
+    repo = await open_store(settings, roles=roles)
+    db_clock = await clock.configure(settings, repo)
+    fire_log = None
+    if settings.FIRE_LOG_ENABLED:
+        fire_log = FireLog(repo, capacity=settings.FIRE_LOG_BUFFER,
+                           flush_rows=settings.FIRE_LOG_FLUSH_ROWS,
+                           flush_interval=settings.FIRE_LOG_FLUSH_MS / 1000,
+                           on_full=settings.FIRE_LOG_ON_FULL,
+                           retention_days=settings.FIRE_LOG_RETENTION_DAYS,
+                           partitions_ahead=settings.FIRE_LOG_PARTITIONS_AHEAD)
+        await fire_log.start()
 
     # 3) RabbitMQ publisher ----------------------------------------------------
     async with open_connection(cfg) as conn:
         await declare_topology(conn, cfg)
 
         pub_ch = await conn.channel(publisher_confirms=True)
-        publisher = JSONPublisher(pub_ch, cfg.evt_ex)
+        publisher = JSONPublisher(pub_ch, cfg.evt_ex,
+                                  compress_min_bytes=settings.AMQP_COMPRESS_MIN_BYTES,
+                                  compression=settings.COMPRESSION)
         await publisher.init()
 
         # 4) Service -----------------------------------------------------------
         svc = ProducerService(
             repo,
             publisher,
+            cfg=cfg,
             lock_batch=lock_batch,
             tick_ms=tick_ms,
+            shutdown_timeout=settings.SHUTDOWN_TIMEOUT_S,
+            batch_max=settings.DUE_BATCH_MAX,
+            batch_max_bytes=settings.DUE_BATCH_MAX_BYTES,
+            batch_linger_ms=settings.DUE_BATCH_LINGER_MS,
+            breaker=CircuitBreaker("broker", failure_threshold=settings.BREAKER_FAILURES,
+                                   reset_timeout=settings.BREAKER_RESET_S,
+                                   max_reset_timeout=settings.BREAKER_MAX_RESET_S),
+            retry_base=settings.RETRY_BASE_S,
+            retry_max=settings.RETRY_MAX_S,
+            fire_log=fire_log,
         )
+        svc.drain = BacklogDrain(
+            svc,
+            threshold=settings.DRAIN_THRESHOLD,
+            batch=settings.DRAIN_BATCH,
+            depth=settings.DRAIN_QUEUE_DEPTH,
+            rate=settings.DRAIN_RATE,
+            count_cap=settings.DRAIN_COUNT_CAP,
+        )
+
+        start_http_server(settings.METRICS_PORT)
+        health = await runtime.start_runtime(settings)
+        profiling.install("producer", settings, health)
+        if settings.DEBUG_ROUTES:
+            health.add_route("/debug/phases", lambda q: _phases_route(svc))
+        max_age = settings.READY_MAX_TICK_AGE_S
+        health.add_check("db", repo.ping)
+        health.add_check("amqp", lambda: not conn.is_closed)
+        health.add_check("tick", lambda: time.monotonic() - svc.last_tick < max_age)
+        health.add_check("accepting", lambda: not svc.stopping)
+        health.add_check("broker_breaker", lambda: svc.breaker.state != OPEN)
 
         loop = asyncio.get_running_loop()
         for sig in (signal.SIGINT, signal.SIGTERM):
@@ -145,7 +525,13 @@ async def main():
         try:
             await svc.run()
         finally:
+            await health.stop()
             await pub_ch.close()
+            if fire_log is not None:
+                await fire_log.close(settings.SHUTDOWN_TIMEOUT_S / 2)
+            if db_clock is not None:
+                db_clock.stop()
+            await repo.close()
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    runtime.run(main(), use_uvloop=settings.USE_UVLOOP)
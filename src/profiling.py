@@ -0,0 +1,190 @@
+"""
+On-demand profiling of a running consumer / producer, plus always-on
+per-phase timers.
+
+Triggers (no restart needed):
+    kill -USR1 <pid>                     sampling profile, PROFILE_SECONDS
+    kill -USR2 <pid>                     cProfile of the event-loop thread
+    GET :HEALTH_PORT/debug/profile?mode=sample|cprofile|tracemalloc&seconds=N
+                                         (only with DEBUG_ROUTES; N ≤ PROFILE_MAX_SECONDS)
+
+Outputs land in PROFILE_DIR:
+    *.collapsed   – folded stacks ("a;b;c 42"), feed to flamegraph.pl / speedscope
+    *.pstats      – `python -m pstats file` or snakeviz
+    *.tracemalloc – `tracemalloc.Snapshot.load(file)`
+"""
+from __future__ import annotations
+
+import asyncio
+import cProfile
+import logging
+import math
+import os
+import signal
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter as Tally, defaultdict
+from typing import Dict, Optional
+
+from prometheus_client import Counter
+
+LOG = logging.getLogger("scheduler.profiling")
+
+PHASE_SECONDS = Counter("phase_seconds_total", "Wall time spent per processing phase",
+                        ["component", "phase"])
+
+
+# ── Always-on phase timers ──────────────────────────────────────────────────
+class PhaseTimer:
+    """
+    Accumulates `perf_counter` deltas in a plain dict; `flush()` pushes them
+    to Prometheus once per batch, so per-job cost is a dict add.
+    """
+    __slots__ = ("component", "_acc", "totals")
+
+    def __init__(self, component: str):
+        self.component = component
+        self._acc: Dict[str, float] = defaultdict(float)
+        self.totals: Dict[str, float] = defaultdict(float)
+
+    def add(self, phase: str, seconds: float) -> None:
+        self._acc[phase] += seconds
+
+    def flush(self) -> None:
+        for phase, secs in self._acc.items():
+            PHASE_SECONDS.labels(self.component, phase).inc(secs)
+            self.totals[phase] += secs
+        self._acc.clear()
+
+
+# ── Profilers ───────────────────────────────────────────────────────────────
+def _collapse(frame) -> str:
+    parts = []
+    while frame is not None:
+        code = frame.f_code
+        parts.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+        frame = frame.f_back
+    return ";".join(reversed(parts))
+
+
+class Profiler:
+    """One profile at a time per process; results are written off the loop."""
+
+    def __init__(self, name: str, out_dir: str, *, default_seconds: float = 10,
+                 max_seconds: float = 300, hz: int = 100):
+        self.name = name
+        self.out_dir = out_dir
+        self.default_seconds = default_seconds
+        self.max_seconds = max_seconds
+        self.hz = hz
+        self._busy = False
+        self._loop_thread_id = threading.get_ident()
+
+    def _path(self, ext: str) -> str:
+        os.makedirs(self.out_dir, exist_ok=True)
+        stamp = time.strftime("%Y%m%dT%H%M%S")
+        return os.path.join(self.out_dir, f"{self.name}-{os.getpid()}-{stamp}.{ext}")
+
+    def start(self, mode: str, seconds: Optional[float] = None) -> Optional[str]:
+        """Kick off a profile in the background; returns the output path."""
+        if mode not in ("sample", "cprofile", "tracemalloc"):
+            raise ValueError(f"Unknown profile mode {mode!r}")
+        if self._busy:
+            LOG.warning("Profile already running; ignoring %s request", mode)
+            return None
+        seconds = seconds or self.default_seconds
+        self._busy = True           # before the worker starts: it may finish first
+        try:
+            if mode == "sample":
+                path = self._path("collapsed")
+                threading.Thread(target=self._sample, args=(path, seconds),
+                                 name="profiler", daemon=True).start()
+            elif mode == "cprofile":
+                path = self._path("pstats")
+                asyncio.get_running_loop().create_task(self._cprofile(path, seconds))
+            else:
+                path = self._path("tracemalloc")
+                asyncio.get_running_loop().create_task(self._tracemalloc(path, seconds))
+        except BaseException:
+            self._busy = False
+            raise
+        LOG.info("Profiling (%s) for %.0fs → %s", mode, seconds, path)
+        return path
+
+    def _done(self, path: str) -> None:
+        self._busy = False
+        LOG.info("Profile written to %s", path)
+
+    def _sample(self, path: str, seconds: float) -> None:
+        """Statistical sampler: walk the loop thread's stack `hz` times a second."""
+        stacks: Tally[str] = Tally()
+        interval = 1 / self.hz
+        deadline = time.monotonic() + seconds
+        try:
+            while time.monotonic() < deadline:
+                frame = sys._current_frames().get(self._loop_thread_id)
+                if frame is not None:
+                    stacks[_collapse(frame)] += 1
+                time.sleep(interval)
+            with open(path, "w") as fh:
+                for stack, n in stacks.most_common():
+                    fh.write(f"{stack} {n}\n")
+        finally:
+            self._done(path)
+
+    async def _cprofile(self, path: str, seconds: float) -> None:
+        # cProfile only sees the thread that enables it – this runs on the loop
+        prof = cProfile.Profile()
+        prof.enable()
+        try:
+            await asyncio.sleep(seconds)
+        finally:
+            prof.disable()
+            await asyncio.to_thread(prof.dump_stats, path)
+            self._done(path)
+
+    async def _tracemalloc(self, path: str, seconds: float) -> None:
+        started = not tracemalloc.is_tracing()
+        if started:
+            tracemalloc.start(25)
+        try:
+            try:
+                await asyncio.sleep(seconds)
+                snapshot = tracemalloc.take_snapshot()
+            finally:
+                if started:
+                    tracemalloc.stop()
+            await asyncio.to_thread(snapshot.dump, path)
+        finally:
+            self._done(path)
+
+    async def http_route(self, query: Dict[str, str]):
+        """Handler for HealthServer's /debug/profile route."""
+        try:
+            seconds = float(query.get("seconds", self.default_seconds))
+            if not math.isfinite(seconds):
+                raise ValueError("seconds must be a finite number")
+            seconds = min(max(seconds, 1.0), self.max_seconds)
+            path = self.start(query.get("mode", "sample"), seconds)
+        except ValueError as exc:
+            return 400, {"error": str(exc)}
+        if path is None:
+            return 409, {"error": "profile already running"}
+        return 202, {"path": path, "seconds": seconds}
+
+
+def install(name: str, settings, health=None) -> Profiler:
+    """
+    Wire SIGUSR1/SIGUSR2, and /debug/profile when `health` is given and
+    DEBUG_ROUTES is on (the health port has no authentication).
+    """
+    prof = Profiler(name, settings.PROFILE_DIR, default_seconds=settings.PROFILE_SECONDS,
+                    max_seconds=settings.PROFILE_MAX_SECONDS)
+    loop = asyncio.get_running_loop()
+    loop.add_signal_handler(signal.SIGUSR1, prof.start, "sample")
+    loop.add_signal_handler(signal.SIGUSR2, prof.start, "cprofile")
+    if health is not None and settings.DEBUG_ROUTES:
+        health.add_route("/debug/profile", prof.http_route)
+    return prof
@@ -2,95 +2,608 @@ from __future__ import annotations
 
 import asyncpg
 import uuid
-from datetime import datetime, timezone
-from typing import List, Sequence
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta
+from functools import partial
+from time import perf_counter
+from typing import Any, AsyncIterator, Dict, Iterable, List, Mapping, Optional, Sequence, Set, Tuple
 import json
 
-from models import Job, JobStatus, ScheduleSpec
+from prometheus_client import Gauge, Histogram
+
+import codec
+import tracing
+from clock import now as clock_now
+from models import DueJob, FireRecord, Job, JobUpdate
+from rrule import CanonicalRule, canonicalize
+
+# Recurring rows reference schedule_rules via rule_id; rows written before
+# migration 0006 (or with a rule that does not canonicalise) keep it inline.
+RULE_JOIN = "LEFT JOIN schedule_rules r ON r.id = j.rule_id"
+RULE_TEXT = "COALESCE(r.rule, j.rrule)"
+RULE_CACHE_MAX = 100_000
+
+# Each workload gets its own pool, so claims never queue behind a burst of
+# ingest or finalize traffic, and each role has its own statement_timeout.
+# "firelog" is the producer's fire-log writer (see firelog.py).
+ROLES = ("claim", "finalize", "ingest", "firelog")
+
+POOL_WAIT = Histogram("db_pool_wait_seconds", "Time spent waiting for a pooled connection", ["role"],
+                      buckets=(.0005, .001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5))
+POOL_IN_USE = Gauge("db_pool_in_use", "Connections currently checked out", ["role"])
+POOL_SIZE = Gauge("db_pool_size", "Open connections", ["role"])
+STATEMENT_SECONDS = Histogram("db_statement_seconds", "Latency of registry statements", ["statement"],
+                              buckets=(.0005, .001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 5))
+
+_CLAIM = f"""
+SELECT j.id, j.job_type, {RULE_TEXT} AS rrule, j.next_run_at,
+       j.retries, j.trace_id, j.version
+FROM   jobs j {RULE_JOIN}
+WHERE  j.status = 'pending'
+  AND  j.next_run_at <= $1
+  {{keyset}}
+ORDER  BY j.next_run_at, j.id
+LIMIT  $2
+FOR UPDATE OF j SKIP LOCKED;
+"""
+
+_INSERT_COLUMNS = """
+INSERT INTO jobs (id, job_type, payload, rrule, next_run_at, created_at, tags, trace_id,
+                  payload_z, payload_encoding, rule_id, status)
+"""
+
+# Hot statements: name → (role, SQL).  Every connection of a role prepares
+# its statements once when the pool opens it (`_prepare`); methods run them
+# by name, which also feeds `db_statement_seconds`.
+STATEMENTS: Dict[str, Tuple[str, str]] = {
+    "claim": ("claim", _CLAIM.format(keyset="")),
+    "claim_after": ("claim", _CLAIM.format(keyset="AND  (j.next_run_at, j.id) > ($3, $4)")),
+    "count_overdue": ("claim", """
+        SELECT count(*) FROM (
+            SELECT 1 FROM jobs
+            WHERE  status = 'pending' AND next_run_at <= $1
+            LIMIT  $2
+        ) overdue;
+        """),
+    "earliest_due": ("claim", "SELECT min(next_run_at) FROM jobs WHERE status = 'pending';"),
+    "load_payloads": ("claim", """
+        SELECT id, payload, payload_z, payload_encoding
+        FROM   jobs
+        WHERE  id = ANY($1::uuid[]);
+        """),
+    # guarded on the claimed next_run_at: only a schedule change supersedes
+    # a fire, payload / tags updates do not
+    "finalize_reschedule": ("finalize", """
+        UPDATE jobs AS j
+        SET    next_run_at = u.next_run_at,
+               retries     = u.retries
+        FROM   unnest($1::uuid[], $2::timestamptz[], $3::int[], $4::timestamptz[])
+                 AS u(id, next_run_at, retries, claimed_at)
+        WHERE  j.id = u.id AND j.next_run_at = u.claimed_at;
+        """),
+    "finalize_done": ("finalize", """
+        UPDATE jobs AS j
+        SET    status = 'done'
+        FROM   unnest($1::uuid[], $2::timestamptz[]) AS u(id, claimed_at)
+        WHERE  j.id = u.id AND j.next_run_at = u.claimed_at;
+        """),
+    # a request whose cancel overtook it (tombstone, see consumer) lands cancelled
+    "insert_job": ("ingest", _INSERT_COLUMNS + """
+        VALUES ($1,$2,$3,$4,$5,$6,$7,$8,$9,$10,$11,
+                CASE WHEN EXISTS (SELECT 1 FROM delay_tombstones t WHERE t.id = $1)
+                     THEN 'cancelled'::job_status ELSE 'pending'::job_status END)
+        ON CONFLICT (id) DO NOTHING;
+        """),
+    "insert_jobs": ("ingest", _INSERT_COLUMNS + """
+        SELECT u.*, CASE WHEN t.id IS NULL THEN 'pending'::job_status
+                         ELSE 'cancelled'::job_status END
+        FROM unnest(
+            $1::uuid[], $2::text[], $3::jsonb[], $4::text[],
+            $5::timestamptz[], $6::timestamptz[], $7::jsonb[], $8::text[],
+            $9::bytea[], $10::text[], $11::bigint[]
+        ) AS u(id, job_type, payload, rrule, next_run_at, created_at, tags, trace_id,
+               payload_z, payload_encoding, rule_id)
+        LEFT JOIN delay_tombstones t ON t.id = u.id
+        ON CONFLICT (id) DO NOTHING
+        RETURNING id;
+        """),
+    "fire_log_partitions": ("firelog", """
+        SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE  i.inhparent = 'job_fire_log'::regclass;
+        """),
+}
+
+FIRE_LOG_PREFIX = "job_fire_log_"
+
+
+def fire_log_partition(day: date) -> str:
+    """Name of the `job_fire_log` partition holding `day` (UTC)."""
+    return f"{FIRE_LOG_PREFIX}{day:%Y%m%d}"
+
+
+@dataclass(frozen=True)
+class PoolSpec:
+    """Sizing of one role's pool; `statement_timeout_ms` 0 = server default."""
+    min_size: int = 1
+    max_size: int = 10
+    statement_timeout_ms: int = 0
+
+    @classmethod
+    def from_settings(cls, settings, role: str) -> "PoolSpec":
+        prefix = f"PG_{role.upper()}_"
+        return cls(getattr(settings, prefix + "POOL_MIN"), getattr(settings, prefix + "POOL_MAX"),
+                   getattr(settings, prefix + "TIMEOUT_MS"))
+
+
+class _Connection(asyncpg.Connection):
+    """Connection carrying its role's prepared statements."""
+    __slots__ = ("stmts",)
+
+
+async def _prepare(conn: _Connection, *, role: str) -> None:
+    """Pool `init` hook: prepare the role's registry statements once per connection."""
+    conn.stmts = {name: await conn.prepare(sql)
+                  for name, (r, sql) in STATEMENTS.items() if r == role}
+
+
+async def _run(conn, name: str, method: str, *args) -> Any:
+    stmt = conn.stmts[name]
+    t0 = perf_counter()
+    try:
+        return await getattr(stmt, method)(*args)
+    finally:
+        STATEMENT_SECONDS.labels(name).observe(perf_counter() - t0)
+
+
+async def _execute(conn, name: str, *args) -> int:
+    """Run a registry DML statement; returns the affected row count."""
+    await _run(conn, name, "fetch", *args)
+    return int(conn.stmts[name].get_statusmsg().split()[-1])
+
+
+def encode_payload(
+    payload, min_bytes: int, encoding: str
+) -> Tuple[Optional[str], Optional[bytes], Optional[str]]:
+    """(payload, payload_z, payload_encoding) – exactly one of the first two is set."""
+    raw = json.dumps(payload)
+    packed, enc = codec.maybe_compress(raw.encode(), min_bytes, encoding)
+    return (None, packed, enc) if enc else (raw, None, None)
+
+
+def decode_payload(row):
+    """Inverse of `encode_payload` for a row with payload / payload_z / payload_encoding."""
+    if row["payload_z"] is not None:
+        return json.loads(codec.decompress(row["payload_z"], row["payload_encoding"]))
+    return json.loads(row["payload"])
+
+
+async def intern_rules(conn, texts: Iterable[Optional[str]], cache: Dict[str, int]) -> Dict[str, int]:
+    """
+    Map rule texts to `schedule_rules.id`, inserting unseen canonical rules.
+    `cache` persists across calls (rules are immutable); texts that fail to
+    canonicalise are simply absent from the result and stay inline.
+    """
+    canon: Dict[str, CanonicalRule] = {}
+    for t in set(texts):
+        if t and t not in cache:
+            try:
+                canon[t] = canonicalize(t)
+            except ValueError:
+                pass
+    if canon:
+        metas = {c.text: c for c in canon.values()}
+        await conn.execute(
+            """
+            INSERT INTO schedule_rules (rule, tz, freq, bounded)
+            SELECT * FROM unnest($1::text[], $2::text[], $3::text[], $4::bool[])
+            ON CONFLICT (rule) DO NOTHING;
+            """,
+            list(metas), [m.tz for m in metas.values()],
+            [m.freq for m in metas.values()], [m.bounded for m in metas.values()],
+        )
+        rows = await conn.fetch("SELECT id, rule FROM schedule_rules WHERE rule = ANY($1::text[]);",
+                                list(metas))
+        ids = {r["rule"]: r["id"] for r in rows}
+        if len(cache) + len(canon) > RULE_CACHE_MAX:
+            cache.clear()
+        cache.update({t: ids[c.text] for t, c in canon.items()})
+    return cache
 
 
 class JobRepo:
-    """Thin asyncpg pool wrapper"""
-    def __init__(self, pool: asyncpg.Pool):
-        self._pool = pool
+    """
+    asyncpg wrapper over one pool per role (`ROLES`): claim (producer reads),
+    finalize (producer writes), ingest (consumer, cancels, reports) and
+    firelog (producer's fire-log flushes and partition upkeep).
+    A service only opens the roles it uses; a method of a missing role
+    raises LookupError.
+    """
+    def __init__(self, pools: Mapping[str, asyncpg.Pool], *, compress_min_bytes: int = 0,
+                 compression: str = "auto"):
+        if not pools:
+            raise ValueError("JobRepo needs at least one pool")
+        self._pools = dict(pools)
+        self._pool = next(iter(self._pools.values()))     # ad-hoc admin statements
+        self._compress_min = compress_min_bytes
+        self._compression = codec.preferred(compression)
+        self._rule_ids: Dict[str, int] = {}
+        for role, pool in self._pools.items():
+            POOL_SIZE.labels(role).set_function(pool.get_size)
+            POOL_IN_USE.labels(role).set_function(
+                lambda pool=pool: pool.get_size() - pool.get_idle_size())
 
     @classmethod
-    async def create(cls, dsn: str, *, min_size=1, max_size=10) -> "JobRepo":
-        """Factory"""
-        pool = await asyncpg.create_pool(dsn, min_size=min_size, max_size=max_size)
-        return cls(pool)
+    async def create(
+        cls, dsn: str, *, pools: Mapping[str, PoolSpec] | None = None, **kw
+    ) -> "JobRepo":
+        """Factory: opens one pool per role in `pools` (default: every role, default sizing)."""
+        specs = pools if pools is not None else {role: PoolSpec() for role in ROLES}
+        opened: Dict[str, asyncpg.Pool] = {}
+        try:
+            for role, spec in specs.items():
+                if role not in ROLES:
+                    raise ValueError(f"Unknown pool role {role!r}")
+                settings = ({"statement_timeout": str(spec.statement_timeout_ms)}
+                            if spec.statement_timeout_ms else None)
+                opened[role] = await asyncpg.create_pool(
+                    dsn, min_size=spec.min_size, max_size=spec.max_size,
+                    connection_class=_Connection, init=partial(_prepare, role=role),
+                    server_settings=settings)
+        except BaseException:
+            for pool in opened.values():
+                await pool.close()
+            raise
+        return cls(opened, **kw)
+
+    async def close(self) -> None:
+        for pool in self._pools.values():
+            await pool.close()
+
+    async def ping(self) -> bool:
+        async with self._pool.acquire() as conn:
+            return await conn.fetchval("SELECT 1;") == 1
+
+    async def db_now(self) -> datetime:
+        """The server's clock (not the transaction start), for `clock.DBClock`."""
+        async with self._pool.acquire() as conn:
+            return await conn.fetchval("SELECT clock_timestamp();")
+
+    @asynccontextmanager
+    async def _acquire(self, role: str):
+        """A connection of `role`'s pool; the wait is recorded in `db_pool_wait_seconds`."""
+        try:
+            pool = self._pools[role]
+        except KeyError:
+            raise LookupError(f"JobRepo was opened without a {role!r} pool") from None
+        t0 = perf_counter()
+        async with pool.acquire() as conn:
+            POOL_WAIT.labels(role).observe(perf_counter() - t0)
+            yield conn
 
     # Helpers --------------------------------------------------
-    @staticmethod
-    def _row_to_job(row: asyncpg.Record) -> Job:
-        spec = (
-            ScheduleSpec(at=row["next_run_at"])      # one-shot
-            if row["rrule"] is None
-            else ScheduleSpec(rrule=row["rrule"])
-        )
-        return Job(
-            id=row["id"],
-            job_type=row["job_type"],
-            payload=row["payload"],
-            spec=spec,
-            next_run_at=row["next_run_at"],
-            retries=row["retries"],
-            status=JobStatus(row["status"]),
-            created_at=row["created_at"],
-        )
+    def _payload_columns(self, payload) -> Tuple[Optional[str], Optional[bytes], Optional[str]]:
+        return encode_payload(payload, self._compress_min, self._compression)
+
+    async def _rule_columns(self, conn, job: Job) -> Tuple[Optional[int], Optional[str]]:
+        """(rule_id, inline rrule) for one job."""
+        if job.spec.rrule is None:
+            return None, None
+        rule_id = (await intern_rules(conn, (job.spec.rrule,), self._rule_ids)).get(job.spec.rrule)
+        return (rule_id, None) if rule_id else (None, job.spec.rrule)
 
     # CRUD -----------------------------------------------------
+    @tracing.traced("repo.insert_job")
     async def insert_job(self, job: Job) -> bool:
         """
         Returns True if inserted, False if duplicate (idempotent).
         """
-        q = """
-        INSERT INTO jobs (id, job_type, payload, rrule, next_run_at, created_at)
-        VALUES ($1,$2,$3,$4,$5,$6)
-        ON CONFLICT (id) DO NOTHING;
-        """
-        async with self._pool.acquire() as conn:
-            res = await conn.execute(
-                q,
+        payload, payload_z, encoding = self._payload_columns(job.payload)
+        async with self._acquire("ingest") as conn:
+            rule_id, rrule = await self._rule_columns(conn, job)
+            return await _execute(
+                conn,
+                "insert_job",
                 job.id,
                 job.job_type,
-                json.dumps(job.payload),
-                job.spec.rrule,
+                payload,
+                rrule,
                 job.next_run_at,
                 job.created_at,
-            )
-            return res.endswith("INSERT 0 1")
+                json.dumps(job.tags),
+                job.trace_id,
+                payload_z,
+                encoding,
+                rule_id,
+            ) == 1
 
+    @tracing.traced("repo.insert_jobs")
+    async def insert_jobs(self, jobs: Sequence[Job]) -> Set[uuid.UUID]:
+        """
+        Multi-row insert of a whole batch in one transaction.
+        Returns the ids that were actually inserted; the rest were duplicates.
+        """
+        if not jobs:
+            return set()
+        cols = [self._payload_columns(j.payload) for j in jobs]
+        async with self._acquire("ingest") as conn:
+            ids = await intern_rules(conn, (j.spec.rrule for j in jobs), self._rule_ids)
+            rule_ids = [ids.get(j.spec.rrule) for j in jobs]
+            async with conn.transaction():
+                rows = await _run(
+                    conn,
+                    "insert_jobs",
+                    "fetch",
+                    [j.id for j in jobs],
+                    [j.job_type for j in jobs],
+                    [c[0] for c in cols],
+                    [None if rid else j.spec.rrule for j, rid in zip(jobs, rule_ids)],
+                    [j.next_run_at for j in jobs],
+                    [j.created_at for j in jobs],
+                    [json.dumps(j.tags) for j in jobs],
+                    [j.trace_id for j in jobs],
+                    [c[1] for c in cols],
+                    [c[2] for c in cols],
+                    rule_ids,
+                )
+            return {r["id"] for r in rows}
+
+    @tracing.traced("repo.cancel_job")
     async def cancel_job(self, job_id: uuid.UUID) -> int:
         """
         Mark cancelled; returns # of rows affected (0 or 1).
         """
         q = "UPDATE jobs SET status='cancelled' WHERE id=$1 AND status='pending';"
-        async with self._pool.acquire() as conn:
+        async with self._acquire("ingest") as conn:
             res = await conn.execute(q, job_id)
             return int(res.split()[-1])
 
+    async def cancel_jobs(self, job_ids: Iterable[uuid.UUID]) -> Set[uuid.UUID]:
+        """
+        Cancel many jobs in one statement; returns the ids actually cancelled.
+        """
+        ids = list(job_ids)
+        if not ids:
+            return set()
+        q = """
+        UPDATE jobs SET status='cancelled'
+        WHERE id = ANY($1::uuid[]) AND status='pending'
+        RETURNING id;
+        """
+        async with self._acquire("ingest") as conn:
+            rows = await conn.fetch(q, ids)
+            return {r["id"] for r in rows}
+
+    @tracing.traced("repo.update_jobs")
+    async def update_jobs(
+        self, updates: Sequence[JobUpdate]
+    ) -> Tuple[Dict[uuid.UUID, int], Set[uuid.UUID]]:
+        """
+        Apply partial updates to pending jobs in one statement (ids must be
+        unique).  A row is only touched while pending and, if the update names
+        a `version`, while it still has that version; each applied update
+        bumps it.  Returns ({id: new version}, ids refused on version).
+        """
+        if not updates:
+            return {}, set()
+        q = """
+        UPDATE jobs AS j
+        SET    next_run_at      = COALESCE(u.next_run_at, j.next_run_at),
+               rrule            = CASE WHEN u.next_run_at IS NULL THEN j.rrule   ELSE u.rrule   END,
+               rule_id          = CASE WHEN u.next_run_at IS NULL THEN j.rule_id ELSE u.rule_id END,
+               payload          = CASE WHEN u.set_payload THEN u.payload          ELSE j.payload          END,
+               payload_z        = CASE WHEN u.set_payload THEN u.payload_z        ELSE j.payload_z        END,
+               payload_encoding = CASE WHEN u.set_payload THEN u.payload_encoding ELSE j.payload_encoding END,
+               tags             = COALESCE(u.tags, j.tags),
+               version          = j.version + 1
+        FROM   unnest($1::uuid[], $2::int[], $3::timestamptz[], $4::text[], $5::bigint[],
+                      $6::bool[], $7::jsonb[], $8::bytea[], $9::text[], $10::jsonb[])
+                 AS u(id, version, next_run_at, rrule, rule_id,
+                      set_payload, payload, payload_z, payload_encoding, tags)
+        WHERE  j.id = u.id
+          AND  j.status = 'pending'
+          AND  (u.version IS NULL OR j.version = u.version)
+        RETURNING j.id, j.version;
+        """
+        q_conflicts = "SELECT id FROM jobs WHERE id = ANY($1::uuid[]) AND status = 'pending';"
+        cols = [self._payload_columns(u.payload) if u.payload is not None else (None, None, None)
+                for u in updates]
+        rules = [u.spec.rrule if u.spec is not None else None for u in updates]
+        async with self._acquire("ingest") as conn:
+            ids = await intern_rules(conn, rules, self._rule_ids)
+            rule_ids = [ids.get(r) if r else None for r in rules]
+            async with conn.transaction():
+                rows = await conn.fetch(
+                    q,
+                    [u.id for u in updates],
+                    [u.version for u in updates],
+                    [u.next_run_at for u in updates],
+                    [None if rid else r for r, rid in zip(rules, rule_ids)],
+                    rule_ids,
+                    [u.payload is not None for u in updates],
+                    [c[0] for c in cols],
+                    [c[1] for c in cols],
+                    [c[2] for c in cols],
+                    [None if u.tags is None else json.dumps(u.tags) for u in updates],
+                )
+                applied = {r["id"]: r["version"] for r in rows}
+                missed = [u.id for u in updates if u.id not in applied and u.version is not None]
+                conflicts = ({r["id"] for r in await conn.fetch(q_conflicts, missed)}
+                             if missed else set())
+            return applied, conflicts
+
+    async def add_tombstones(self, job_ids: Iterable[uuid.UUID], *, expires_at: datetime) -> None:
+        """Remember cancels that matched no row until `expires_at`; prunes expired ones."""
+        ids = list(job_ids)
+        if not ids:
+            return
+        q = """
+        INSERT INTO delay_tombstones (id, expires_at)
+        SELECT unnest($1::uuid[]), $2
+        ON CONFLICT (id) DO UPDATE SET expires_at = EXCLUDED.expires_at;
+        """
+        async with self._acquire("ingest") as conn:
+            async with conn.transaction():
+                await conn.execute("DELETE FROM delay_tombstones WHERE expires_at < now();")
+                await conn.execute(q, ids, expires_at)
+
+    async def take_tombstones(self, job_ids: Iterable[uuid.UUID]) -> Set[uuid.UUID]:
+        """Remove and return the tombstones among `job_ids` (i.e. the cancelled ones)."""
+        ids = list(job_ids)
+        if not ids:
+            return set()
+        q = "DELETE FROM delay_tombstones WHERE id = ANY($1::uuid[]) RETURNING id;"
+        async with self._acquire("ingest") as conn:
+            return {r["id"] for r in await conn.fetch(q, ids)}
+
+    async def add_delay_markers(
+        self, job_ids: Iterable[uuid.UUID], *, expires_at: datetime
+    ) -> Tuple[Set[uuid.UUID], Set[uuid.UUID]]:
+        """
+        Insert a pending marker, valid until `expires_at`, for each id that has
+        none; prunes expired ones.  Returns (ids added, ids whose marker was
+        already confirmed); ids in neither have a marker still pending.
+        """
+        ids = list(job_ids)
+        if not ids:
+            return set(), set()
+        # the outer SELECT sees the table as it was before the INSERT
+        q = """
+        WITH added AS (
+            INSERT INTO delay_markers (id, expires_at)
+            SELECT unnest($1::uuid[]), $2
+            ON CONFLICT (id) DO NOTHING
+            RETURNING id
+        )
+        SELECT id, true AS added FROM added
+        UNION ALL
+        SELECT id, false FROM delay_markers WHERE id = ANY($1::uuid[]) AND confirmed;
+        """
+        async with self._acquire("ingest") as conn:
+            async with conn.transaction():
+                await conn.execute("DELETE FROM delay_markers WHERE expires_at < now();")
+                rows = await conn.fetch(q, ids, expires_at)
+        return ({r["id"] for r in rows if r["added"]},
+                {r["id"] for r in rows if not r["added"]})
+
+    async def confirm_delay_markers(self, job_ids: Iterable[uuid.UUID]) -> None:
+        """Mark markers whose tier publish the broker confirmed."""
+        ids = list(job_ids)
+        if not ids:
+            return
+        q = "UPDATE delay_markers SET confirmed = true WHERE id = ANY($1::uuid[]);"
+        async with self._acquire("ingest") as conn:
+            await conn.execute(q, ids)
+
+    async def find_by_selector(
+        self, selector: Dict[str, str], *, limit: int = 1000
+    ) -> List[uuid.UUID]:
+        """Ids of pending jobs whose tags contain every key/value in `selector`."""
+        q = """
+        SELECT id FROM jobs
+        WHERE  status = 'pending' AND tags @> $1::jsonb
+        LIMIT  $2;
+        """
+        async with self._acquire("ingest") as conn:
+            rows = await conn.fetch(q, json.dumps(selector), limit)
+            return [r["id"] for r in rows]
+
+    async def cancel_by_selector(
+        self, selector: Dict[str, str], *, chunk: int = 1000
+    ) -> AsyncIterator[int]:
+        """
+        Cancel every pending job matching `selector`, yielding the running total
+        after each chunk.  Each chunk is its own short transaction and skips rows
+        a producer currently holds, so the pending index is never locked for
+        long; a final blocking pass picks up whatever was skipped.
+        """
+        q = """
+        UPDATE jobs SET status='cancelled'
+        WHERE id IN (
+            SELECT id FROM jobs
+            WHERE  status = 'pending' AND tags @> $1::jsonb
+            LIMIT  $2
+            FOR UPDATE {lock}
+        );
+        """
+        sel = json.dumps(selector)
+        total = 0
+        async with self._acquire("ingest") as conn:
+            for lock in ("SKIP LOCKED", ""):
+                while True:
+                    res = await conn.execute(q.format(lock=lock), sel, chunk)
+                    n = int(res.split()[-1])
+                    if not n:
+                        break
+                    total += n
+                    yield total
+        if not total:
+            yield 0
+
+    async def fire_groups(
+        self, *, until: datetime, bucket_s: int = 60
+    ) -> AsyncIterator[Tuple[str, Optional[str], datetime, int]]:
+        """
+        Stream pending jobs due before `until` as (job_type, rrule, next_run_at,
+        count) groups, ordered by rule so a consumer can expand each rule once.
+        One-shots are truncated to `bucket_s` (epoch-aligned) server-side, so a
+        million one-shots collapse to a few thousand rows.
+        """
+        q = f"""
+        SELECT j.job_type, {RULE_TEXT} AS rrule,
+               CASE WHEN {RULE_TEXT} IS NULL
+                    THEN to_timestamp(floor(extract(epoch FROM j.next_run_at) / $2) * $2)
+                    ELSE j.next_run_at END AS at,
+               count(*) AS n
+        FROM   jobs j {RULE_JOIN}
+        WHERE  j.status = 'pending' AND j.next_run_at < $1
+        GROUP  BY 1, 2, 3
+        ORDER  BY 2;
+        """
+        async with self._acquire("ingest") as conn:
+            async with conn.transaction():      # cursors need a transaction
+                # a full-table report; exempt from the role's statement_timeout
+                await conn.execute("SET LOCAL statement_timeout = 0;")
+                async for r in conn.cursor(q, until, bucket_s, prefetch=10_000):
+                    yield r["job_type"], r["rrule"], r["at"], r["n"]
+
+    async def recent_job_ids(self, since: datetime) -> List[uuid.UUID]:
+        """Ids of jobs created after `since` (dedup filter pre-warm)."""
+        q = "SELECT id FROM jobs WHERE created_at >= $1;"
+        async with self._acquire("ingest") as conn:
+            rows = await conn.fetch(q, since)
+            return [r["id"] for r in rows]
+
+    @tracing.traced("repo.lock_due_jobs")
     async def lock_due_jobs(
-        self, *, now: datetime | None = None, limit: int = 500
-    ) -> Sequence[Job]:
+        self,
+        *,
+        now: datetime | None = None,
+        limit: int = 500,
+        after: Tuple[datetime, uuid.UUID] | None = None,
+    ) -> Sequence[DueJob]:
         """
         Atomically selects and locks due rows.
         Other replicas skip the same rows.
+        `after` = (next_run_at, id) of the last row already claimed: keyset
+        pagination for the backlog drain, which claims ahead of finalize.
         """
-        now = now or datetime.now(timezone.utc)
-        q = """
-        SELECT id, job_type, payload, rrule, next_run_at,
-               retries, status, created_at
-        FROM   jobs
-        WHERE  status = 'pending'
-          AND  next_run_at <= $1
-        ORDER  BY next_run_at
-        LIMIT  $2
-        FOR UPDATE SKIP LOCKED;
-        """
-        async with self._pool.acquire() as conn:
-            rows = await conn.fetch(q, now, limit)
-            return [self._row_to_job(r) for r in rows]
+        now = now or clock_now()
+        if after is None:
+            name, args = "claim", (now, limit)
+        else:
+            name, args = "claim_after", (now, limit, *after)
+        async with self._acquire("claim") as conn:
+            rows = await _run(conn, name, "fetch", *args)
+            # claimed rows carry no payload; see `load_payloads`
+            return [DueJob(*r) for r in rows]
+
+    async def count_overdue(self, *, now: datetime | None = None,
+                            cap: int | None = None) -> int:
+        """Pending rows due by `now`; stops counting at `cap` so probes stay cheap."""
+        now = now or clock_now()
+        async with self._acquire("claim") as conn:
+            return await _run(conn, "count_overdue", "fetchval", now, cap)
 
     async def reschedule(self, job: Job, next_time: datetime) -> None:
         q = """
@@ -99,10 +612,125 @@ class JobRepo:
             retries     = $3
         WHERE id = $1;
         """
-        async with self._pool.acquire() as conn:
+        async with self._acquire("finalize") as conn:
             await conn.execute(q, job.id, next_time, job.retries)
 
     async def mark_done(self, job_id: uuid.UUID) -> None:
         q = "UPDATE jobs SET status='done' WHERE id=$1;"
-        async with self._pool.acquire() as conn:
+        async with self._acquire("finalize") as conn:
             await conn.execute(q, job_id)
+
+    @tracing.traced("repo.finalize_batch")
+    async def finalize_batch(
+        self,
+        rescheduled: Sequence[Tuple[DueJob, datetime]],
+        done: Sequence[DueJob],
+    ) -> int:
+        """
+        Apply the outcome of a whole fired batch in one transaction:
+        recurring jobs move to their next occurrence, the rest are marked done.
+        Rows rescheduled since they were claimed (next_run_at moved) are left
+        as the update wrote them; returns how many were skipped that way.
+        """
+        applied = 0
+        async with self._acquire("finalize") as conn:
+            async with conn.transaction():
+                if rescheduled:
+                    applied += await _execute(
+                        conn,
+                        "finalize_reschedule",
+                        [job.id for job, _ in rescheduled],
+                        [nxt for _, nxt in rescheduled],
+                        [job.retries for job, _ in rescheduled],
+                        [job.next_run_at for job, _ in rescheduled],
+                    )
+                if done:
+                    applied += await _execute(conn, "finalize_done", [j.id for j in done],
+                                              [j.next_run_at for j in done])
+        return len(rescheduled) + len(done) - applied
+
+    async def load_payloads(self, jobs: Sequence[DueJob]) -> None:
+        """
+        Fill `payload` for claimed jobs in one round trip, decompressing
+        `payload_z` where needed.  Kept out of `lock_due_jobs` so the claim
+        query stays narrow.
+        """
+        missing = [j for j in jobs if j.payload is None]
+        if not missing:
+            return
+        async with self._acquire("claim") as conn:
+            rows = await _run(conn, "load_payloads", "fetch", [j.id for j in missing])
+        by_id = {r["id"]: r for r in rows}
+        for job in missing:
+            row = by_id.get(job.id)
+            job.payload = decode_payload(row) if row is not None else {}
+
+    async def earliest_due(self) -> Optional[datetime]:
+        """`next_run_at` of the soonest pending job (served by jobs_pending_idx)."""
+        async with self._acquire("claim") as conn:
+            return await _run(conn, "earliest_due", "fetchval")
+
+    # Fire log -------------------------------------------------
+    async def write_fire_log(self, records: Sequence[FireRecord]) -> None:
+        """COPY a buffer of fire records into `job_fire_log` (routed to day partitions)."""
+        async with self._acquire("firelog") as conn:
+            await conn.copy_records_to_table("job_fire_log", records=records,
+                                             columns=FireRecord._fields)
+
+    async def ensure_fire_log_partitions(self, first: date, days: int) -> List[str]:
+        """Create the missing day partitions `first` … `first + days - 1`; returns their names."""
+        created = []
+        async with self._acquire("firelog") as conn:
+            async with conn.transaction():
+                # producers share the schema; one creates, the others then see it
+                await conn.execute("SELECT pg_advisory_xact_lock(hashtext('job_fire_log'));")
+                existing = {r["relname"] for r in await _run(conn, "fire_log_partitions", "fetch")}
+                for i in range(days):
+                    day = first + timedelta(days=i)
+                    name = fire_log_partition(day)
+                    if name in existing:
+                        continue
+                    await conn.execute(
+                        f"CREATE TABLE {name} PARTITION OF job_fire_log "
+                        f"FOR VALUES FROM ('{day.isoformat()} 00:00+00') "
+                        f"TO ('{(day + timedelta(days=1)).isoformat()} 00:00+00');")
+                    created.append(name)
+        return created
+
+    async def prune_fire_log(self, before: date) -> int:
+        """Drop the day partitions entirely before `before`; returns how many were dropped."""
+        oldest = fire_log_partition(before)
+        async with self._acquire("firelog") as conn:
+            names = sorted(r["relname"] for r in await _run(conn, "fire_log_partitions", "fetch")
+                           if r["relname"].startswith(FIRE_LOG_PREFIX))
+            old = [n for n in names if n < oldest]
+            for name in old:
+                await conn.execute(f"DROP TABLE IF EXISTS {name};")
+        return len(old)
+
+    async def fire_lateness(
+        self, since: datetime, until: datetime, *, job_type: Optional[str] = None,
+        percentiles: Sequence[float] = (0.5, 0.9, 0.99),
+    ) -> List[Tuple[Optional[str], int, List[float], float]]:
+        """
+        Lateness (fired_at − due_at, seconds) of fires in [since, until) per
+        job_type as (job_type, fires, [percentiles], max), plus an overall row
+        with job_type None last.  Only the partitions of the window are read.
+        """
+        q = """
+        SELECT job_type, count(*) AS n,
+               percentile_cont($3::float8[]) WITHIN GROUP (ORDER BY lateness) AS pct,
+               max(lateness) AS worst
+        FROM  (SELECT job_type, extract(epoch FROM fired_at - due_at)::float8 AS lateness
+               FROM   job_fire_log
+               WHERE  fired_at >= $1 AND fired_at < $2
+                 AND  ($4::text IS NULL OR job_type = $4)) f
+        GROUP  BY ROLLUP (job_type)
+        ORDER  BY job_type NULLS LAST;
+        """
+        async with self._acquire("ingest") as conn:
+            async with conn.transaction():
+                # a report over a window; exempt from the role's statement_timeout
+                await conn.execute("SET LOCAL statement_timeout = 0;")
+                rows = await conn.fetch(q, since, until, list(percentiles), job_type)
+        return [(r["job_type"], r["n"], list(r["pct"]), r["worst"]) for r in rows if r["n"]]
@@ -139,11 +139,127 @@ class RRuleBuilder:
         if "UNTIL" in self._parts and "COUNT" in self._parts:
             raise ValueError("RRULE can’t have both COUNT and UNTIL")
         # Older generators like Outlook care about field order → sort by spec
-        ordering = ("FREQ", "INTERVAL", "BYSECOND", "BYMINUTE", "BYHOUR",
-                    "BYDAY", "BYMONTHDAY", "BYMONTH", "COUNT", "UNTIL")
-        ordered = [f"{k}={self._parts[k]}" for k in ordering if k in self._parts]
+        ordered = [f"{k}={self._parts[k]}" for k in _ORDER if k in self._parts]
         return ";".join(ordered), self._timezone
 
     def __str__(self) -> str:
         return self.build()[0]
 
+    @classmethod
+    def parse(cls, text: str) -> Self:
+        """
+        Inverse of `build()`: read an RRULE body (`FREQ=…;…`, optionally
+        prefixed with `RRULE:`) back into a builder.  Parts are normalised on
+        the way in – upper-case, sorted BY* lists, `INTERVAL=1` dropped – so
+        equivalent rules build to the same string.
+        """
+        body = text.strip()
+        if body[:6].upper() == "RRULE:":
+            body = body[6:]
+        b = cls()
+        for item in filter(None, body.split(";")):
+            key, sep, value = item.partition("=")
+            key, value = key.strip().upper(), value.strip().upper()
+            if not sep or not value:
+                raise ValueError(f"Malformed RRULE part {item!r}")
+            if key not in _ORDER:
+                raise ValueError(f"Unsupported RRULE part {key!r}")
+            if key in b._parts:
+                raise ValueError(f"Duplicate RRULE part {key!r}")
+            if key in _INT_LISTS:
+                value = ",".join(map(str, sorted({int(v) for v in value.split(",")})))
+            elif key == "BYDAY":
+                days = {_byday_key(d) for d in value.split(",")}
+                value = ",".join(f"{n or ''}{_WEEKDAYS[wd]}" for wd, n in sorted(days))
+            elif key in ("INTERVAL", "COUNT"):
+                value = str(int(value))
+            b._parts[key] = value
+        if b._parts.get("FREQ") not in _FREQS:
+            raise ValueError(f"Missing or unknown FREQ in {text!r}")
+        if b._parts.get("INTERVAL") == "1":
+            del b._parts["INTERVAL"]
+        b.build()                       # COUNT + UNTIL conflict etc.
+        return b
+
+    @property
+    def parts(self) -> dict[str, str]:
+        return dict(self._parts)
+
+
+_ORDER = ("FREQ", "INTERVAL", "BYSECOND", "BYMINUTE", "BYHOUR", "BYDAY",
+          "BYMONTHDAY", "BYYEARDAY", "BYWEEKNO", "BYMONTH", "BYSETPOS",
+          "BYEASTER", "WKST", "COUNT", "UNTIL")
+_FREQS = ("SECONDLY", "MINUTELY", "HOURLY", "DAILY", "WEEKLY", "MONTHLY", "YEARLY")
+_INT_LISTS = ("BYSECOND", "BYMINUTE", "BYHOUR", "BYMONTHDAY", "BYYEARDAY",
+              "BYWEEKNO", "BYMONTH", "BYSETPOS", "BYEASTER")
+_WEEKDAYS = ("MO", "TU", "WE", "TH", "FR", "SA", "SU")
+
+
+def _byday_key(day: str) -> tuple[int, int]:
+    """`-1FR` → (4, -1): weekday first, then ordinal (0 = every)."""
+    wd, n = day.strip()[-2:], day.strip()[:-2]
+    try:
+        return _WEEKDAYS.index(wd), int(n) if n not in ("", "+") else 0
+    except ValueError:
+        raise ValueError(f"Bad BYDAY value {day!r}") from None
+
+
+@dataclass(frozen=True, slots=True)
+class CanonicalRule:
+    """A rule in canonical text form plus the metadata stored beside it."""
+    text: str
+    freq: str
+    tz: str | None          # TZID of DTSTART, if any
+    bounded: bool           # COUNT or UNTIL present → the series ends
+
+
+def canonicalize(text: str) -> CanonicalRule:
+    """
+    Canonical form of a stored schedule: a bare RRULE body, or iCalendar
+    lines (DTSTART / RRULE / RDATE / EXRULE / EXDATE; a line without a
+    property name is an RRULE, as for `rrulestr`).  Property names are
+    upper-cased, lines put in a fixed order and every RRULE/EXRULE rebuilt
+    via `RRuleBuilder.parse(...).build()`.  Semantics are unchanged.
+    """
+    lines = [ln.strip() for ln in text.strip().splitlines() if ln.strip()]
+    if len(lines) == 1 and ":" not in lines[0]:
+        rule = RRuleBuilder.parse(lines[0])
+        return CanonicalRule(str(rule), rule._parts["FREQ"], None, _bounded(rule))
+
+    out: dict[str, list[str]] = {k: [] for k in _LINE_ORDER}
+    freq, tz, bounded = None, None, False
+    for line in lines:
+        head, sep, value = line.partition(":")
+        if not sep:
+            head, value = "RRULE", line
+        name, *params = head.split(";")
+        name = name.upper()
+        if name not in out:
+            raise ValueError(f"Unsupported schedule property {name!r}")
+        if name in ("RRULE", "EXRULE"):
+            rule = RRuleBuilder.parse(value)
+            if name == "RRULE":
+                freq = freq or rule._parts["FREQ"]
+                bounded = bounded or _bounded(rule)
+            out[name].append(f"{name}:{rule}")
+            continue
+        params = [_param(p) for p in params]     # IANA zone names keep their case
+        if name == "DTSTART":
+            tz = next((p[5:] for p in params if p.startswith("TZID=")), None)
+        out[name].append(f"{';'.join([name, *params])}:{value.strip().upper()}")
+    if freq is None:
+        raise ValueError(f"No RRULE in {text!r}")
+    canon = "\n".join(ln for k in _LINE_ORDER for ln in sorted(out[k]))
+    return CanonicalRule(canon, freq, tz, bounded)
+
+
+_LINE_ORDER = ("DTSTART", "RRULE", "RDATE", "EXRULE", "EXDATE")
+
+
+def _param(p: str) -> str:
+    key, _, value = p.partition("=")
+    return f"{key.strip().upper()}={value.strip()}"
+
+
+def _bounded(rule: RRuleBuilder) -> bool:
+    return "COUNT" in rule._parts or "UNTIL" in rule._parts
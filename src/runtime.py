@@ -0,0 +1,208 @@
+"""
+Process runtime shared by the consumer and the producer:
+
+* `LoopMonitor` – periodic event-loop lag probe (Prometheus histogram) plus a
+  watchdog thread that logs the loop thread's stack when it is stuck.
+* `HealthServer` – tiny HTTP server for `/healthz` (loop alive) and
+  `/readyz` (registered readiness checks: DB, AMQP, last tick, …).
+* `report_shutdown()` – drain duration / abandoned-work metrics and log line.
+* `run()` – `asyncio.run` with an opt-in uvloop event loop.
+"""
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import sys
+import threading
+import time
+import traceback
+from typing import Any, Awaitable, Callable, Dict, Mapping, Optional, Tuple, Union
+from urllib.parse import parse_qsl, urlsplit
+
+from prometheus_client import Counter, Gauge, Histogram
+
+LOG = logging.getLogger("scheduler.runtime")
+
+LOOP_LAG = Histogram(
+    "event_loop_lag_seconds",
+    "Delay between a scheduled loop wake-up and when it actually ran",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5),
+)
+
+SHUTDOWN_SECONDS = Gauge("shutdown_drain_seconds", "Duration of the last graceful shutdown", ["service"])
+SHUTDOWN_ABANDONED = Counter("shutdown_abandoned_total",
+                             "Work handed back at shutdown instead of being finished",
+                             ["service", "kind"])
+
+Check = Callable[[], Union[bool, Awaitable[bool]]]
+Route = Callable[[Dict[str, str]], Awaitable[Tuple[int, Any]]]
+
+
+# ── Loop lag ────────────────────────────────────────────────────────────────
+class LoopMonitor:
+    """
+    Every `interval` seconds the probe coroutine records how late it woke up
+    and refreshes a heartbeat.  A daemon thread watches the heartbeat; if it
+    is older than `slow_threshold` the loop is blocked right now, so the
+    thread grabs the loop thread's current stack and logs it (once per stall).
+    """
+
+    def __init__(self, *, interval: float = 0.25, slow_threshold: float = 0.1):
+        self.interval = interval
+        self.slow_threshold = slow_threshold
+        self.last_beat = time.monotonic()
+        self._task: Optional[asyncio.Task] = None
+        self._stop = threading.Event()
+        self._loop_thread_id: Optional[int] = None
+
+    def start(self) -> None:
+        self._loop_thread_id = threading.get_ident()
+        self._task = asyncio.get_running_loop().create_task(self._probe())
+        threading.Thread(target=self._watchdog, name="loop-watchdog", daemon=True).start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._task is not None:
+            self._task.cancel()
+
+    async def _probe(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            lag = max(loop.time() - expected, 0.0)
+            LOOP_LAG.observe(lag)
+            self.last_beat = time.monotonic()
+
+    def _watchdog(self) -> None:
+        reported = False
+        while not self._stop.wait(self.slow_threshold / 2):
+            stalled = time.monotonic() - self.last_beat - self.interval
+            if stalled < self.slow_threshold:
+                reported = False
+                continue
+            if reported:
+                continue
+            reported = True
+            frame = sys._current_frames().get(self._loop_thread_id)
+            stack = "".join(traceback.format_stack(frame)) if frame else "<unavailable>"
+            LOG.warning("Event loop blocked for %.0f ms; loop thread stack:\n%s",
+                        stalled * 1000, stack)
+
+    def healthy(self, max_stall: float) -> bool:
+        return time.monotonic() - self.last_beat < self.interval + max_stall
+
+
+# ── Health / readiness endpoint ─────────────────────────────────────────────
+_REASONS = {200: "OK", 202: "Accepted", 400: "Bad Request", 404: "Not Found",
+            409: "Conflict", 503: "Service Unavailable"}
+
+class HealthServer:
+    """
+    `GET /healthz` – 200 while the event loop keeps beating.
+    `GET /readyz`  – 200 only if every registered check passes; the body
+                     lists each check so a failing dependency is obvious.
+    Extra routes (e.g. /debug/profile) can be registered with `add_route`.
+    """
+
+    def __init__(self, monitor: LoopMonitor, *, port: int, max_stall: float = 5.0):
+        self.monitor = monitor
+        self.port = port
+        self.max_stall = max_stall
+        self._checks: Dict[str, Check] = {}
+        self._routes: Dict[str, Route] = {}
+        self._server: Optional[asyncio.base_events.Server] = None
+
+    def add_check(self, name: str, check: Check) -> None:
+        self._checks[name] = check
+
+    def add_route(self, path: str, handler: Route) -> None:
+        """`handler(query) -> (status, json_body)`."""
+        self._routes[path] = handler
+
+    async def start(self) -> None:
+        self._server = await asyncio.start_server(self._handle, "0.0.0.0", self.port)
+
+    async def stop(self) -> None:
+        self.monitor.stop()
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+
+    async def _run_checks(self) -> Dict[str, bool]:
+        results = {}
+        for name, check in self._checks.items():
+            try:
+                res = check()
+                if asyncio.iscoroutine(res):
+                    res = await asyncio.wait_for(res, timeout=2)
+                results[name] = bool(res)
+            except Exception as exc:
+                LOG.warning("Readiness check %s failed: %s", name, exc)
+                results[name] = False
+        return results
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            request_line = await asyncio.wait_for(reader.readline(), timeout=5)
+            parts = request_line.decode("latin-1").split()
+            url = urlsplit(parts[1] if len(parts) >= 2 else "")
+            path, query = url.path, dict(parse_qsl(url.query))
+            if path == "/healthz":
+                ok = self.monitor.healthy(self.max_stall)
+                code, body = (200 if ok else 503), {"loop": ok}
+            elif path == "/readyz":
+                body = await self._run_checks()
+                code = 200 if all(body.values()) else 503
+            elif path in self._routes:
+                code, body = await self._routes[path](query)
+            else:
+                code, body = 404, {"error": "not found"}
+            status = f"{code} {_REASONS.get(code, 'Unknown')}"
+            payload = json.dumps(body).encode()
+            writer.write(
+                f"HTTP/1.1 {status}\r\nContent-Type: application/json\r\n"
+                f"Content-Length: {len(payload)}\r\nConnection: close\r\n\r\n".encode()
+                + payload
+            )
+            await writer.drain()
+        except (asyncio.TimeoutError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+
+async def start_runtime(settings) -> HealthServer:
+    """Start the loop monitor and (unless HEALTH_PORT=0) the health server."""
+    monitor = LoopMonitor(interval=settings.LOOP_LAG_INTERVAL_MS / 1000,
+                          slow_threshold=settings.SLOW_CALLBACK_MS / 1000)
+    monitor.start()
+    health = HealthServer(monitor, port=settings.HEALTH_PORT)
+    if settings.HEALTH_PORT:
+        await health.start()
+    return health
+
+
+# ── Graceful shutdown ───────────────────────────────────────────────────────
+def report_shutdown(service: str, seconds: float, abandoned: Mapping[str, int]) -> None:
+    """Record how long a service took to drain and what it left for others."""
+    SHUTDOWN_SECONDS.labels(service).set(seconds)
+    for kind, n in abandoned.items():
+        SHUTDOWN_ABANDONED.labels(service, kind).inc(n)
+    left = ", ".join(f"{n} {kind}" for kind, n in abandoned.items() if n) or "nothing"
+    log = LOG.warning if any(abandoned.values()) else LOG.info
+    log("%s drained in %.2fs; abandoned: %s", service.capitalize(), seconds, left)
+
+
+# ── Event loop selection ────────────────────────────────────────────────────
+def run(main: Awaitable, *, use_uvloop: bool = False):
+    """`asyncio.run(main)`, on uvloop when requested and installed."""
+    if use_uvloop:
+        try:
+            import uvloop
+        except ImportError:
+            LOG.warning("USE_UVLOOP set but uvloop is not installed; using asyncio loop")
+        else:
+            return asyncio.run(main, loop_factory=uvloop.new_event_loop)
+    return asyncio.run(main)
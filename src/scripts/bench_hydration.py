@@ -0,0 +1,77 @@
+"""
+Claim-path hydration cost: full `Job` (+ ScheduleSpec + JobStatus) per row,
+as JobRepo used to build, versus the slotted `DueJob` built by unpacking
+the row tuple.
+
+Rows are synthesised in the claim query's column order, so no database is
+needed; asyncpg Records support the same mapping and tuple access.
+
+Example usages
+--------------
+$ python src/scripts/bench_hydration.py
+$ python src/scripts/bench_hydration.py -n 100000 --recurring 0.3
+"""
+from __future__ import annotations
+
+import argparse
+import time
+import tracemalloc
+import uuid
+from datetime import timedelta
+
+from clock import now
+from models import DueJob, Job, JobStatus, ScheduleSpec
+
+RULE = "DTSTART:20250101T090000Z\nRRULE:FREQ=HOURLY"
+COLUMNS = ("id", "job_type", "rrule", "next_run_at", "retries", "trace_id")
+
+
+def _rows(n: int, recurring: float) -> list[tuple]:
+    due = now() - timedelta(seconds=1)
+    every = int(1 / recurring) if recurring else 0
+    return [(uuid.uuid4(), "bench", RULE if every and i % every == 0 else None, due, 0, None)
+            for i in range(n)]
+
+
+def full_job(row) -> Job:
+    """The pre-DueJob JobRepo._row_to_job."""
+    spec = (ScheduleSpec(at=row["next_run_at"]) if row["rrule"] is None
+            else ScheduleSpec(rrule=row["rrule"]))
+    return Job(id=row["id"], job_type=row["job_type"], payload=None, spec=spec,
+               next_run_at=row["next_run_at"], retries=row["retries"],
+               status=JobStatus(row["status"]), created_at=row["created_at"],
+               trace_id=row["trace_id"])
+
+
+def _measure(name: str, build, rows) -> None:
+    t0 = time.perf_counter()
+    jobs = [build(r) for r in rows]
+    elapsed = time.perf_counter() - t0
+    del jobs
+
+    tracemalloc.start()
+    jobs = [build(r) for r in rows]
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del jobs
+    print(f"{name:<8} {len(rows) / elapsed:>12,.0f} rows/s   "
+          f"{elapsed / len(rows) * 1e9:>7,.0f} ns/row   {peak / len(rows):>6,.0f} B/row")
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Compare claim-row hydration")
+    ap.add_argument("-n", "--count", type=int, default=100_000)
+    ap.add_argument("--recurring", type=float, default=0.2,
+                    help="Fraction of rows with an RRULE")
+    args = ap.parse_args()
+
+    rows = _rows(args.count, args.recurring)
+    created = now()
+    mapped = [dict(zip(COLUMNS, r), status="pending", created_at=created) for r in rows]
+
+    _measure("Job", full_job, mapped)
+    _measure("DueJob", lambda r: DueJob(*r), rows)
+
+
+if __name__ == "__main__":
+    main()
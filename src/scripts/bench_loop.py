@@ -0,0 +1,76 @@
+"""
+asyncio vs uvloop on a scheduler-shaped workload: several concurrent
+clients doing small JSON request/response round trips over local TCP
+(what the AMQP and Postgres drivers spend their time on), plus a burst of
+short-lived tasks.
+
+Example usages
+--------------
+$ python src/scripts/bench_loop.py
+$ python src/scripts/bench_loop.py --clients 32 --messages 5000
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import time
+
+
+async def _echo(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+    while line := await reader.readline():
+        evt = json.loads(line)
+        evt["ack"] = True
+        writer.write(json.dumps(evt).encode() + b"\n")
+        await writer.drain()
+    writer.close()
+
+
+async def _client(port: int, messages: int):
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    for i in range(messages):
+        writer.write(json.dumps({"id": i, "job_type": "bench", "payload": {}}).encode() + b"\n")
+        await writer.drain()
+        await reader.readline()
+    writer.close()
+
+
+async def _workload(clients: int, messages: int) -> tuple[float, float]:
+    server = await asyncio.start_server(_echo, "127.0.0.1", 0)
+    port = server.sockets[0].getsockname()[1]
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(_client(port, messages) for _ in range(clients)))
+    rtt_rate = clients * messages / (time.perf_counter() - t0)
+
+    async def tick():
+        await asyncio.sleep(0)
+    t0 = time.perf_counter()
+    await asyncio.gather(*(tick() for _ in range(100_000)))
+    task_rate = 100_000 / (time.perf_counter() - t0)
+
+    server.close()
+    await server.wait_closed()
+    return rtt_rate, task_rate
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Compare asyncio and uvloop event loops")
+    ap.add_argument("--clients", type=int, default=16)
+    ap.add_argument("--messages", type=int, default=2000)
+    args = ap.parse_args()
+
+    loops = [("asyncio", None)]
+    try:
+        import uvloop
+        loops.append(("uvloop", uvloop.new_event_loop))
+    except ImportError:
+        print("uvloop not installed – only measuring the default loop")
+
+    for name, factory in loops:
+        rtt, tasks = asyncio.run(_workload(args.clients, args.messages), loop_factory=factory)
+        print(f"{name:<8} round trips {rtt:>10,.0f}/s   tasks {tasks:>10,.0f}/s")
+
+
+if __name__ == "__main__":
+    main()
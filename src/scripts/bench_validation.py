@@ -0,0 +1,92 @@
+"""
+Micro-benchmark of ScheduleRequest validation: the previous hand-rolled
+path (json.loads → dict access → isoparse → uncached rrulestr) against
+`Job.from_request_json` (pydantic-core from bytes + cached rule parsing).
+
+Example usages
+--------------
+$ python src/scripts/bench_validation.py
+$ python src/scripts/bench_validation.py -n 200000 --rrule-share 0.5
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import random
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+
+from dateutil.parser import isoparse
+from dateutil.rrule import rrulestr
+
+from models import Job, ScheduleSpec
+
+RULES = [
+    "DTSTART:20250101T090000Z\nRRULE:FREQ=DAILY;BYHOUR=9;BYMINUTE=0",
+    "DTSTART:20250101T000000Z\nRRULE:FREQ=WEEKLY;BYDAY=MO,WE,FR",
+    "DTSTART:20250101T000000Z\nRRULE:FREQ=MONTHLY;BYMONTHDAY=1",
+    "DTSTART:20250101T000000Z\nRRULE:FREQ=HOURLY;INTERVAL=6",
+]
+
+
+def _bodies(n: int, rrule_share: float) -> list[bytes]:
+    base = datetime.now(timezone.utc) + timedelta(days=1)
+    out = []
+    for i in range(n):
+        schedule = (
+            {"rrule": random.choice(RULES)}
+            if random.random() < rrule_share
+            else {"at": (base + timedelta(seconds=i)).isoformat()}
+        )
+        out.append(json.dumps({
+            "id": str(uuid.uuid4()),
+            "job_type": "notification",
+            "payload": {"user_id": i},
+            "schedule": schedule,
+        }).encode())
+    return out
+
+
+def _legacy(body: bytes) -> Job:
+    """The pre-pydantic Job.from_request_event, verbatim apart from the decode."""
+    evt = json.loads(body)
+    jid = uuid.UUID(evt["id"])
+    schedule = evt["schedule"]
+    at = isoparse(schedule["at"]).astimezone(timezone.utc) if "at" in schedule else None
+    rrule = schedule.get("rrule")
+    spec = ScheduleSpec(at=at, rrule=rrule)
+    now = datetime.now(timezone.utc)
+    if at:
+        next_time = at if at > now else None
+    else:
+        next_time = rrulestr(rrule, forceset=True).after(now, inc=True)
+    if next_time is None:
+        raise ValueError("Schedule is already in the past")
+    return Job(id=jid, job_type=evt["job_type"], payload=evt.get("payload", {}),
+               spec=spec, next_run_at=next_time)
+
+
+def _time(fn, bodies) -> float:
+    t0 = time.perf_counter()
+    for b in bodies:
+        fn(b)
+    return len(bodies) / (time.perf_counter() - t0)
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="ScheduleRequest validation throughput")
+    ap.add_argument("-n", "--count", type=int, default=50_000)
+    ap.add_argument("--rrule-share", type=float, default=0.2,
+                    help="fraction of requests carrying an RRULE (default: 0.2)")
+    args = ap.parse_args()
+
+    bodies = _bodies(args.count, args.rrule_share)
+    legacy = _time(_legacy, bodies)
+    fast = _time(Job.from_request_json, bodies)
+    print(f"legacy  {legacy:>10,.0f} msg/s")
+    print(f"pydantic{fast:>10,.0f} msg/s   ({fast / legacy:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
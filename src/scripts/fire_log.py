@@ -0,0 +1,113 @@
+"""
+Fire-log audit: lateness percentiles per job_type over a time window, and
+manual partition upkeep (the producer normally does this itself).
+
+Reads from the configured store (STORE_BACKEND / PG_DSN / POLL_DB_URL);
+needs FIRE_LOG_ENABLED on the producers to have anything to read.
+
+Example usages
+--------------
+$ python src/scripts/fire_log.py lateness --since 24h
+$ python src/scripts/fire_log.py lateness --since 7d --until 6d --job-type reminder -p 50,99,99.9
+$ python src/scripts/fire_log.py lateness --since 1h --format json | jq '.[] | select(.p99 > 5)'
+$ python src/scripts/fire_log.py maintain --retention-days 30
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import sys
+from datetime import timedelta
+
+from clock import now
+from config import settings
+from store import open_store
+
+_UNITS = {"s": 1, "m": 60, "h": 3600, "d": 86400, "w": 604800}
+
+
+def duration(text: str) -> timedelta:
+    """'90s', '15m', '24h', '7d', '2w'."""
+    try:
+        return timedelta(seconds=float(text[:-1]) * _UNITS[text[-1]])
+    except (KeyError, ValueError, IndexError):
+        raise argparse.ArgumentTypeError(f"bad duration {text!r} (e.g. 30m, 24h, 7d)")
+
+
+def percentiles(text: str) -> list[float]:
+    """'50,90,99' → [0.5, 0.9, 0.99]."""
+    try:
+        values = [float(p) / 100 for p in text.split(",")]
+    except ValueError:
+        values = []
+    if not values or not all(0 <= p <= 1 for p in values):
+        raise argparse.ArgumentTypeError(f"bad percentiles {text!r} (e.g. 50,90,99)")
+    return values
+
+
+def _label(p: float) -> str:
+    return f"p{p * 100:g}"
+
+
+async def lateness(args) -> None:
+    end = now()
+    since, until = end - args.since, end - args.until
+    store = await open_store(settings, roles=("ingest",))
+    try:
+        rows = await store.fire_lateness(since, until, job_type=args.job_type,
+                                         percentiles=args.percentiles)
+    finally:
+        await store.close()
+
+    names = [_label(p) for p in args.percentiles]
+    if args.format == "json":
+        json.dump([{"job_type": jt, "fires": n, **dict(zip(names, pct)), "max": worst}
+                   for jt, n, pct, worst in rows], sys.stdout)
+        return
+    print(f"window  {since.isoformat()} → {until.isoformat()}  (lateness in seconds)")
+    print(f"{'job_type':<24} {'fires':>12} " + " ".join(f"{n:>9}" for n in names) + f" {'max':>9}")
+    for jt, n, pct, worst in rows:
+        print(f"{jt or '(all)':<24} {n:>12,} " + " ".join(f"{v:>9.3f}" for v in pct)
+              + f" {worst:>9.3f}")
+
+
+async def maintain(args) -> None:
+    today = now().date()
+    store = await open_store(settings, roles=("firelog",))
+    try:
+        created = await store.ensure_fire_log_partitions(today, args.ahead + 1)
+        dropped = (await store.prune_fire_log(today - timedelta(days=args.retention_days))
+                   if args.retention_days > 0 else 0)
+    finally:
+        await store.close()
+    print(f"created {len(created)} partitions {' '.join(created)}".rstrip())
+    print(f"dropped {dropped} days older than {args.retention_days} days")
+
+
+async def main(argv: list[str] | None = None) -> None:
+    ap = argparse.ArgumentParser(description="Audit the fire log")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+
+    lat = sub.add_parser("lateness", help="fired_at − due_at percentiles per job_type")
+    lat.add_argument("--since", type=duration, default=timedelta(hours=1),
+                     help="Window start, this long ago")
+    lat.add_argument("--until", type=duration, default=timedelta(0),
+                     help="Window end, this long ago (default now)")
+    lat.add_argument("--job-type")
+    lat.add_argument("-p", "--percentiles", type=percentiles, default=[0.5, 0.9, 0.99])
+    lat.add_argument("--format", choices=("table", "json"), default="table")
+
+    mnt = sub.add_parser("maintain", help="Create upcoming partitions, drop expired ones")
+    mnt.add_argument("--retention-days", type=int, default=settings.FIRE_LOG_RETENTION_DAYS)
+    mnt.add_argument("--ahead", type=int, default=settings.FIRE_LOG_PARTITIONS_AHEAD)
+    args = ap.parse_args(argv)
+
+    if args.cmd == "lateness":
+        await lateness(args)
+    else:
+        await maintain(args)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -60,7 +60,8 @@ async def _run() -> None:
     except json.JSONDecodeError as exc:
         raise SystemExit(f"--payload is not valid JSON: {exc}") from None
 
-    cfg = AMQPConfig(args.rabbit_url)
+    cfg = AMQPConfig(args.rabbit_url, due_routing=settings.DUE_ROUTING,
+                     due_shards=settings.DUE_SHARDS, due_types=tuple(settings.DUE_TYPES))
 
     async with open_connection(cfg) as conn:
         # make sure exchange + queue exist (noop if already declared)
@@ -78,8 +79,8 @@ async def _run() -> None:
                 "fired_at": now().isoformat(),
                 "attempt": 1,
             }
-            # routing-key ⟶ schedule.events → "due"
-            await pub.publish("due", evt)
+            # routing-key ⟶ schedule.events → "due" (or "due.<job_type>", see DUE_ROUTING)
+            await pub.publish(cfg.due_routing_key(args.job_type), evt, message_id=evt["id"])
             LOG.info("sent %s (%d/%d)", evt["id"], i + 1, args.count)
 
         await ch.close()
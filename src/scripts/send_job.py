@@ -47,6 +47,8 @@ async def main(argv: list[str] | None = None):
     g.add_argument("--delay", type=int, help="Fire N seconds from now")
     g.add_argument("--at", help="Absolute UTC timestamp, ISO-8601, e.g. 2025-07-10T12:00:00Z")
     g.add_argument("--rrule", help="RFC-5545 RRULE string, e.g. FREQ=MINUTELY")
+    parser.add_argument("--batch", type=int, default=0,
+                        help="Send N requests in one 'request.batch' envelope")
     args = parser.parse_args(argv)
 
     try:
@@ -54,13 +56,16 @@ async def main(argv: list[str] | None = None):
     except json.JSONDecodeError as e:
         sys.exit(f"Invalid JSON for --payload: {e}")
 
-    event = build_event(
-        args.job_type,
-        payload_dict,
-        at=args.at,
-        rrule=args.rrule,
-        delay=args.delay,
-    )
+    events = [
+        build_event(
+            args.job_type,
+            payload_dict,
+            at=args.at,
+            rrule=args.rrule,
+            delay=args.delay,
+        )
+        for _ in range(max(args.batch, 1))
+    ]
 
     cfg = AMQPConfig(args.rabbit)
 
@@ -70,8 +75,12 @@ async def main(argv: list[str] | None = None):
         ch = await conn.channel()
         pub = JSONPublisher(ch, cfg.cmd_ex)
         await pub.init()
-        await pub.publish("request", event)
-        print("Sent:\n", json.dumps(event, indent=2))
+        if args.batch:
+            await pub.publish("request.batch", events)
+            print(f"Sent batch of {len(events)} requests")
+        else:
+            await pub.publish("request", events[0])
+            print("Sent:\n", json.dumps(events[0], indent=2))
 
     await conn.close()
 
@@ -87,5 +96,9 @@ python scripts/send_job.py \
     --payload '{"user_id": 1}' \
     --delay 5
 
+python scripts/send_job.py \
+    --job-type notification \
+    --delay 30 \
+    --batch 1000
 
 """
@@ -0,0 +1,492 @@
+"""
+Embedded SQLite `JobStore` for edge and single-node deployments.
+
+Every statement runs on one dedicated writer thread that owns the only
+connection (WAL mode).  Operations queued while a commit is in flight are
+grouped into the next transaction, so many small inserts share one fsync.
+Each operation runs inside its own SAVEPOINT: a failing one is rolled back
+without poisoning the rest of the group.
+"""
+from __future__ import annotations
+
+import asyncio
+import json
+import queue
+import sqlite3
+import threading
+import uuid
+from concurrent.futures import Future
+from datetime import date, datetime, timedelta, timezone
+from typing import Any, AsyncIterator, Callable, Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+from clock import now as clock_now
+from models import DueJob, FireRecord, Job, JobUpdate
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id          TEXT    PRIMARY KEY,
+    job_type    TEXT    NOT NULL,
+    payload     TEXT    NOT NULL,
+    rrule       TEXT,                         -- NULL when one-shot
+    next_run_at INTEGER NOT NULL,             -- µs since epoch, UTC
+    retries     INTEGER NOT NULL DEFAULT 0,
+    status      TEXT    NOT NULL DEFAULT 'pending',
+    created_at  INTEGER NOT NULL,
+    tags        TEXT    NOT NULL DEFAULT '{}',
+    trace_id    TEXT,
+    version     INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS jobs_pending_idx
+    ON jobs (next_run_at) WHERE status = 'pending';
+CREATE INDEX IF NOT EXISTS jobs_pending_keyset_idx
+    ON jobs (next_run_at, id) WHERE status = 'pending';
+CREATE TABLE IF NOT EXISTS delay_tombstones (
+    id          TEXT    PRIMARY KEY,
+    expires_at  INTEGER NOT NULL              -- µs since epoch, UTC
+);
+CREATE TABLE IF NOT EXISTS delay_markers (
+    id          TEXT    PRIMARY KEY,
+    expires_at  INTEGER NOT NULL,             -- µs since epoch, UTC
+    confirmed   INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS job_fire_log (     -- one table; retention deletes by day
+    fired_at    INTEGER NOT NULL,             -- µs since epoch, UTC
+    job_id      TEXT    NOT NULL,
+    job_type    TEXT    NOT NULL,
+    due_at      INTEGER NOT NULL,
+    attempt     INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS job_fire_log_fired_idx ON job_fire_log (fired_at);
+"""
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+_US = timedelta(microseconds=1)
+
+
+def _to_us(dt: datetime) -> int:
+    return (dt - _EPOCH) // _US
+
+
+def _from_us(us: int) -> datetime:
+    return _EPOCH + timedelta(microseconds=us)
+
+
+def _percentile(ordered: Sequence[float], p: float) -> float:
+    """Linear interpolation between closest ranks, like Postgres' percentile_cont."""
+    pos = p * (len(ordered) - 1)
+    lo = int(pos)
+    hi = min(lo + 1, len(ordered) - 1)
+    return ordered[lo] + (ordered[hi] - ordered[lo]) * (pos - lo)
+
+
+def _path_from_url(url: str) -> str:
+    """Accept SQLAlchemy style `sqlite+pysqlite:///foo.db` or a bare path."""
+    if "://" not in url:
+        return url
+    path = url.split("://", 1)[1]
+    return path[1:] if path.startswith("/") else path or ":memory:"
+
+
+class _Writer(threading.Thread):
+    """Single thread that owns the connection and batches commits."""
+
+    def __init__(self, path: str, *, max_group: int = 512):
+        super().__init__(name="sqlite-writer", daemon=True)
+        self._path = path
+        self._max_group = max_group
+        self._q: queue.SimpleQueue = queue.SimpleQueue()
+        self._ready = threading.Event()
+        self._conn: sqlite3.Connection | None = None
+        self._error: BaseException | None = None    # startup failure, raised by create()
+
+    def submit(self, fn: Callable[[sqlite3.Connection], Any]) -> Future:
+        fut: Future = Future()
+        self._q.put((fn, fut))
+        return fut
+
+    def shutdown(self) -> None:
+        self._q.put(None)
+        self.join()
+
+    def run(self) -> None:
+        conn = None
+        try:
+            conn = sqlite3.connect(self._path, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(SCHEMA)
+        except BaseException as exc:
+            self._error = exc
+            if conn is not None:
+                conn.close()
+            return
+        finally:
+            self._ready.set()
+        self._conn = conn
+
+        stopping = False
+        while not stopping:
+            item = self._q.get()
+            if item is None:
+                break
+            group = [item]
+            while len(group) < self._max_group:
+                try:
+                    item = self._q.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                group.append(item)
+            self._run_group(conn, group)
+        conn.close()
+
+    @staticmethod
+    def _run_group(conn: sqlite3.Connection, group) -> None:
+        outcomes = []
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            for fn, fut in group:
+                conn.execute("SAVEPOINT op")
+                try:
+                    res = fn(conn)
+                except BaseException as exc:
+                    conn.execute("ROLLBACK TO op")
+                    outcomes.append((fut, None, exc))
+                else:
+                    outcomes.append((fut, res, None))
+                conn.execute("RELEASE op")
+            conn.execute("COMMIT")
+        except BaseException as exc:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            for _, fut in group:
+                fut.set_exception(exc)
+            return
+        # results are only handed out once they are durable
+        for fut, res, exc in outcomes:
+            if exc is not None:
+                fut.set_exception(exc)
+            else:
+                fut.set_result(res)
+
+
+class SQLiteJobStore:
+    """`JobStore` over an embedded SQLite database."""
+
+    def __init__(self, writer: _Writer):
+        self._w = writer
+
+    @classmethod
+    async def create(cls, url: str, *, max_group: int = 512) -> "SQLiteJobStore":
+        """Factory"""
+        writer = _Writer(_path_from_url(url), max_group=max_group)
+        writer.start()
+        await asyncio.to_thread(writer._ready.wait)
+        if writer._error is not None:
+            raise writer._error
+        return cls(writer)
+
+    async def close(self) -> None:
+        await asyncio.to_thread(self._w.shutdown)
+
+    async def ping(self) -> bool:
+        return await self._call(lambda c: c.execute("SELECT 1;").fetchone()[0] == 1)
+
+    async def db_now(self) -> datetime:
+        """An embedded database shares the host clock."""
+        return datetime.now(timezone.utc)
+
+    async def _call(self, fn: Callable[[sqlite3.Connection], Any]) -> Any:
+        return await asyncio.wrap_future(self._w.submit(fn))
+
+    # Helpers --------------------------------------------------
+    @staticmethod
+    def _job_params(job: Job) -> tuple:
+        return (
+            str(job.id),
+            job.job_type,
+            json.dumps(job.payload),
+            job.spec.rrule,
+            _to_us(job.next_run_at),
+            _to_us(job.created_at),
+            json.dumps(job.tags),
+            job.trace_id,
+        )
+
+    @staticmethod
+    def _selector_sql(selector: Dict[str, str]) -> Tuple[str, List[str]]:
+        where, params = [], []
+        for k, v in selector.items():
+            where.append("json_extract(tags, ?) = ?")
+            params += ['$."%s"' % k.replace('"', '\\"'), v]
+        return " AND ".join(where) or "1", params
+
+    # CRUD -----------------------------------------------------
+    # a request whose cancel overtook it (tombstone) lands cancelled; the id is bound twice
+    _INSERT = """
+    INSERT OR IGNORE INTO jobs
+        (id, job_type, payload, rrule, next_run_at, created_at, tags, trace_id, status)
+    VALUES (?,?,?,?,?,?,?,?,
+            CASE WHEN EXISTS (SELECT 1 FROM delay_tombstones WHERE id = ?)
+                 THEN 'cancelled' ELSE 'pending' END);
+    """
+
+    async def insert_job(self, job: Job) -> bool:
+        params = self._job_params(job) + (str(job.id),)
+        return await self._call(lambda c: c.execute(self._INSERT, params).rowcount == 1)
+
+    async def insert_jobs(self, jobs: Sequence[Job]) -> Set[uuid.UUID]:
+        rows = [(job.id, self._job_params(job) + (str(job.id),)) for job in jobs]
+
+        def op(c: sqlite3.Connection) -> Set[uuid.UUID]:
+            return {jid for jid, params in rows if c.execute(self._INSERT, params).rowcount == 1}
+        return await self._call(op) if rows else set()
+
+    async def cancel_job(self, job_id: uuid.UUID) -> int:
+        q = "UPDATE jobs SET status='cancelled' WHERE id=? AND status='pending';"
+        return await self._call(lambda c: c.execute(q, (str(job_id),)).rowcount)
+
+    async def cancel_jobs(self, job_ids: Iterable[uuid.UUID]) -> Set[uuid.UUID]:
+        ids = list(job_ids)
+        q = "UPDATE jobs SET status='cancelled' WHERE id=? AND status='pending';"
+
+        def op(c: sqlite3.Connection) -> Set[uuid.UUID]:
+            return {jid for jid in ids if c.execute(q, (str(jid),)).rowcount == 1}
+        return await self._call(op) if ids else set()
+
+    async def update_jobs(
+        self, updates: Sequence[JobUpdate]
+    ) -> Tuple[Dict[uuid.UUID, int], Set[uuid.UUID]]:
+        def op(c: sqlite3.Connection) -> Tuple[Dict[uuid.UUID, int], Set[uuid.UUID]]:
+            applied: Dict[uuid.UUID, int] = {}
+            conflicts: Set[uuid.UUID] = set()
+            for u in updates:
+                sets, params = ["version = version + 1"], []
+                if u.spec is not None:
+                    sets += ["next_run_at = ?", "rrule = ?"]
+                    params += [_to_us(u.next_run_at), u.spec.rrule]
+                if u.payload is not None:
+                    sets.append("payload = ?")
+                    params.append(json.dumps(u.payload))
+                if u.tags is not None:
+                    sets.append("tags = ?")
+                    params.append(json.dumps(u.tags))
+                row = c.execute(
+                    f"""
+                    UPDATE jobs SET {', '.join(sets)}
+                    WHERE id = ? AND status = 'pending' AND (? IS NULL OR version = ?)
+                    RETURNING version;
+                    """,
+                    (*params, str(u.id), u.version, u.version),
+                ).fetchone()
+                if row is not None:
+                    applied[u.id] = row[0]
+                elif u.version is not None and c.execute(
+                        "SELECT 1 FROM jobs WHERE id = ? AND status = 'pending';",
+                        (str(u.id),)).fetchone():
+                    conflicts.add(u.id)
+            return applied, conflicts
+        return await self._call(op) if updates else ({}, set())
+
+    async def add_tombstones(self, job_ids: Iterable[uuid.UUID], *, expires_at: datetime) -> None:
+        rows = [(str(jid), _to_us(expires_at)) for jid in job_ids]
+
+        def op(c: sqlite3.Connection) -> None:
+            c.execute("DELETE FROM delay_tombstones WHERE expires_at < ?;", (_to_us(clock_now()),))
+            c.executemany("INSERT OR REPLACE INTO delay_tombstones (id, expires_at) VALUES (?, ?);",
+                          rows)
+        if rows:
+            await self._call(op)
+
+    async def take_tombstones(self, job_ids: Iterable[uuid.UUID]) -> Set[uuid.UUID]:
+        ids = list(job_ids)
+        q = "DELETE FROM delay_tombstones WHERE id = ?;"
+
+        def op(c: sqlite3.Connection) -> Set[uuid.UUID]:
+            return {jid for jid in ids if c.execute(q, (str(jid),)).rowcount == 1}
+        return await self._call(op) if ids else set()
+
+    async def add_delay_markers(
+        self, job_ids: Iterable[uuid.UUID], *, expires_at: datetime
+    ) -> Tuple[Set[uuid.UUID], Set[uuid.UUID]]:
+        ids = list(job_ids)
+        insert = "INSERT OR IGNORE INTO delay_markers (id, expires_at) VALUES (?, ?);"
+        select = "SELECT confirmed FROM delay_markers WHERE id = ?;"
+
+        def op(c: sqlite3.Connection) -> Tuple[Set[uuid.UUID], Set[uuid.UUID]]:
+            c.execute("DELETE FROM delay_markers WHERE expires_at < ?;", (_to_us(clock_now()),))
+            added, confirmed = set(), set()
+            for jid in ids:
+                if c.execute(insert, (str(jid), _to_us(expires_at))).rowcount == 1:
+                    added.add(jid)
+                elif c.execute(select, (str(jid),)).fetchone()[0]:
+                    confirmed.add(jid)
+            return added, confirmed
+        return await self._call(op) if ids else (set(), set())
+
+    async def confirm_delay_markers(self, job_ids: Iterable[uuid.UUID]) -> None:
+        rows = [(str(jid),) for jid in job_ids]
+        q = "UPDATE delay_markers SET confirmed = 1 WHERE id = ?;"
+        if rows:
+            await self._call(lambda c: c.executemany(q, rows))
+
+    async def find_by_selector(
+        self, selector: Dict[str, str], *, limit: int = 1000
+    ) -> List[uuid.UUID]:
+        where, params = self._selector_sql(selector)
+        q = f"SELECT id FROM jobs WHERE status='pending' AND {where} LIMIT ?;"
+        rows = await self._call(lambda c: c.execute(q, (*params, limit)).fetchall())
+        return [uuid.UUID(r[0]) for r in rows]
+
+    async def cancel_by_selector(
+        self, selector: Dict[str, str], *, chunk: int = 1000
+    ) -> AsyncIterator[int]:
+        where, params = self._selector_sql(selector)
+        q = f"""
+        UPDATE jobs SET status='cancelled'
+        WHERE id IN (SELECT id FROM jobs WHERE status='pending' AND {where} LIMIT ?);
+        """
+        total = 0
+        while True:
+            n = await self._call(lambda c: c.execute(q, (*params, chunk)).rowcount)
+            if not n:
+                break
+            total += n
+            yield total
+        if not total:
+            yield 0
+
+    async def fire_groups(
+        self, *, until: datetime, bucket_s: int = 60
+    ) -> AsyncIterator[Tuple[str, Optional[str], datetime, int]]:
+        step = bucket_s * 1_000_000
+        q = """
+        SELECT job_type, rrule,
+               CASE WHEN rrule IS NULL THEN (next_run_at / ?) * ? ELSE next_run_at END AS at,
+               count(*)
+        FROM   jobs
+        WHERE  status = 'pending' AND next_run_at < ?
+        GROUP  BY 1, 2, 3
+        ORDER  BY 2;
+        """
+        rows = await self._call(lambda c: c.execute(q, (step, step, _to_us(until))).fetchall())
+        for job_type, rule, at, n in rows:
+            yield job_type, rule, _from_us(at), n
+
+    async def recent_job_ids(self, since: datetime) -> List[uuid.UUID]:
+        q = "SELECT id FROM jobs WHERE created_at >= ?;"
+        rows = await self._call(lambda c: c.execute(q, (_to_us(since),)).fetchall())
+        return [uuid.UUID(r[0]) for r in rows]
+
+    async def lock_due_jobs(
+        self,
+        *,
+        now: datetime | None = None,
+        limit: int = 500,
+        after: Tuple[datetime, uuid.UUID] | None = None,
+    ) -> Sequence[DueJob]:
+        """Single writer: no row locks needed, the claim is a plain SELECT."""
+        args: Tuple[Any, ...] = (_to_us(now or clock_now()),)
+        keyset = ""
+        if after is not None:
+            keyset = "AND (next_run_at, id) > (?, ?)"
+            args += (_to_us(after[0]), str(after[1]))
+        q = f"""
+        SELECT id, job_type, rrule, next_run_at, retries, trace_id, version, payload
+        FROM   jobs
+        WHERE  status = 'pending' AND next_run_at <= ? {keyset}
+        ORDER  BY next_run_at, id
+        LIMIT  ?;
+        """
+        rows = await self._call(lambda c: c.execute(q, (*args, limit)).fetchall())
+        return [DueJob(uuid.UUID(jid), job_type, rrule, _from_us(nxt), retries, trace_id,
+                       version, json.loads(payload))
+                for jid, job_type, rrule, nxt, retries, trace_id, version, payload in rows]
+
+    async def count_overdue(self, *, now: datetime | None = None,
+                            cap: int | None = None) -> int:
+        q = """
+        SELECT count(*) FROM (
+            SELECT 1 FROM jobs WHERE status = 'pending' AND next_run_at <= ? LIMIT ?
+        );
+        """
+        args = (_to_us(now or clock_now()), -1 if cap is None else cap)
+        return await self._call(lambda c: c.execute(q, args).fetchone()[0])
+
+    async def finalize_batch(
+        self,
+        rescheduled: Sequence[Tuple[DueJob, datetime]],
+        done: Sequence[DueJob],
+    ) -> int:
+        resched = [(_to_us(nxt), job.retries, str(job.id), _to_us(job.next_run_at))
+                   for job, nxt in rescheduled]
+        finished = [(str(job.id), _to_us(job.next_run_at)) for job in done]
+
+        def op(c: sqlite3.Connection) -> int:
+            applied = c.executemany(
+                "UPDATE jobs SET next_run_at=?, retries=? WHERE id=? AND next_run_at=?;",
+                resched).rowcount
+            applied += c.executemany(
+                "UPDATE jobs SET status='done' WHERE id=? AND next_run_at=?;", finished).rowcount
+            return len(resched) + len(finished) - applied
+        return await self._call(op)
+
+    async def load_payloads(self, jobs: Sequence[DueJob]) -> None:
+        """Claimed rows already carry their payload here (no TOAST to avoid)."""
+        missing = [j for j in jobs if j.payload is None]
+        if not missing:
+            return
+        ids = [str(j.id) for j in missing]
+        q = f"SELECT id, payload FROM jobs WHERE id IN ({','.join('?' * len(ids))});"
+        rows = dict(await self._call(lambda c: c.execute(q, ids).fetchall()))
+        for job in missing:
+            job.payload = json.loads(rows.get(str(job.id), "{}"))
+
+    async def earliest_due(self) -> Optional[datetime]:
+        q = "SELECT min(next_run_at) FROM jobs WHERE status='pending';"
+        us = await self._call(lambda c: c.execute(q).fetchone()[0])
+        return None if us is None else _from_us(us)
+
+    # Fire log -------------------------------------------------
+    async def write_fire_log(self, records: Sequence[FireRecord]) -> None:
+        rows = [(_to_us(r.fired_at), str(r.job_id), r.job_type, _to_us(r.due_at), r.attempt)
+                for r in records]
+        q = "INSERT INTO job_fire_log VALUES (?,?,?,?,?);"
+        await self._call(lambda c: c.executemany(q, rows))
+
+    async def ensure_fire_log_partitions(self, first: date, days: int) -> List[str]:
+        """No partitions here: one table serves every day."""
+        return []
+
+    async def prune_fire_log(self, before: date) -> int:
+        """Delete fires before `before`; returns how many days held any."""
+        cutoff = _to_us(datetime(before.year, before.month, before.day, tzinfo=timezone.utc))
+        day_us = 86_400_000_000
+
+        def op(c: sqlite3.Connection) -> int:
+            days = c.execute("SELECT count(DISTINCT fired_at / ?) FROM job_fire_log "
+                             "WHERE fired_at < ?;", (day_us, cutoff)).fetchone()[0]
+            c.execute("DELETE FROM job_fire_log WHERE fired_at < ?;", (cutoff,))
+            return days
+        return await self._call(op)
+
+    async def fire_lateness(
+        self, since: datetime, until: datetime, *, job_type: Optional[str] = None,
+        percentiles: Sequence[float] = (0.5, 0.9, 0.99),
+    ) -> List[Tuple[Optional[str], int, List[float], float]]:
+        q = ("SELECT job_type, (fired_at - due_at) / 1e6 FROM job_fire_log "
+             "WHERE fired_at >= ? AND fired_at < ? AND (? IS NULL OR job_type = ?);")
+        rows = await self._call(lambda c: c.execute(
+            q, (_to_us(since), _to_us(until), job_type, job_type)).fetchall())
+        groups: Dict[Optional[str], List[float]] = {}
+        for jt, lateness in rows:
+            groups.setdefault(jt, []).append(lateness)
+        if rows:
+            groups[None] = [lateness for _, lateness in rows]
+        out = []
+        for jt in sorted(groups, key=lambda t: (t is None, t or "")):
+            ordered = sorted(groups[jt])
+            out.append((jt, len(ordered), [_percentile(ordered, p) for p in percentiles], ordered[-1]))
+        return out
@@ -0,0 +1,97 @@
+"""
+Storage abstraction shared by the consumer and the producer.
+
+`JobRepo` (asyncpg / Postgres) and `SQLiteJobStore` (embedded, WAL) both
+satisfy `JobStore`; `open_store()` picks one from `config.Settings`.
+"""
+from __future__ import annotations
+
+import uuid
+from datetime import date, datetime
+from typing import AsyncIterator, Dict, Iterable, List, Optional, Protocol, Sequence, Set, Tuple
+
+from models import DueJob, FireRecord, Job, JobUpdate
+
+
+class JobStore(Protocol):
+    # Ingest ---------------------------------------------------
+    async def insert_job(self, job: Job) -> bool: ...
+    async def insert_jobs(self, jobs: Sequence[Job]) -> Set[uuid.UUID]: ...
+    async def recent_job_ids(self, since: datetime) -> List[uuid.UUID]: ...
+
+    # Cancel ---------------------------------------------------
+    async def cancel_job(self, job_id: uuid.UUID) -> int: ...
+    async def cancel_jobs(self, job_ids: Iterable[uuid.UUID]) -> Set[uuid.UUID]: ...
+    def cancel_by_selector(
+        self, selector: Dict[str, str], *, chunk: int = 1000
+    ) -> AsyncIterator[int]: ...
+
+    # Delay-tier cancels (jobs that never had a row) -----------
+    async def add_tombstones(self, job_ids: Iterable[uuid.UUID], *, expires_at: datetime) -> None: ...
+    async def take_tombstones(self, job_ids: Iterable[uuid.UUID]) -> Set[uuid.UUID]: ...
+    async def add_delay_markers(
+        self, job_ids: Iterable[uuid.UUID], *, expires_at: datetime
+    ) -> Tuple[Set[uuid.UUID], Set[uuid.UUID]]: ...
+    async def confirm_delay_markers(self, job_ids: Iterable[uuid.UUID]) -> None: ...
+
+    # Update ---------------------------------------------------
+    async def update_jobs(
+        self, updates: Sequence[JobUpdate]
+    ) -> Tuple[Dict[uuid.UUID, int], Set[uuid.UUID]]: ...
+
+    # Claim / finalize ----------------------------------------
+    async def lock_due_jobs(
+        self,
+        *,
+        now: datetime | None = None,
+        limit: int = 500,
+        after: Tuple[datetime, uuid.UUID] | None = None,
+    ) -> Sequence[DueJob]: ...
+    async def count_overdue(self, *, now: datetime | None = None,
+                            cap: int | None = None) -> int: ...
+    async def load_payloads(self, jobs: Sequence[DueJob]) -> None: ...
+    async def finalize_batch(
+        self,
+        rescheduled: Sequence[Tuple[DueJob, datetime]],
+        done: Sequence[DueJob],
+    ) -> int: ...
+    async def earliest_due(self) -> Optional[datetime]: ...
+
+    # Reporting ------------------------------------------------
+    def fire_groups(
+        self, *, until: datetime, bucket_s: int = 60
+    ) -> AsyncIterator[Tuple[str, Optional[str], datetime, int]]: ...
+
+    # Fire log (see firelog.py) ----------------------------------
+    async def write_fire_log(self, records: Sequence[FireRecord]) -> None: ...
+    async def ensure_fire_log_partitions(self, first: date, days: int) -> List[str]: ...
+    async def prune_fire_log(self, before: date) -> int: ...
+    async def fire_lateness(
+        self, since: datetime, until: datetime, *, job_type: Optional[str] = None,
+        percentiles: Sequence[float] = (0.5, 0.9, 0.99),
+    ) -> List[Tuple[Optional[str], int, List[float], float]]: ...
+
+    async def db_now(self) -> datetime: ...
+    async def ping(self) -> bool: ...
+    async def close(self) -> None: ...
+
+
+async def open_store(settings, *, roles: Sequence[str] | None = None) -> JobStore:
+    """
+    Factory: `STORE_BACKEND=postgres` (default) or `sqlite`.
+    `roles` picks which Postgres pools to open (default: all of `repo.ROLES`),
+    each sized from the `PG_<ROLE>_*` settings; SQLite ignores it.
+    """
+    backend = settings.STORE_BACKEND.lower()
+    if backend == "sqlite":
+        from sqlite_store import SQLiteJobStore
+        return await SQLiteJobStore.create(settings.POLL_DB_URL)
+    if backend == "postgres":
+        from repo import ROLES, JobRepo, PoolSpec
+        return await JobRepo.create(
+            settings.PG_DSN,
+            pools={role: PoolSpec.from_settings(settings, role) for role in roles or ROLES},
+            compress_min_bytes=settings.PAYLOAD_COMPRESS_MIN_BYTES,
+            compression=settings.COMPRESSION,
+        )
+    raise ValueError(f"Unknown STORE_BACKEND {settings.STORE_BACKEND!r}")
@@ -0,0 +1,246 @@
+"""
+Minimal OpenTelemetry-style tracing: spans, W3C `traceparent` propagation
+over AMQP headers, ratio sampling and a console / NDJSON file exporter.
+
+Disabled (the default), `span()` hands back a shared no-op object, so the
+instrumentation left in hot paths costs one attribute lookup and a branch.
+
+Sampling is decided from the trace id itself (like OTel's
+TraceIdRatioBased), so the consumer and the producer agree on whether a
+trace is recorded without storing the flag on the job row.
+
+Usage:
+    with tracing.span("repo.insert_job", job_id=str(job.id)) as sp:
+        ...
+    tracing.inject(headers)                  # outgoing AMQP message
+    parent = tracing.extract(message.headers)
+"""
+from __future__ import annotations
+
+import functools
+import json
+import logging
+import os
+import time
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Any, Dict, Mapping, Optional
+
+LOG = logging.getLogger("scheduler.trace")
+
+
+@dataclass(slots=True, frozen=True)
+class SpanContext:
+    trace_id: str          # 32 lower-case hex chars
+    span_id: str           # 16 lower-case hex chars
+    sampled: bool
+
+    @property
+    def traceparent(self) -> str:
+        return f"00-{self.trace_id}-{self.span_id}-{'01' if self.sampled else '00'}"
+
+
+def parse_traceparent(value: Any) -> Optional[SpanContext]:
+    """Parse a W3C `traceparent` header; None if absent or malformed."""
+    if isinstance(value, bytes):
+        value = value.decode("ascii", "replace")
+    if not isinstance(value, str):
+        return None
+    parts = value.strip().split("-")
+    if len(parts) != 4 or len(parts[1]) != 32 or len(parts[2]) != 16:
+        return None
+    try:
+        flags = int(parts[3], 16)
+        int(parts[1], 16), int(parts[2], 16)
+    except ValueError:
+        return None
+    if parts[1] == "0" * 32:
+        return None
+    return SpanContext(parts[1], parts[2], bool(flags & 1))
+
+
+_current: ContextVar[Optional[SpanContext]] = ContextVar("scheduler_span", default=None)
+
+
+# ── Exporters ───────────────────────────────────────────────────────────────
+class ConsoleExporter:
+    def export(self, record: Dict[str, Any]) -> None:
+        LOG.info(json.dumps(record))
+
+    def close(self) -> None:
+        pass
+
+
+class FileExporter:
+    """Append finished spans as NDJSON lines, for offline analysis."""
+
+    def __init__(self, path: str):
+        self._fh = open(path, "a", buffering=1024 * 64)
+
+    def export(self, record: Dict[str, Any]) -> None:
+        self._fh.write(json.dumps(record) + "\n")
+
+    def close(self) -> None:
+        self._fh.close()
+
+
+# ── Spans ───────────────────────────────────────────────────────────────────
+class _NoopSpan:
+    """Returned when tracing is off; also stands in for unsampled spans."""
+    __slots__ = ("context",)
+
+    def __init__(self, context: Optional[SpanContext] = None):
+        self.context = context
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NOOP = _NoopSpan()
+
+
+class _UnsampledSpan(_NoopSpan):
+    """Not recorded, but still carries the context so it propagates."""
+    __slots__ = ("_token",)
+
+    def __enter__(self):
+        self._token = _current.set(self.context)
+        return self
+
+    def __exit__(self, *exc):
+        _current.reset(self._token)
+        return False
+
+
+class Span:
+    __slots__ = ("name", "context", "parent_id", "attributes",
+                 "_tracer", "_start", "_t0", "_token")
+
+    def __init__(self, tracer: "Tracer", name: str, context: SpanContext,
+                 parent_id: Optional[str], attributes: Dict[str, Any]):
+        self._tracer = tracer
+        self.name = name
+        self.context = context
+        self.parent_id = parent_id
+        self.attributes = attributes
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        self.attributes[key] = value
+
+    def __enter__(self):
+        self._start = time.time()
+        self._t0 = time.perf_counter()
+        self._token = _current.set(self.context)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        duration = time.perf_counter() - self._t0
+        _current.reset(self._token)
+        record = {
+            "name": self.name,
+            "trace_id": self.context.trace_id,
+            "span_id": self.context.span_id,
+            "parent_id": self.parent_id,
+            "start": self._start,
+            "duration_ms": round(duration * 1000, 3),
+            "status": "error" if exc_type else "ok",
+            "attributes": self.attributes,
+        }
+        if exc_type:
+            record["error"] = repr(exc)
+        self._tracer.exporter.export(record)
+        return False
+
+
+class Tracer:
+    def __init__(self, *, enabled: bool = False, ratio: float = 1.0, exporter=None):
+        self.enabled = enabled
+        self.ratio = ratio
+        self.exporter = exporter or ConsoleExporter()
+        self._bound = int(ratio * (1 << 64))
+
+    def _sample(self, trace_id: str) -> bool:
+        return int(trace_id[16:], 16) < self._bound
+
+    def span(self, name: str, *, parent: Optional[SpanContext] = None,
+             trace_id: Optional[str] = None, **attributes: Any):
+        """
+        Child of `parent`, else of the current span, else a new root.
+        `trace_id` starts a new root span inside an existing trace (used when
+        the only thing we have is the trace id stored on a job row).
+        """
+        if not self.enabled:
+            return _NOOP
+        parent = parent or _current.get()
+        span_id = os.urandom(8).hex()
+        if parent is not None and trace_id in (None, parent.trace_id):
+            ctx = SpanContext(parent.trace_id, span_id, parent.sampled)
+            parent_id = parent.span_id
+        else:
+            tid = trace_id or os.urandom(16).hex()
+            ctx = SpanContext(tid, span_id, self._sample(tid))
+            parent_id = None
+        if not ctx.sampled:
+            return _UnsampledSpan(ctx)
+        return Span(self, name, ctx, parent_id, attributes)
+
+
+tracer = Tracer()
+
+
+def configure(settings) -> Tracer:
+    """Install the process-wide tracer from `config.Settings`."""
+    global tracer
+    exporter = None
+    if settings.TRACE_ENABLED:
+        exporter = (FileExporter(settings.TRACE_FILE)
+                    if settings.TRACE_EXPORTER == "file" else ConsoleExporter())
+    tracer = Tracer(enabled=settings.TRACE_ENABLED,
+                    ratio=settings.TRACE_SAMPLE_RATIO, exporter=exporter)
+    return tracer
+
+
+def span(name: str, **kw: Any):
+    return tracer.span(name, **kw)
+
+
+def current() -> Optional[SpanContext]:
+    return _current.get()
+
+
+def current_trace_id() -> Optional[str]:
+    ctx = _current.get()
+    return ctx.trace_id if ctx is not None else None
+
+
+def inject(headers: Dict[str, Any]) -> Dict[str, Any]:
+    """Add `traceparent` for the current span (no-op when there is none)."""
+    ctx = _current.get()
+    if ctx is not None:
+        headers["traceparent"] = ctx.traceparent
+    return headers
+
+
+def extract(headers: Optional[Mapping[str, Any]]) -> Optional[SpanContext]:
+    if not headers:
+        return None
+    return parse_traceparent(headers.get("traceparent"))
+
+
+def traced(name: str):
+    """Decorator: run the wrapped coroutine inside `span(name)`."""
+    def deco(fn):
+        @functools.wraps(fn)
+        async def wrapper(*args, **kwargs):
+            if not tracer.enabled:
+                return await fn(*args, **kwargs)
+            with tracer.span(name):
+                return await fn(*args, **kwargs)
+        return wrapper
+    return deco
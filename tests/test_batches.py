@@ -0,0 +1,96 @@
+import asyncio
+import json
+import uuid
+from datetime import timedelta
+
+from amqp import AMQPConfig
+from clock import now
+from consumer import ConsumerService
+from sqlite_store import SQLiteJobStore
+
+
+class _Message:
+    timestamp = None
+
+    def __init__(self, rk, reply_to="client.replies"):
+        self.routing_key = rk
+        self.headers = {}
+        self.reply_to = reply_to
+        self.correlation_id = "corr-1"
+
+
+class _Channel:
+    """Stands in for the consumer's channel; records replies."""
+
+    def __init__(self):
+        self.replies = []
+        self.default_exchange = self
+
+    async def publish(self, msg, routing_key):
+        self.replies.append((routing_key, msg.correlation_id, json.loads(msg.body)))
+
+
+def _request(**over) -> dict:
+    evt = {"id": str(uuid.uuid4()), "job_type": "n", "payload": {},
+           "schedule": {"at": (now() + timedelta(seconds=30)).isoformat()}}
+    evt.update(over)
+    return evt
+
+
+async def _consumer(tmp_path):
+    store = await SQLiteJobStore.create(str(tmp_path / "jobs.db"))
+    svc = ConsumerService(store, AMQPConfig(""))
+    svc._channel = _Channel()
+    return store, svc
+
+
+def test_request_batch_reports_each_item_and_replies(tmp_path):
+    async def main():
+        store, svc = await _consumer(tmp_path)
+        try:
+            old, new, twice, cancelled = _request(), _request(), _request(), _request()
+            await svc.handle_command(_Message("request", reply_to=None),
+                                     json.dumps(old).encode())
+            await svc._handle_cancel({"id": cancelled["id"]})    # cancel overtook its request
+            bad = _request(schedule={"at": "not a time"})
+            batch = [old, new, twice, bad, twice, cancelled]
+            await svc.handle_command(_Message("request.batch"), json.dumps(batch).encode())
+
+            [(rk, corr, body)] = svc._channel.replies
+            assert (rk, corr) == ("client.replies", "corr-1")
+            results = body["results"]
+            assert results[0] == {"id": bad["id"], "status": "invalid",
+                                  "reason": results[0]["reason"], "error": results[0]["error"]}
+            assert [(r["id"], r["status"]) for r in results[1:]] == [
+                (old["id"], "duplicate"), (new["id"], "inserted"), (twice["id"], "inserted"),
+                (twice["id"], "duplicate"), (cancelled["id"], "inserted")]
+
+            claimed = await store.lock_due_jobs(now=now() + timedelta(minutes=5), limit=10)
+            assert {str(j.id) for j in claimed} == {old["id"], new["id"], twice["id"]}
+        finally:
+            await store.close()
+    asyncio.run(main())
+
+
+def test_cancel_batch_reports_each_item_and_replies(tmp_path):
+    async def main():
+        store, svc = await _consumer(tmp_path)
+        try:
+            pending = _request()
+            await svc._handle_request_batch([pending])
+            missing = str(uuid.uuid4())
+            body = json.dumps({"items": [pending["id"], {"id": missing}, "nope"]}).encode()
+            await svc.handle_command(_Message("cancel.batch"), body)
+
+            [(_, _, reply)] = svc._channel.replies
+            assert reply["results"] == [
+                {"id": "nope", "status": "invalid",
+                 "error": "ScheduleCancel item must contain valid 'id'"},
+                {"id": pending["id"], "status": "cancelled"},
+                {"id": missing, "status": "not_pending"},
+            ]
+            assert await store.lock_due_jobs(now=now() + timedelta(minutes=5)) == []
+            assert await store.cancel_jobs([uuid.UUID(pending["id"])]) == set()
+        finally:
+            await store.close()
+    asyncio.run(main())
@@ -0,0 +1,209 @@
+import asyncio
+import uuid
+from datetime import timedelta
+
+from breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, backoff
+from clock import now
+from drain import BacklogDrain
+from models import Job, ScheduleSpec
+from producer import ProducerService
+from sqlite_store import SQLiteJobStore
+
+
+class FakeClock:
+    def __init__(self):
+        self.t = 0.0
+
+    def __call__(self):
+        return self.t
+
+
+def _due_jobs(n):
+    past = now() - timedelta(minutes=1)
+    return [Job(id=uuid.uuid4(), job_type="n", payload={}, spec=ScheduleSpec(at=past),
+                next_run_at=past) for _ in range(n)]
+
+
+class _Publisher:
+    """Fails the first `failures` publishes (and probes while any remain)."""
+
+    def __init__(self, failures):
+        self.failures = failures
+        self.ids = []
+        self.probes = 0
+
+    async def publish_body(self, rk, body, *, headers=None, message_id=None):
+        if self.failures:
+            self.failures -= 1
+            raise ConnectionError("broker unreachable")
+        self.ids.append(message_id)
+
+    async def probe(self):
+        self.probes += 1
+        if self.failures:
+            self.failures -= 1
+            raise ConnectionError("broker unreachable")
+
+
+def test_backoff_is_capped_and_jittered():
+    assert backoff(0, 1, 60, rand=lambda: 0) == 0.5
+    assert backoff(3, 1, 60, rand=lambda: 1) == 8
+    assert backoff(50, 1, 60, rand=lambda: 1) == 60
+
+
+def test_breaker_opens_probes_and_closes():
+    clock = FakeClock()
+    b = CircuitBreaker("t", failure_threshold=3, reset_timeout=1, clock=clock)
+    b.failure()
+    b.failure()
+    assert b.state == CLOSED
+    b.failure()
+    assert b.state == OPEN and 0.5 <= b.retry_in() <= 1
+    clock.t += 1
+    assert b.state == HALF_OPEN
+    b.failure()                                     # failed trial: longer cool-down
+    assert b.state == OPEN and 1 <= b.retry_in() <= 2
+    clock.t += 2
+    b.success()
+    assert b.state == CLOSED and b.retry_in() == 0
+
+
+def test_open_breaker_leaves_the_batch_pending(tmp_path):
+    async def main():
+        store = await SQLiteJobStore.create(str(tmp_path / "jobs.db"))
+        await store.insert_jobs(_due_jobs(20))
+        svc = ProducerService(store, _Publisher(failures=100), lock_batch=20,
+                              breaker=CircuitBreaker("t", failure_threshold=3))
+        try:
+            assert await svc._process_batch() == 20
+            assert svc.breaker.state == OPEN
+            assert await store.count_overdue() == 20        # nothing finalized or pushed back
+            assert svc.abandoned == {"unfired": 0, "unfinalized": 0}
+        finally:
+            await store.close()
+    asyncio.run(main())
+
+
+def test_run_survives_outages_and_ramps_back(tmp_path):
+    async def main():
+        store = await SQLiteJobStore.create(str(tmp_path / "jobs.db"))
+        await store.insert_jobs(_due_jobs(40))
+        claims = []
+        lock_due_jobs = store.lock_due_jobs
+
+        async def flaky_claim(**kw):
+            claims.append(kw["limit"])
+            if len(claims) == 1:
+                raise OSError("database restarting")
+            return await lock_due_jobs(**kw)
+        store.lock_due_jobs = flaky_claim
+
+        pub = _Publisher(failures=4)                   # 2 publishes open it, 2 probes fail
+        svc = ProducerService(store, pub, lock_batch=16, tick_ms=10, retry_base=0.001,
+                              breaker=CircuitBreaker("t", failure_threshold=2,
+                                                     reset_timeout=0.001))
+        task = asyncio.create_task(svc.run())
+        try:
+            for _ in range(200):
+                if await store.count_overdue() == 0:
+                    break
+                await asyncio.sleep(0.01)
+            assert await store.count_overdue() == 0
+            assert len(set(pub.ids)) == 40 and pub.probes == 3
+            assert claims[:3] == [16, 16, 2]           # failed claim, failed batch, ramp start
+            assert claims[3:6] == [4, 8, 16]
+        finally:
+            svc.stop()
+            await task
+            await store.close()
+    asyncio.run(main())
+
+
+def test_run_survives_database_failures_when_idle_and_draining(tmp_path):
+    async def main():
+        store = await SQLiteJobStore.create(str(tmp_path / "jobs.db"))
+        calls = {"earliest_due": 0, "count_overdue": 0}
+
+        def failing_once(name, nth):
+            real = getattr(store, name)
+
+            async def call(*args, **kw):
+                calls[name] += 1
+                if calls[name] == nth:
+                    raise ConnectionError("database restarting")
+                return await real(*args, **kw)
+            setattr(store, name, call)
+        failing_once("earliest_due", 1)           # idle path
+        failing_once("count_overdue", 2)          # 1st: should_drain, 2nd: inside drain.run
+
+        svc = ProducerService(store, _Publisher(failures=0), lock_batch=4, tick_ms=10,
+                              retry_base=0.001)
+        svc.drain = BacklogDrain(svc, threshold=4, batch=4)
+        task = asyncio.create_task(svc.run())
+        try:
+            for _ in range(100):
+                if calls["earliest_due"] > 1:
+                    break
+                await asyncio.sleep(0.01)
+            assert calls["earliest_due"] > 1 and not task.done()
+            await store.insert_jobs(_due_jobs(12))
+            for _ in range(200):
+                if calls["count_overdue"] > 3 and await store.count_overdue() == 0:
+                    break
+                await asyncio.sleep(0.01)
+            assert await store.count_overdue() == 0 and not task.done()
+            assert len(set(svc.pub.ids)) == 12
+        finally:
+            svc.stop()
+            await task
+            await store.close()
+    asyncio.run(main())
+
+
+def test_job_backoff_counts_consecutive_failures_not_fires(tmp_path):
+    async def main():
+        store = await SQLiteJobStore.create(str(tmp_path / "jobs.db"))
+        await store.insert_jobs(_due_jobs(1))
+        svc = ProducerService(store, _Publisher(failures=0), retry_base=10, retry_max=1000)
+        try:
+            [job] = await store.lock_due_jobs(limit=1)
+            job.retries = 40                          # a long-running series
+            fire_job = svc._fire_job
+
+            async def broken(job):
+                raise ValueError("bad payload")
+            svc._fire_job = broken
+            for attempt in range(3):
+                rescheduled = []
+                t0 = now()
+                await svc._fire_into(job, rescheduled, [])
+                [(_, at)] = rescheduled
+                assert (at - t0).total_seconds() <= 10 * 2 ** attempt + 1
+            assert job.retries == 40 and svc._failures == {job.id: 3}
+
+            svc._fire_job = fire_job
+            await svc._fire_into(job, [], [])
+            assert svc._failures == {}
+        finally:
+            await store.close()
+    asyncio.run(main())
+
+
+def test_failure_counts_are_bounded(tmp_path):
+    async def main():
+        store = await SQLiteJobStore.create(str(tmp_path / "jobs.db"))
+        await store.insert_jobs(_due_jobs(5))
+        svc = ProducerService(store, _Publisher(failures=0), failures_max=3)
+
+        async def broken(job):
+            raise ValueError("bad payload")
+        svc._fire_job = broken
+        try:
+            jobs = await store.lock_due_jobs(limit=5)
+            for job in jobs[:3] + jobs[:1] + jobs[3:4]:    # a repeat failure is most recent
+                await svc._fire_into(job, [], [])
+            assert list(svc._failures.items()) == \
+                [(jobs[2].id, 1), (jobs[0].id, 2), (jobs[3].id, 1)]
+        finally:
+            await store.close()
+    asyncio.run(main())
@@ -0,0 +1,39 @@
+import json
+import time
+import uuid
+
+from scripts.bulk_import import COLUMNS, legacy_to_event, parse_chunk
+
+
+def _legacy(**over):
+    task = {
+        "event_id": 42,
+        "event_timestamp": time.time(),
+        "start": time.time() - 3600,
+        "repeat_for": 10_000,
+        "repeated_for": 60,
+        "unlimited": False,
+        "period": "minutes",
+        "data": {"action": "order", "user_id": 1},
+    }
+    task.update(over)
+    return task
+
+
+def test_legacy_task_maps_to_stable_recurring_event():
+    a, b = legacy_to_event(_legacy()), legacy_to_event(_legacy())
+    assert a["id"] == b["id"]
+    assert a["job_type"] == "order"
+    assert a["schedule"]["rrule"].endswith("RRULE:FREQ=MINUTELY;COUNT=10000")
+    assert "COUNT" not in legacy_to_event(_legacy(unlimited=True))["schedule"]["rrule"]
+
+
+def test_parse_chunk_mixes_formats_and_reports_rejects():
+    good = json.dumps({"id": str(uuid.uuid4()), "job_type": "n", "payload": {"blob": "x" * 4000},
+                       "schedule": {"at": "2099-01-01T00:00:00Z"}}).encode()
+    lines = [good, json.dumps(_legacy()).encode(), b"{", json.dumps(_legacy(period="eons")).encode()]
+    records, rejects = parse_chunk("ndjson", 10, lines, 1024, "deflate")
+
+    assert len(records) == 2 and all(len(r) == len(COLUMNS) for r in records)
+    assert records[0][2] is None and records[0][4] == "deflate"     # compressed payload
+    assert [(n, reason) for n, reason, _ in rejects] == [(12, "invalid_json"), (13, "invalid_field")]
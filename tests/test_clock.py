@@ -0,0 +1,64 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+import clock
+
+T0 = datetime(2030, 1, 1, tzinfo=timezone.utc)
+
+
+class FakeMono:
+    def __init__(self):
+        self.t = 100.0
+
+    def __call__(self):
+        return self.t
+
+
+def test_monotonic_clock_ignores_host_steps_and_never_goes_back():
+    mono = FakeMono()
+    c = clock.MonotonicClock(T0, mono=mono)
+    mono.t += 2
+    assert c.now() == T0 + timedelta(seconds=2)
+    c.anchor(T0)                        # a re-anchor into the past holds still…
+    mono.t += 1
+    assert c.now() == T0 + timedelta(seconds=2)
+    mono.t += 2                         # …until it catches up
+    assert c.now() == T0 + timedelta(seconds=3)
+
+
+def test_db_clock_uses_the_fastest_sample_and_reports_skew():
+    mono = FakeMono()
+    host = clock.VirtualClock(T0)
+    rtts = iter([0.5, 0.1, 0.3])
+
+    async def fetch():
+        rtt = next(rtts)
+        mono.t += rtt / 2
+        host.advance(rtt / 2)
+        db = host.now() + timedelta(seconds=5)      # server runs 5 s ahead
+        mono.t += rtt / 2
+        host.advance(rtt / 2)
+        return db
+
+    async def main():
+        c = clock.DBClock(fetch, wall=host.now, mono=mono)
+        skew = await c.sync()
+        assert skew.total_seconds() == pytest.approx(5) and c.rtt == pytest.approx(0.1)
+        assert (c.now() - host.now()).total_seconds() == pytest.approx(5)
+        mono.t += 10                                 # host wall clock steps back an hour
+        host.advance(-3600 + 10)
+        assert (c.now() - T0).total_seconds() == pytest.approx(5 + 0.9 + 10)
+    asyncio.run(main())
+
+
+def test_virtual_clock_drives_now():
+    before = clock.now()
+    with clock.using(clock.VirtualClock(T0)) as vc:
+        assert clock.now() == T0
+        vc.advance(timedelta(minutes=1))
+        assert clock.now() == T0 + timedelta(minutes=1)
+    assert clock.now() >= before
+    with clock.freeze_time(T0):
+        assert clock.now() == T0
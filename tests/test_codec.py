@@ -0,0 +1,26 @@
+import json
+import os
+
+import pytest
+
+import codec
+
+
+def test_round_trip_above_threshold():
+    data = json.dumps({"blob": "x" * 5000}).encode()
+    enc = codec.preferred()
+    packed, used = codec.maybe_compress(data, 1024, enc)
+    assert used == enc and len(packed) < len(data)
+    assert codec.decompress(packed, used) == data
+
+
+@pytest.mark.parametrize("min_bytes", [0, 10_000])
+def test_small_or_disabled_passes_through(min_bytes):
+    data = b'{"n": 1}' * 10
+    assert codec.maybe_compress(data, min_bytes, codec.DEFLATE) == (data, None)
+
+
+def test_incompressible_is_left_alone():
+    data = os.urandom(4096)
+    assert codec.maybe_compress(data, 1, codec.DEFLATE) == (data, None)
+    assert codec.decompress(data, None) == data
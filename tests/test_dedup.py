@@ -0,0 +1,45 @@
+import uuid
+
+from dedup import DedupFilter, RecentBloom, RecentIds, Verdict
+
+
+class FakeClock:
+    def __init__(self):
+        self.t = 0.0
+
+    def __call__(self):
+        return self.t
+
+
+def test_recent_ids_window_and_bound():
+    clock = FakeClock()
+    ids = RecentIds(window_s=10, max_ids=2, clock=clock)
+    a, b, c = uuid.uuid4(), uuid.uuid4(), uuid.uuid4()
+    ids.add(a)
+    ids.add(b)
+    assert ids.check(a) is Verdict.HIT
+    ids.add(c)                       # over capacity → oldest evicted
+    assert ids.check(a) is Verdict.MISS
+    clock.t = 11
+    assert ids.check(c) is Verdict.MISS
+
+
+def test_bloom_remembers_between_half_and_full_window():
+    clock = FakeClock()
+    bloom = RecentBloom(window_s=10, max_ids=1000, clock=clock)
+    jid = uuid.uuid4()
+    bloom.add(jid)
+    clock.t = 6                      # one rotation: still in previous generation
+    assert bloom.check(jid) is Verdict.MAYBE
+    clock.t = 12                     # second rotation: gone
+    assert bloom.check(jid) is Verdict.MISS
+
+
+def test_maybe_policy():
+    clock = FakeClock()
+    jid = uuid.uuid4()
+    for on_maybe, expected in (("db", False), ("skip", True)):
+        f = DedupFilter(RecentBloom(window_s=10, max_ids=100, clock=clock), on_maybe=on_maybe)
+        f.remember(jid)
+        assert f.is_duplicate(jid) is expected
+        assert f.is_duplicate(uuid.uuid4()) is False
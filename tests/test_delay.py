@@ -0,0 +1,141 @@
+import asyncio
+import json
+import uuid
+from datetime import timedelta
+
+import pytest
+
+from amqp import AMQPConfig
+from clock import now
+from consumer import ConsumerService
+from sqlite_store import SQLiteJobStore
+
+
+class _Publisher:
+    def __init__(self):
+        self.sent = []
+
+    async def publish(self, rk, payload, *, headers=None, message_id=None, expiration=None):
+        self.sent.append((rk, payload, expiration))
+
+
+def _request(delay_s: float, **over) -> dict:
+    evt = {"id": str(uuid.uuid4()), "job_type": "n", "payload": {"k": 1},
+           "schedule": {"at": (now() + timedelta(seconds=delay_s)).isoformat()}}
+    evt.update(over)
+    return evt
+
+
+def test_tier_selection():
+    cfg = AMQPConfig("", delay_tiers=(30, 5, 10))
+    assert [cfg.delay_tier_for(s) for s in (0.2, 5, 7, 30, 31)] == [5, 5, 10, 30, None]
+    assert cfg.delay_queue(10) == "schedule_delay.10s"
+    with pytest.raises(ValueError):
+        AMQPConfig("", delay_tiers=(0,))
+
+
+def test_short_one_shots_bypass_the_db_and_honour_cancels(tmp_path):
+    async def main():
+        store = await SQLiteJobStore.create(str(tmp_path / "jobs.db"))
+        svc = ConsumerService(store, AMQPConfig("", delay_tiers=(5, 30)))
+        svc._delay_pub, svc._due_pub = _Publisher(), _Publisher()
+        try:
+            short, kept = _request(7), _request(8)
+            recurring = _request(5, schedule={"rrule": "DTSTART:20250101T090000Z\nRRULE:FREQ=DAILY"})
+            batch = [short, kept, _request(3600), recurring]
+            results = {r["id"]: r["status"] for r in await svc._handle_request_batch(batch)}
+            assert [results[e["id"]] for e in batch] == ["delayed", "delayed", "inserted", "inserted"]
+            (rk, event, ttl), _ = svc._delay_pub.sent
+            assert rk == "schedule_delay.30s" and event["id"] == short["id"] and 6 < ttl <= 7
+
+            await svc._handle_cancel({"id": short["id"]})
+            for rk, event, _ in svc._delay_pub.sent:
+                await svc._handle_delayed(json.loads(json.dumps(event)))
+            (rk, due, _), = svc._due_pub.sent
+            assert (rk, due["id"], due["payload"]) == ("due", kept["id"], {"k": 1})
+        finally:
+            await store.close()
+    asyncio.run(main())
+
+
+def test_tiers_off_keeps_the_db_path(tmp_path):
+    async def main():
+        store = await SQLiteJobStore.create(str(tmp_path / "jobs.db"))
+        svc = ConsumerService(store, AMQPConfig(""))
+        try:
+            await svc._handle_request(json.dumps(_request(2)).encode())
+            assert await store.count_overdue(now=now() + timedelta(minutes=1)) == 1
+            missing = str(uuid.uuid4())
+            (result,) = await svc._handle_cancel_batch([missing])
+            assert result["status"] != "tombstoned"
+        finally:
+            await store.close()
+    asyncio.run(main())
+
+
+def test_redelivered_request_is_published_to_its_tier_once(tmp_path):
+    async def main():
+        store = await SQLiteJobStore.create(str(tmp_path / "jobs.db"))
+        svc = ConsumerService(store, AMQPConfig("", delay_tiers=(30,)))
+        svc._delay_pub = _Publisher()
+        due_soon = now() + timedelta(minutes=1)
+        try:
+            req = json.dumps(_request(5)).encode()
+            await svc._handle_request(req)
+            await svc._handle_request(req)               # redelivered after a lost ack
+            assert len(svc._delay_pub.sent) == 1
+
+            # the broker failed after the marker was written: DB path, now and on redelivery
+            failed = json.dumps(_request(5)).encode()
+            publish = svc._delay_pub.publish
+
+            async def broken(*args, **kw):
+                raise ConnectionError("broker unreachable")
+            svc._delay_pub.publish = broken
+            await svc._handle_request(failed)
+            svc._delay_pub.publish = publish
+            await svc._handle_request(failed)
+            assert len(svc._delay_pub.sent) == 1
+            assert await store.count_overdue(now=due_soon) == 1
+
+            # crashed between the marker and the publish: the redelivery is stored, not lost
+            crashed = _request(5)
+            await store.add_delay_markers([uuid.UUID(crashed["id"])], expires_at=due_soon)
+            await svc._handle_request(json.dumps(crashed).encode())
+            assert len(svc._delay_pub.sent) == 1
+            assert await store.count_overdue(now=due_soon) == 2
+        finally:
+            await store.close()
+    asyncio.run(main())
+
+
+def test_batch_marks_in_one_statement_and_publishes_concurrently(tmp_path):
+    async def main():
+        store = await SQLiteJobStore.create(str(tmp_path / "jobs.db"))
+        svc = ConsumerService(store, AMQPConfig("", delay_tiers=(30,)))
+        batch = [_request(5) for _ in range(4)]
+        in_flight, all_sent = [], asyncio.Event()
+
+        class _Gated(_Publisher):
+            async def publish(self, rk, payload, **kw):
+                in_flight.append(payload["id"])
+                if len(in_flight) == len(batch):
+                    all_sent.set()
+                await asyncio.wait_for(all_sent.wait(), 1)   # only passes if concurrent
+                await super().publish(rk, payload, **kw)
+        svc._delay_pub = _Gated()
+
+        calls = []
+        add_delay_markers = store.add_delay_markers
+
+        async def counting(ids, **kw):
+            calls.append(list(ids))
+            return await add_delay_markers(ids, **kw)
+        store.add_delay_markers = counting
+        try:
+            results = await svc._handle_request_batch(batch + batch[:1])
+            assert [r["status"] for r in results] == ["delayed"] * 4 + ["duplicate"]
+            assert len(calls) == 1 and len(svc._delay_pub.sent) == 4
+        finally:
+            await store.close()
+    asyncio.run(main())
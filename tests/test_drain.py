@@ -0,0 +1,64 @@
+import asyncio
+import uuid
+from datetime import timedelta
+
+from clock import now
+from drain import BacklogDrain
+from models import Job, ScheduleSpec
+from producer import ProducerService
+from sqlite_store import SQLiteJobStore
+
+
+class _Publisher:
+    def __init__(self):
+        self.ids = []
+
+    async def publish_body(self, rk, body, *, headers=None, message_id=None):
+        self.ids.append(message_id)
+
+
+def test_drain_fires_every_overdue_job_once(tmp_path):
+    async def main():
+        store = await SQLiteJobStore.create(str(tmp_path / "jobs.db"))
+        past = now() - timedelta(hours=1)
+        jobs = [Job(id=uuid.uuid4(), job_type="n", payload={"i": i},
+                    spec=ScheduleSpec(at=past), next_run_at=past + timedelta(seconds=i % 5))
+                for i in range(250)]
+        await store.insert_jobs(jobs)
+        pub = _Publisher()
+        svc = ProducerService(store, pub, lock_batch=10)
+        drain = BacklogDrain(svc, threshold=100, batch=16, depth=2)
+        try:
+            assert await drain.should_drain()
+            assert await drain.run() == 250
+            assert sorted(pub.ids) == sorted(str(j.id) for j in jobs)
+            assert await store.count_overdue() == 0
+        finally:
+            await store.close()
+    asyncio.run(main())
+
+
+def test_drain_progress_counts_down_from_a_capped_probe(tmp_path):
+    async def main():
+        store = await SQLiteJobStore.create(str(tmp_path / "jobs.db"))
+        past = now() - timedelta(hours=1)
+        await store.insert_jobs([Job(id=uuid.uuid4(), job_type="n", payload={},
+                                     spec=ScheduleSpec(at=past), next_run_at=past)
+                                 for _ in range(100)])
+        caps = []
+        count_overdue = store.count_overdue
+
+        async def counting(**kw):
+            caps.append(kw.get("cap"))
+            return await count_overdue(**kw)
+        store.count_overdue = counting
+
+        drain = BacklogDrain(ProducerService(store, _Publisher()), batch=10, depth=1,
+                             count_cap=30)
+        try:
+            assert await drain.run() == 100
+            assert len(caps) > 1 and set(caps) == {30}      # re-probed, never uncapped
+            assert drain.remaining == 0
+        finally:
+            await store.close()
+    asyncio.run(main())
@@ -0,0 +1,70 @@
+import asyncio
+import json
+import uuid
+from datetime import timedelta
+
+import pytest
+
+from amqp import AMQPConfig
+from clock import now
+from models import Job, ScheduleSpec
+from producer import ProducerService
+from sqlite_store import SQLiteJobStore
+
+
+def _due_jobs(n, job_type):
+    past = now() - timedelta(minutes=1)
+    return [Job(id=uuid.uuid4(), job_type=job_type, payload={"i": i}, spec=ScheduleSpec(at=past),
+                next_run_at=past) for i in range(n)]
+
+
+class _Publisher:
+    def __init__(self):
+        self.sent = []
+
+    async def publish_body(self, rk, body, *, headers=None, message_id=None):
+        self.sent.append((rk, json.loads(body), headers, message_id))
+
+
+def test_batched_types_share_envelopes(tmp_path):
+    async def main():
+        store = await SQLiteJobStore.create(str(tmp_path / "jobs.db"))
+        bulk, single = _due_jobs(10, "bulk"), _due_jobs(3, "n")
+        await store.insert_jobs(bulk + single)
+        cfg = AMQPConfig("", due_batch_types=("bulk",))
+        svc = ProducerService(store, _Publisher(), cfg=cfg, lock_batch=50, batch_max=4)
+        try:
+            assert await svc._process_batch() == 13
+            assert await store.count_overdue() == 0
+            singles = [m for m in svc.pub.sent if m[0] == "due"]
+            envelopes = [m for m in svc.pub.sent if m[0] == "due.batch"]
+            assert len(singles) == 3 and all(m[1]["job_type"] == "n" for m in singles)
+            assert sorted(e[1]["count"] for e in envelopes) == [2, 4, 4]
+            for rk, env, headers, message_id in envelopes:
+                assert env["batch_id"] == message_id and headers == {"x-due-count": env["count"]}
+                assert env["ids"] == [e["id"] for e in env["events"]]
+                assert {e["job_type"] for e in env["events"]} == {"bulk"}
+            members = {i for e in envelopes for i in e[1]["ids"]}
+            assert members == {str(j.id) for j in bulk}
+        finally:
+            await store.close()
+    asyncio.run(main())
+
+
+def test_byte_bound_and_topic_keys(tmp_path):
+    async def main():
+        store = await SQLiteJobStore.create(str(tmp_path / "jobs.db"))
+        await store.insert_jobs(_due_jobs(3, "bulk"))
+        cfg = AMQPConfig("", due_routing="topic", due_types=("bulk",), due_batch_types=("bulk",))
+        svc = ProducerService(store, _Publisher(), cfg=cfg, batch_max_bytes=1)
+        try:
+            await svc._process_batch()
+            assert [(m[0], m[1]["count"]) for m in svc.pub.sent] == [("due.bulk.batch", 1)] * 3
+        finally:
+            await store.close()
+    asyncio.run(main())
+
+
+def test_hash_routing_refuses_batching():
+    with pytest.raises(ValueError):
+        AMQPConfig("", due_routing="hash", due_batch_types=("bulk",))
@@ -0,0 +1,87 @@
+import asyncio
+import uuid
+from datetime import timedelta
+
+from prometheus_client import REGISTRY
+
+from clock import now
+from firelog import FireLog
+from models import FireRecord, Job, ScheduleSpec
+from producer import ProducerService
+from sqlite_store import SQLiteJobStore
+
+
+def _dropped() -> float:
+    return REGISTRY.get_sample_value("fire_log_rows_total", {"outcome": "dropped"}) or 0.0
+
+
+def _records(n):
+    t = now()
+    return [FireRecord(t, uuid.uuid4(), "n", t, 1) for _ in range(n)]
+
+
+class _Publisher:
+    async def publish_body(self, rk, body, *, headers=None, message_id=None):
+        pass
+
+
+class _SlowStore:
+    """write_fire_log waits on `gate`."""
+
+    def __init__(self):
+        self.gate = asyncio.Event()
+        self.written = []
+
+    async def write_fire_log(self, records):
+        await self.gate.wait()
+        self.written += records
+
+    async def ensure_fire_log_partitions(self, first, days):
+        return []
+
+    async def prune_fire_log(self, before):
+        return 0
+
+
+def test_producer_logs_every_published_fire(tmp_path):
+    async def main():
+        store = await SQLiteJobStore.create(str(tmp_path / "jobs.db"))
+        due = now() - timedelta(seconds=30)
+        jobs = [Job(id=uuid.uuid4(), job_type="n", payload={}, spec=ScheduleSpec(at=due),
+                    next_run_at=due) for _ in range(3)]
+        daily = "DTSTART:20250101T090000Z\nRRULE:FREQ=DAILY"
+        jobs.append(Job(id=uuid.uuid4(), job_type="r", payload={}, spec=ScheduleSpec(rrule=daily),
+                        next_run_at=due))
+        await store.insert_jobs(jobs)
+        log = FireLog(store, flush_interval=60)
+        svc = ProducerService(store, _Publisher(), fire_log=log)
+        try:
+            assert await svc._process_batch() == 4
+            assert log.buffered == 4                 # nothing written on the firing path
+            await log.close()
+            rows = await store.fire_lateness(due, now() + timedelta(seconds=1))
+            assert [(jt, n) for jt, n, _, _ in rows] == [("n", 3), ("r", 1), (None, 4)]
+            assert all(29 < worst < 60 for _, _, _, worst in rows)
+        finally:
+            await store.close()
+    asyncio.run(main())
+
+
+def test_full_buffer_drops_or_blocks():
+    async def main():
+        store = _SlowStore()
+        dropping = FireLog(store, capacity=4, flush_rows=2, on_full="drop")
+        before = _dropped()
+        await dropping.add(_records(6))
+        assert dropping.buffered == 4 and _dropped() == before + 2
+
+        blocking = FireLog(store, capacity=4, flush_rows=2, on_full="block")
+        await blocking.start()
+        adding = asyncio.create_task(blocking.add(_records(6)))
+        await asyncio.sleep(0.05)
+        assert not adding.done()                     # waits for room
+        store.gate.set()
+        await asyncio.wait_for(adding, 1)
+        await blocking.close()
+        assert len(store.written) == 6 and _dropped() == before + 2
+    asyncio.run(main())
@@ -0,0 +1,64 @@
+import asyncio
+import uuid
+from itertools import takewhile
+from datetime import datetime, timedelta, timezone
+
+from forecast import Forecast, forecast
+from models import Job, ScheduleSpec, parse_rule
+from sqlite_store import SQLiteJobStore
+
+START = datetime(2030, 1, 1, 12, 0, tzinfo=timezone.utc)
+EVERY_20S = "DTSTART:20300101T000010Z\nRRULE:FREQ=SECONDLY;INTERVAL=20"
+HOURLY = "DTSTART:20291231T000000Z\nRRULE:FREQ=HOURLY;BYMINUTE=30"
+
+GROUPS = [  # (job_type, rule, next_run_at, count)
+    ("a", None, START + timedelta(minutes=3, seconds=5), 4),
+    ("a", None, START - timedelta(hours=1), 2),                 # overdue one-shot
+    ("a", EVERY_20S, START - timedelta(minutes=5, seconds=10), 3),
+    ("b", EVERY_20S, START + timedelta(minutes=7, seconds=30), 5),
+    ("b", HOURLY, START + timedelta(minutes=30), 7),
+]
+
+
+def _brute(horizon, bucket):
+    fc = Forecast(START, horizon, bucket)
+    hist = {}
+    for jt, rule, at, n in GROUPS:
+        fires = [max(at, fc.start)]
+        if rule:
+            fires += takewhile(lambda o: o < fc.end, parse_rule(rule).xafter(at))
+        for f in fires:
+            if fc.start <= f < fc.end:
+                h = hist.setdefault(jt, [0] * fc.n)
+                h[int((f - fc.start).total_seconds()) // fc.bucket_s] += n
+    return hist
+
+
+def test_matches_per_job_simulation():
+    horizon, bucket = timedelta(hours=2), timedelta(minutes=1)
+    fc = Forecast(START, horizon, bucket)
+    for g in sorted(GROUPS, key=lambda g: g[1] or ""):
+        fc.add(*g)
+    fc.finish()
+    assert fc.by_type == _brute(horizon, bucket)
+    assert fc.total == [a + b for a, b in zip(*fc.by_type.values())]
+    assert fc.rules_expanded == 2
+
+
+def test_forecast_streams_from_store(tmp_path):
+    async def main():
+        store = await SQLiteJobStore.create(str(tmp_path / "jobs.db"))
+        try:
+            at = START + timedelta(minutes=10)
+            await store.insert_jobs(
+                [Job(id=uuid.uuid4(), job_type="r", payload={}, spec=ScheduleSpec(rrule=HOURLY),
+                     next_run_at=START + timedelta(minutes=30)) for _ in range(3)]
+                + [Job(id=uuid.uuid4(), job_type="o", payload={}, spec=ScheduleSpec(at=at),
+                       next_run_at=at)])
+            fc = await forecast(store, horizon=timedelta(hours=3), start=START)
+        finally:
+            await store.close()
+        assert sum(fc.by_type["o"]) == 1 and fc.by_type["o"][10] == 1
+        assert sum(fc.by_type["r"]) == 9            # 12:30, 13:30, 14:30 × 3 jobs
+        assert fc.peak() == (START + timedelta(minutes=30), 3)
+    asyncio.run(main())
@@ -0,0 +1,111 @@
+import asyncio
+import json
+import uuid
+from datetime import datetime, timedelta, timezone
+
+from prometheus_client import REGISTRY
+
+import clock
+from amqp import DELIVERED_AT, AMQPConfig, LaneSpec, _COMMAND_KEYS
+from clock import now
+from consumer import ConsumerService
+from sqlite_store import SQLiteJobStore
+
+
+class _Message:
+    reply_to = None
+    timestamp = None
+
+    def __init__(self, rk, headers=None):
+        self.routing_key = rk
+        self.headers = headers or {}
+
+
+def _request(**over) -> dict:
+    evt = {"id": str(uuid.uuid4()), "job_type": "n", "payload": {},
+           "schedule": {"at": (now() + timedelta(seconds=30)).isoformat()}}
+    evt.update(over)
+    return evt
+
+
+def _observed(rk):
+    """(sum, count) of cancel_latency_seconds for `rk`."""
+    labels = {"routing_key": rk}
+    return (REGISTRY.get_sample_value("cancel_latency_seconds_sum", labels) or 0.0,
+            REGISTRY.get_sample_value("cancel_latency_seconds_count", labels) or 0.0)
+
+
+def test_every_command_key_has_exactly_one_lane():
+    class _S:
+        CANCEL_PREFETCH, CANCEL_CONCURRENCY = 8, 3
+
+    for tiers in ((), (5,)):
+        lanes = AMQPConfig("", delay_tiers=tiers).command_lanes()
+        keys = [rk for _, rks in lanes.values() for rk in rks]
+        assert len(keys) == len(set(keys))
+        assert set(keys) == set(_COMMAND_KEYS) - ({"delayed"} if not tiers else set())
+        assert lanes["cancel"][0] == "schedule_inbox.cancel"
+    assert LaneSpec.from_settings(_S, "cancel") == LaneSpec(prefetch=8, concurrency=3)
+
+
+def test_cancel_that_overtakes_its_request_still_wins(tmp_path):
+    async def main():
+        store = await SQLiteJobStore.create(str(tmp_path / "jobs.db"))
+        svc = ConsumerService(store, AMQPConfig(""))
+        try:
+            single, batched, other = _request(), _request(), _request()
+            sent_at = now().timestamp() - 2
+            total0, before = _observed("cancel")
+            await svc.handle_command(_Message("cancel", {"x-sent-at": sent_at}),
+                                     json.dumps({"id": single["id"]}).encode())
+            await svc.handle_command(_Message("cancel.batch"),
+                                     json.dumps([batched["id"]]).encode())
+            total, after = _observed("cancel")
+            assert after == before + 1 and total - total0 >= 2
+
+            await svc.handle_command(_Message("request"), json.dumps(single).encode())
+            await svc.handle_command(_Message("request.batch"),
+                                     json.dumps([batched, other]).encode())
+            later = now() + timedelta(minutes=5)
+            claimed = await store.lock_due_jobs(now=later, limit=10)
+            assert [str(j.id) for j in claimed] == [other["id"]]
+        finally:
+            await store.close()
+    asyncio.run(main())
+
+
+def test_requests_hold_back_while_a_cancel_is_applied():
+    async def main():
+        svc = ConsumerService(None, AMQPConfig(""))
+        order, gate = [], asyncio.Event()
+
+        async def handle(message, body):
+            if message.routing_key == "cancel":
+                await gate.wait()
+            order.append(message.routing_key)
+        svc.handle_command = handle
+
+        cancel = asyncio.create_task(svc.handle_cancel_lane(_Message("cancel"), b""))
+        await asyncio.sleep(0)
+        request = asyncio.create_task(svc.handle_request_lane(_Message("request"), b""))
+        await asyncio.sleep(0.01)
+        assert order == []
+        gate.set()
+        await asyncio.gather(cancel, request)
+        assert order == ["cancel", "request"]
+    asyncio.run(main())
+
+
+def test_cancel_latency_prefers_header_then_timestamp_then_delivery():
+    t = datetime(2030, 1, 1, 12, 0, 10)               # naive: AMQP timestamps are UTC
+    svc = ConsumerService(None, AMQPConfig(""))
+    with clock.freeze_time(t.replace(tzinfo=timezone.utc)) as vc:
+        DELIVERED_AT.set(vc.now().timestamp() - 1)
+        stamped = _Message("cancel", {"x-sent-at": vc.now().timestamp() - 7})
+        stamped.timestamp = t - timedelta(seconds=4)
+        bare = _Message("cancel")
+        bare.timestamp = t - timedelta(seconds=4)
+        for message, latency in ((stamped, 7), (bare, 4), (_Message("cancel"), 1)):
+            total, n = _observed("cancel.latency-test")
+            svc._observe_cancel(message, "cancel.latency-test")
+            assert _observed("cancel.latency-test") == (total + latency, n + 1)
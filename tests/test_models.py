@@ -0,0 +1,121 @@
+import json
+import uuid
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from dateutil.rrule import rrulestr
+
+from models import CompiledRule, DueJob, Job, JobUpdate, RequestRejected, ScheduleSpec
+from rrule import canonicalize
+
+RULE = "DTSTART:20250101T090000Z\nRRULE:FREQ=WEEKLY;BYDAY=MO,FR;BYHOUR=9"
+
+
+def _body(**over) -> bytes:
+    evt = {
+        "id": str(uuid.uuid4()),
+        "job_type": "notification",
+        "payload": {"user_id": 1},
+        "schedule": {"at": "2099-01-01T00:00:00Z"},
+    }
+    evt.update(over)
+    return json.dumps(evt).encode()
+
+
+def test_from_request_json_matches_event_path():
+    body = _body(tags={"user_id": 7})
+    a = Job.from_request_json(body)
+    b = Job.from_request_event(json.loads(body))
+    assert (a.id, a.next_run_at, a.payload, a.tags) == (b.id, b.next_run_at, b.payload, b.tags)
+    assert a.next_run_at == datetime(2099, 1, 1, tzinfo=timezone.utc)
+    assert a.tags == {"user_id": "7"}
+
+
+def test_rrule_is_stored_canonical():
+    job = Job.from_request_json(_body(schedule={"rrule": "rrule:byday=FR,MO;freq=weekly;byhour=9\n"
+                                                         "dtstart:20250101T090000Z"}))
+    assert job.spec.rrule == canonicalize(RULE).text == \
+        "DTSTART:20250101T090000Z\nRRULE:FREQ=WEEKLY;BYHOUR=9;BYDAY=MO,FR"
+
+
+@pytest.mark.parametrize("body, reason", [
+    (b"{", "invalid_json"),
+    (_body(id="nope"), "invalid_field"),
+    (_body(job_type=None), "invalid_field"),
+    (json.dumps({"id": str(uuid.uuid4()), "schedule": {"at": "2099-01-01"}}).encode(), "missing_field"),
+    (_body(schedule={}), "bad_schedule"),
+    (_body(schedule={"at": "2099-01-01T00:00:00Z", "rrule": "FREQ=DAILY"}), "bad_schedule"),
+    (_body(schedule={"at": "2000-01-01T00:00:00Z"}), "in_past"),
+    (_body(schedule={"rrule": "FREQ=NOPE"}), "bad_rrule"),
+])
+def test_rejection_reasons(body, reason):
+    with pytest.raises(RequestRejected) as exc:
+        Job.from_request_json(body)
+    assert exc.value.reason == reason
+
+
+def test_update_is_partial_and_canonical():
+    jid = str(uuid.uuid4())
+    upd = JobUpdate.from_update_json(json.dumps({"id": jid, "payload": {"x": 1}, "version": 2}))
+    assert (upd.spec, upd.next_run_at, upd.payload, upd.tags, upd.version) == \
+        (None, None, {"x": 1}, None, 2)
+
+    upd = JobUpdate.from_update_event({"id": jid, "schedule": {"rrule": "rrule:freq=daily;interval=1\n"
+                                                                       "dtstart:20250101T090000Z"}})
+    assert upd.spec.rrule == "DTSTART:20250101T090000Z\nRRULE:FREQ=DAILY"
+    assert upd.next_run_at > datetime.now(timezone.utc)
+
+
+@pytest.mark.parametrize("evt, reason", [
+    ({"id": str(uuid.uuid4())}, "invalid_field"),
+    ({"id": str(uuid.uuid4()), "payload": {}, "version": -1}, "invalid_field"),
+    ({"id": str(uuid.uuid4()), "schedule": {"at": "2000-01-01T00:00:00Z"}}, "in_past"),
+    ({"schedule": {"at": "2099-01-01T00:00:00Z"}}, "missing_field"),
+])
+def test_update_rejection_reasons(evt, reason):
+    with pytest.raises(RequestRejected) as exc:
+        JobUpdate.from_update_event(evt)
+    assert exc.value.reason == reason
+
+
+def test_compiled_rule_memo_matches_dateutil():
+    rule = rrulestr(RULE, forceset=True)
+    compiled = CompiledRule(RULE)
+    t = datetime(2025, 3, 1, tzinfo=timezone.utc)
+    for step in range(0, 24 * 30, 7):
+        dt = t + timedelta(hours=step)
+        assert compiled.after(dt) == rule.after(dt, inc=True)
+    # going backwards must not serve a stale answer
+    assert compiled.after(t) == rule.after(t, inc=True)
+
+
+def test_due_job_builds_its_spec_lazily():
+    job = DueJob(uuid.uuid4(), "n", RULE, datetime(2025, 1, 3, 9, tzinfo=timezone.utc), 0)
+    job.next_after(job.next_run_at)
+    assert job._spec is None
+    assert job.spec == ScheduleSpec(rrule=RULE) and job.spec is job.spec
+    once = datetime(2099, 1, 1, tzinfo=timezone.utc)
+    assert DueJob(uuid.uuid4(), "n", None, once, 0).spec == ScheduleSpec(at=once)
+
+
+def test_due_job_next_after_matches_schedule_spec():
+    start = datetime(2025, 1, 1, tzinfo=timezone.utc)
+    probes = [start + timedelta(hours=7 * i) for i in range(40)]
+    once = datetime(2025, 1, 5, 12, tzinfo=timezone.utc)
+    for rrule, at in ((RULE, None), (None, once)):
+        job = DueJob(uuid.uuid4(), "n", rrule, at or start, 0)
+        spec = ScheduleSpec(at=at, rrule=rrule)
+        assert [job.next_after(p) for p in probes] == [spec.next_after(p) for p in probes]
+
+
+def test_due_job_unpacks_the_claim_row_in_column_order():
+    import inspect
+    import re
+
+    from repo import _CLAIM, RULE_TEXT
+
+    select = _CLAIM.split("FROM")[0].replace(RULE_TEXT, "rule").removeprefix("\nSELECT")
+    columns = [re.split(r"[ .]", c.strip())[-1] for c in select.split(",")]
+    params = list(inspect.signature(DueJob).parameters)
+    assert columns == params[:len(columns)] == \
+        ["id", "job_type", "rrule", "next_run_at", "retries", "trace_id", "version"]
@@ -0,0 +1,106 @@
+import asyncio
+
+import pytest
+
+from amqp import AMQPConfig, declare_topology
+
+
+class _Exchange:
+    def __init__(self, topo, name, kind, arguments):
+        self.topo, self.name, self.kind, self.arguments = topo, name, kind, arguments
+
+    async def bind(self, source, routing_key):
+        self.topo.bindings.add((source.name, routing_key, self.name))
+
+
+class _Queue:
+    def __init__(self, topo, name):
+        self.topo, self.name = topo, name
+
+    async def bind(self, exchange, routing_key):
+        self.topo.bindings.add((exchange.name, routing_key, self.name))
+
+    async def unbind(self, exchange, routing_key):
+        self.topo.unbound.add((exchange.name, routing_key, self.name))
+
+
+class _Topology:
+    """Fake connection + channel recording what declare_topology sets up."""
+
+    def __init__(self):
+        self.exchanges, self.queues = {}, {}
+        self.bindings, self.unbound = set(), set()
+
+    async def channel(self):
+        return self
+
+    async def declare_exchange(self, name, kind, durable=True, arguments=None):
+        self.exchanges[name] = _Exchange(self, name, kind, arguments)
+        return self.exchanges[name]
+
+    async def declare_queue(self, name, durable=True, arguments=None):
+        self.queues[name] = _Queue(self, name)
+        return self.queues[name]
+
+    async def close(self):
+        pass
+
+
+def _declare(cfg):
+    topo = _Topology()
+    asyncio.run(declare_topology(topo, cfg))
+    return topo
+
+
+def _due_bindings(topo):
+    return {b for b in topo.bindings if b[2].startswith(("schedule_due", "schedule.due"))}
+
+
+def test_single_routing():
+    cfg = AMQPConfig("")
+    assert cfg.due_routing_key("email") == "due" and cfg.due_queues() == ["schedule_due"]
+    assert _due_bindings(_declare(cfg)) == {("schedule.events", "due", "schedule_due")}
+
+
+def test_topic_routing_gives_listed_types_their_own_queue():
+    cfg = AMQPConfig("", due_routing="topic", due_types=("sms", "email"),
+                     due_batch_types=("email",))
+    assert [cfg.due_routing_key(t) for t in ("email", "sms", "push")] == \
+        ["due.email", "due.sms", "due"]
+    assert cfg.due_batch_routing_key("email") == "due.email.batch"
+    assert cfg.due_queues() == ["schedule_due", "schedule_due.email", "schedule_due.sms"]
+    assert _due_bindings(_declare(cfg)) == {
+        ("schedule.events", "due", "schedule_due"),
+        ("schedule.events", "due.batch", "schedule_due"),
+        ("schedule.events", "due.email", "schedule_due.email"),
+        ("schedule.events", "due.email.batch", "schedule_due.email"),
+        ("schedule.events", "due.sms", "schedule_due.sms"),
+    }
+
+
+def test_hash_routing_shards_by_message_id():
+    cfg = AMQPConfig("", due_routing="hash", due_shards=3, due_types=("email",))
+    assert cfg.due_routing_key("email") == "due"
+    assert cfg.due_queues() == ["schedule_due.0", "schedule_due.1", "schedule_due.2"]
+    topo = _declare(cfg)
+    hash_ex = topo.exchanges["schedule.due.hash"]
+    assert (hash_ex.kind, hash_ex.arguments) == ("x-consistent-hash", {"hash-property": "message_id"})
+    assert _due_bindings(topo) == {
+        ("schedule.events", "due", "schedule.due.hash"),
+        *(("schedule.due.hash", "1", f"schedule_due.{i}") for i in range(3)),
+    }
+    assert "schedule_due" not in topo.queues
+    with pytest.raises(ValueError):
+        AMQPConfig("", due_routing="hash", due_batch_types=("email",))
+    with pytest.raises(ValueError):
+        AMQPConfig("", due_routing="fanout")
+
+
+@pytest.mark.parametrize("tiers", [(), (5, 30)])
+def test_moved_command_keys_are_unbound_from_the_inbox(tiers):
+    topo = _declare(AMQPConfig("", delay_tiers=tiers))
+    moved = {"cancel", "cancel.batch", "cancel.selector", "delayed"}
+    assert topo.unbound == {("schedule.commands", rk, "schedule_inbox") for rk in moved}
+    inbox = {rk for ex, rk, q in topo.bindings if q == "schedule_inbox"}
+    assert inbox == {"request", "request.batch", "update", "update.batch"}
+    assert ("schedule.commands", "cancel", "schedule_inbox.cancel") in topo.bindings
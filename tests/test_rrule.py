@@ -0,0 +1,45 @@
+from datetime import datetime, timezone
+from itertools import islice
+
+import pytest
+from dateutil.rrule import rrulestr
+
+from rrule import RRuleBuilder, canonicalize
+
+
+def test_parse_round_trips_builder_output():
+    built, _ = (RRuleBuilder.weekly().interval(2).by_weekday("MO", "FR").at(9, 30)
+                .until(datetime(2030, 1, 1, tzinfo=timezone.utc)).build())
+    assert RRuleBuilder.parse(built).build()[0] == built
+    assert RRuleBuilder.parse("RRULE:" + built).build()[0] == built
+
+
+@pytest.mark.parametrize("a, b", [
+    ("FREQ=DAILY;BYHOUR=9", "byhour=9;freq=daily;interval=1"),
+    ("FREQ=WEEKLY;BYDAY=MO,FR", "FREQ=WEEKLY;BYDAY=FR,MO,MO"),
+    ("FREQ=MONTHLY;BYDAY=-1FR,2MO", "FREQ=MONTHLY;BYDAY=+2MO,-1FR"),
+    ("DTSTART:20250101T090000Z\nRRULE:FREQ=HOURLY;BYMINUTE=0,30",
+     "rrule:FREQ=HOURLY;BYMINUTE=30,0\ndtstart:20250101t090000z\n"),
+    ("DTSTART:20250101T000000Z\nRRULE:FREQ=DAILY", "DTSTART:20250101T000000Z\nFREQ=DAILY"),
+])
+def test_equivalent_spellings_share_a_canonical_form(a, b):
+    assert canonicalize(a).text == canonicalize(b).text
+
+
+def test_canonical_form_keeps_semantics_and_metadata():
+    text = "RRULE:byday=FR,MO;freq=weekly;count=5\nDTSTART;TZID=Europe/Berlin:20250106T090000"
+    canon = canonicalize(text)
+    assert (canon.freq, canon.tz, canon.bounded) == ("WEEKLY", "Europe/Berlin", True)
+    assert list(rrulestr(canon.text)) == list(rrulestr(text))
+    dt = datetime(2025, 1, 1)
+    assert list(islice(rrulestr(canonicalize("FREQ=DAILY;INTERVAL=1").text, dtstart=dt), 3)) == \
+        list(islice(rrulestr("FREQ=DAILY", dtstart=dt), 3))
+    bare = "DTSTART:20250101T000000Z\nFREQ=DAILY;COUNT=3"      # rrulestr reads it as an RRULE
+    assert list(rrulestr(canonicalize(bare).text)) == list(rrulestr(bare))
+
+
+@pytest.mark.parametrize("bad", ["BYHOUR=9", "FREQ=DAILY;BYFOO=1", "FREQ=DAILY;COUNT=2;UNTIL=20300101T000000Z",
+                                 "FREQ=WEEKLY;BYDAY=XX", "DTSTART:20250101T000000Z"])
+def test_invalid_rules_raise(bad):
+    with pytest.raises(ValueError):
+        canonicalize(bad)
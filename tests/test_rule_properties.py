@@ -0,0 +1,120 @@
+"""
+Property tests: every shortcut on the next-occurrence path must give
+exactly dateutil's answer.  Needs the `test` extra (Hypothesis).
+"""
+from datetime import datetime, timedelta, timezone
+from itertools import islice
+
+import pytest
+
+pytest.importorskip("hypothesis")
+from dateutil.rrule import rrulestr
+from hypothesis import HealthCheck, given, reject, settings, strategies as st
+
+from models import CompiledRule, DueJob, ScheduleSpec
+from rrule import canonicalize
+
+# how far past DTSTART queries may land; keeps the fine frequencies cheap
+_SPAN = {"SECONDLY": timedelta(hours=2), "MINUTELY": timedelta(days=2),
+         "HOURLY": timedelta(days=60), "DAILY": timedelta(days=3 * 365),
+         "WEEKLY": timedelta(days=5 * 365), "MONTHLY": timedelta(days=10 * 365),
+         "YEARLY": timedelta(days=30 * 365)}
+_DAYS = ("MO", "TU", "WE", "TH", "FR", "SA", "SU")
+
+_settings = settings(max_examples=150, deadline=None,
+                     suppress_health_check=[HealthCheck.too_slow])
+
+
+def _subset(values, max_size=4):
+    return st.lists(st.sampled_from(values), min_size=1, max_size=max_size, unique=True)
+
+
+@st.composite
+def rules(draw):
+    """(rule text in a random but valid spelling, DTSTART, FREQ)."""
+    freq = draw(st.sampled_from(tuple(_SPAN)))
+    parts = {"FREQ": freq}
+    if draw(st.booleans()):
+        parts["INTERVAL"] = str(draw(st.integers(1, 4)))
+    coarse = freq in ("DAILY", "WEEKLY", "MONTHLY", "YEARLY")
+    if coarse and draw(st.booleans()):
+        parts["BYHOUR"] = ",".join(map(str, draw(_subset(range(24)))))
+    if freq != "SECONDLY" and draw(st.booleans()):
+        parts["BYMINUTE"] = ",".join(map(str, draw(_subset(range(0, 60, 5)))))
+    if coarse and draw(st.booleans()):
+        days = draw(_subset(_DAYS, 5))
+        if freq in ("MONTHLY", "YEARLY") and draw(st.booleans()):
+            days = [f"{draw(st.sampled_from(('1', '2', '-1', '+3')))}{d}" for d in days]
+        elif freq == "MONTHLY" and draw(st.booleans()):
+            parts["BYSETPOS"] = draw(st.sampled_from(("1", "-1", "1,-1")))
+        parts["BYDAY"] = ",".join(days)
+    elif freq in ("MONTHLY", "YEARLY") and draw(st.booleans()):
+        parts["BYMONTHDAY"] = ",".join(map(str, draw(_subset([*range(1, 29), -1]))))
+    if freq == "YEARLY" and draw(st.booleans()):
+        parts["BYMONTH"] = ",".join(map(str, draw(_subset(range(1, 13)))))
+
+    dtstart = draw(st.datetimes(datetime(2020, 1, 1), datetime(2026, 12, 31),
+                                timezones=st.just(timezone.utc))).replace(microsecond=0)
+    end = draw(st.sampled_from(("none", "count", "until")))
+    if end == "count":
+        parts["COUNT"] = str(draw(st.integers(1, 200)))
+    elif end == "until":
+        until = dtstart + draw(st.timedeltas(timedelta(0), _SPAN[freq]))
+        parts["UNTIL"] = until.strftime("%Y%m%dT%H%M%SZ")
+
+    items = draw(st.permutations([f"{k}={v}" for k, v in parts.items()]))
+    body = ";".join(items)
+    if draw(st.booleans()):
+        body = body.lower()
+    return f"DTSTART:{dtstart:%Y%m%dT%H%M%SZ}\nRRULE:{body}", dtstart, freq
+
+
+@st.composite
+def rule_and_queries(draw):
+    text, dtstart, freq = draw(rules())
+    try:
+        rrulestr(text)
+    except ValueError:                  # e.g. BYMINUTE unreachable with INTERVAL; rejected at ingest
+        reject()
+    offsets = st.timedeltas(-timedelta(days=1), _SPAN[freq])
+    queries = [dtstart + d for d in draw(st.lists(offsets, min_size=1, max_size=12))]
+    if draw(st.booleans()):
+        queries.sort()                  # the producer walks a series forwards
+    return text, queries
+
+
+@_settings
+@given(rule_and_queries())
+def test_memoised_after_matches_dateutil(case):
+    text, queries = case
+    reference = rrulestr(text, forceset=True)
+    memo = CompiledRule(text)
+    for q in queries:
+        expected = reference.after(q, inc=True)
+        assert memo.after(q) == expected
+        assert memo.after(q) == expected            # answered from the memo
+
+
+@_settings
+@given(rule_and_queries())
+def test_walking_a_series_matches_dateutil(case):
+    text, queries = case
+    reference = list(islice(rrulestr(text), 25))
+    job = DueJob(None, "t", text, queries[0], 0)
+    walked = []
+    nxt = job.next_after(reference[0]) if reference else None
+    while nxt is not None and len(walked) < len(reference):
+        walked.append(nxt)
+        nxt = job.next_after(nxt + timedelta(microseconds=1))
+    assert walked == reference
+
+
+@_settings
+@given(rule_and_queries())
+def test_canonical_rule_has_the_same_occurrences(case):
+    text, queries = case
+    canon = canonicalize(text).text
+    assert canonicalize(canon).text == canon
+    original, rebuilt = rrulestr(text, forceset=True), ScheduleSpec(rrule=canon)
+    for q in queries:
+        assert rebuilt.next_after(q) == original.after(q, inc=True)
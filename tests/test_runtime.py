@@ -0,0 +1,78 @@
+import asyncio
+import json
+import time
+
+from runtime import HealthServer, LoopMonitor
+
+
+async def _get(port: int, path: str):
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    writer.write(f"GET {path} HTTP/1.1\r\nHost: x\r\n\r\n".encode())
+    raw = await reader.read()
+    writer.close()
+    head, body = raw.split(b"\r\n\r\n", 1)
+    return int(head.split()[1]), json.loads(body)
+
+
+def test_health_and_readiness():
+    async def main():
+        monitor = LoopMonitor(interval=0.01, slow_threshold=0.05)
+        monitor.start()
+        health = HealthServer(monitor, port=0)
+        await health.start()
+        port = health._server.sockets[0].getsockname()[1]
+
+        async def db_ok():
+            return True
+        health.add_check("db", db_ok)
+        health.add_check("amqp", lambda: False)
+        try:
+            assert await _get(port, "/healthz") == (200, {"loop": True})
+            assert await _get(port, "/readyz") == (503, {"db": True, "amqp": False})
+            assert (await _get(port, "/nope"))[0] == 404
+        finally:
+            await health.stop()
+    asyncio.run(main())
+
+
+def test_watchdog_logs_blocked_loop(caplog):
+    async def main():
+        monitor = LoopMonitor(interval=0.01, slow_threshold=0.05)
+        monitor.start()
+        await asyncio.sleep(0.02)
+        time.sleep(0.2)                  # block the loop
+        await asyncio.sleep(0.02)
+        monitor.stop()
+    with caplog.at_level("WARNING", logger="scheduler.runtime"):
+        asyncio.run(main())
+    assert any("test_watchdog_logs_blocked_loop" in r.getMessage() for r in caplog.records)
+
+
+
+def test_debug_profile_route_is_opt_in_clamped_and_recovers(tmp_path):
+    from config import Settings
+    from profiling import install
+
+    async def main():
+        health = HealthServer(LoopMonitor(interval=1), port=0)
+        await health.start()
+        port = health._server.sockets[0].getsockname()[1]
+        try:
+            install("t", Settings(PROFILE_DIR=str(tmp_path)), health)
+            assert (await _get(port, "/debug/profile"))[0] == 404
+
+            out = tmp_path / "out"
+            prof = install("t", Settings(PROFILE_DIR=str(out), DEBUG_ROUTES=True,
+                                         PROFILE_MAX_SECONDS=2), health)
+            assert (await _get(port, "/debug/profile?seconds=nan"))[0] == 400
+            status, body = await _get(port, "/debug/profile?mode=tracemalloc&seconds=1e9")
+            assert (status, body["seconds"]) == (202, 2) and prof._busy
+            out.rmdir()                                 # the snapshot dump will fail
+            for _ in range(300):
+                if not prof._busy:
+                    break
+                await asyncio.sleep(0.01)
+            assert not prof._busy                       # a failed profile frees the slot
+        finally:
+            await health.stop()
+    asyncio.run(main())
@@ -0,0 +1,147 @@
+import asyncio
+import uuid
+from datetime import timedelta
+
+from amqp import Subscription
+from clock import now
+from models import Job, ScheduleSpec
+from producer import ProducerService
+from sqlite_store import SQLiteJobStore
+
+
+def _due_jobs(n):
+    past = now() - timedelta(minutes=1)
+    return [Job(id=uuid.uuid4(), job_type="n", payload={}, spec=ScheduleSpec(at=past),
+                next_run_at=past) for _ in range(n)]
+
+
+class _Publisher:
+    """Calls `on_publish(count)` after each publish; may block forever."""
+
+    def __init__(self, on_publish):
+        self.ids = []
+        self.on_publish = on_publish
+
+    async def publish_body(self, rk, body, *, headers=None, message_id=None):
+        self.ids.append(message_id)
+        await self.on_publish(len(self.ids))
+
+
+def test_stop_finishes_current_job_and_releases_the_rest(tmp_path):
+    async def main():
+        store = await SQLiteJobStore.create(str(tmp_path / "jobs.db"))
+        await store.insert_jobs(_due_jobs(20))
+
+        async def stop_after_five(n):
+            if n == 5:
+                svc.stop()
+        svc = ProducerService(store, _Publisher(stop_after_five), lock_batch=20)
+        try:
+            await svc.run()
+            assert len(svc.pub.ids) == 5
+            assert await store.count_overdue() == 15      # fired ones finalized, rest pending
+            assert svc.abandoned == {"unfired": 15, "unfinalized": 0}
+        finally:
+            await store.close()
+    asyncio.run(main())
+
+
+def test_deadline_cancels_a_stuck_publish(tmp_path):
+    async def main():
+        store = await SQLiteJobStore.create(str(tmp_path / "jobs.db"))
+        await store.insert_jobs(_due_jobs(10))
+
+        async def hang_on_third(n):
+            if n == 3:
+                svc.stop()
+                await asyncio.Event().wait()
+        svc = ProducerService(store, _Publisher(hang_on_third), lock_batch=10,
+                              shutdown_timeout=0.05)
+        try:
+            await asyncio.wait_for(svc.run(), 2)
+            assert await store.count_overdue() == 10       # nothing finalized
+            assert svc.abandoned == {"unfired": 7, "unfinalized": 3}
+        finally:
+            await store.close()
+    asyncio.run(main())
+
+
+class _Message:
+    body, content_encoding = b"{}", None
+
+    def __init__(self):
+        self.nacked = False
+
+    def process(self, **kw):
+        return _Process()
+
+    async def nack(self, requeue=True):
+        self.nacked = requeue
+
+
+class _Process:
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+
+class _Queue:
+    def __init__(self):
+        self.callback = None
+        self.cancelled = False
+
+    async def consume(self, callback):
+        self.callback = callback
+        return "ctag"
+
+    async def cancel(self, tag):
+        self.cancelled = True
+
+
+def test_subscription_drain_handles_prefetched_then_requeues():
+    async def main():
+        gate = asyncio.Event()
+        handled = []
+
+        async def handler(message, payload):
+            handled.append(message)
+            if len(handled) == 2:
+                await gate.wait()              # stuck past the deadline
+
+        queue = _Queue()
+        sub = Subscription(queue, handler)
+        await sub.start()
+        messages = [_Message() for _ in range(4)]
+        for m in messages:
+            await queue.callback(m)
+        await asyncio.sleep(0)
+
+        assert await sub.drain(0.05) == 3       # the stuck one + two still buffered
+        assert queue.cancelled and sub.handled == 1
+        assert [m.nacked for m in messages] == [False, False, True, True]
+    asyncio.run(main())
+
+
+def test_concurrent_subscription_requeues_every_stuck_message():
+    async def main():
+        gate = asyncio.Event()
+        running = []
+
+        async def handler(message, payload):
+            running.append(message)
+            await gate.wait()
+
+        queue = _Queue()
+        sub = Subscription(queue, handler, concurrency=2)
+        await sub.start()
+        messages = [_Message() for _ in range(3)]
+        for m in messages:
+            await queue.callback(m)
+        await asyncio.sleep(0.01)
+
+        assert running == messages[:2]          # two handled side by side
+        assert await sub.drain(0.05) == 3
+        assert [m.nacked for m in messages] == [False, False, True]
+    asyncio.run(main())
@@ -0,0 +1,230 @@
+"""
+JobStore conformance suite: every backend must behave the same.
+
+SQLite always runs; Postgres runs when SCHEDULER_TEST_PG_DSN points at a
+migrated database (its `jobs` table is truncated before each test).
+"""
+import asyncio
+import os
+import uuid
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from models import FireRecord, Job, JobUpdate, ScheduleSpec
+
+PG_DSN = os.getenv("SCHEDULER_TEST_PG_DSN")
+T0 = datetime(2030, 1, 1, tzinfo=timezone.utc)
+
+
+async def _open(backend, tmp_path):
+    if backend == "sqlite":
+        from sqlite_store import SQLiteJobStore
+        return await SQLiteJobStore.create(str(tmp_path / "jobs.db"))
+    from repo import JobRepo
+    store = await JobRepo.create(PG_DSN)
+    async with store._pool.acquire() as conn:
+        await conn.execute("TRUNCATE jobs, job_fire_log, delay_markers;")
+    return store
+
+
+@pytest.fixture(params=[
+    "sqlite",
+    pytest.param("postgres", marks=pytest.mark.skipif(not PG_DSN, reason="SCHEDULER_TEST_PG_DSN unset")),
+])
+def run(request, tmp_path):
+    """Run `test(store)` against a fresh store of the parametrised backend."""
+    def _run(test):
+        async def main():
+            store = await _open(request.param, tmp_path)
+            try:
+                await test(store)
+            finally:
+                await store.close()
+        asyncio.run(main())
+    return _run
+
+
+def _job(at=T0, rrule=None, **kw) -> Job:
+    spec = ScheduleSpec(rrule=rrule) if rrule else ScheduleSpec(at=at)
+    return Job(id=uuid.uuid4(), job_type="notification", payload={"n": 1},
+               spec=spec, next_run_at=at, **kw)
+
+
+def test_insert_is_idempotent(run):
+    async def t(store):
+        job = _job()
+        assert await store.insert_job(job) is True
+        assert await store.insert_job(job) is False
+        other = _job()
+        assert await store.insert_jobs([job, other]) == {other.id}
+    run(t)
+
+
+def test_claim_only_due_pending_in_order(run):
+    async def t(store):
+        late, early, future = _job(T0 + timedelta(seconds=5)), _job(T0), _job(T0 + timedelta(hours=1))
+        cancelled = _job(T0)
+        await store.insert_jobs([late, early, future, cancelled])
+        assert await store.cancel_job(cancelled.id) == 1
+        assert await store.cancel_job(cancelled.id) == 0
+
+        claimed = await store.lock_due_jobs(now=T0 + timedelta(minutes=1), limit=10)
+        assert [j.id for j in claimed] == [early.id, late.id]
+        await store.load_payloads(claimed)
+        assert claimed[0].payload == {"n": 1}
+        assert await store.earliest_due() == T0
+    run(t)
+
+
+def test_keyset_claim_and_overdue_count(run):
+    async def t(store):
+        jobs = [_job(T0 + timedelta(seconds=i % 3)) for i in range(7)]
+        await store.insert_jobs(jobs)
+        cutoff = T0 + timedelta(minutes=1)
+        assert await store.count_overdue(now=cutoff) == 7
+        assert await store.count_overdue(now=cutoff, cap=5) == 5
+
+        seen, after = [], None
+        while page := await store.lock_due_jobs(now=cutoff, limit=3, after=after):
+            seen += page
+            after = (page[-1].next_run_at, page[-1].id)
+        assert sorted(j.id for j in seen) == sorted(j.id for j in jobs)
+        assert [(j.next_run_at, j.id) for j in seen] == sorted((j.next_run_at, j.id) for j in jobs)
+    run(t)
+
+
+def test_finalize_batch(run):
+    async def t(store):
+        rec, one = _job(rrule="FREQ=DAILY"), _job()
+        await store.insert_jobs([rec, one])
+        rec.retries = 1
+        assert await store.finalize_batch([(rec, T0 + timedelta(days=1))], [one]) == 0
+
+        claimed = await store.lock_due_jobs(now=T0 + timedelta(days=2))
+        assert [(j.id, j.retries, j.next_run_at) for j in claimed] == \
+            [(rec.id, 1, T0 + timedelta(days=1))]
+        assert claimed[0].spec.rrule == "FREQ=DAILY"
+    run(t)
+
+
+def test_update_jobs_versions_and_stale_finalize(run):
+    async def t(store):
+        job, gone = _job(), _job()
+        await store.insert_jobs([job, gone])
+        await store.cancel_job(gone.id)
+        (claimed,) = await store.lock_due_jobs(now=T0)
+
+        later = T0 + timedelta(hours=1)
+        applied, conflicts = await store.update_jobs([
+            JobUpdate(job.id, ScheduleSpec(at=later), later, payload={"n": 2}, version=0),
+            JobUpdate(gone.id, tags={"a": "b"}),
+        ])
+        assert (applied, conflicts) == ({job.id: 1}, set())
+        assert await store.update_jobs([JobUpdate(job.id, tags={"a": "b"}, version=0)]) == \
+            ({}, {job.id})
+
+        # the producer fired the old version: its finalize must not undo the update
+        assert await store.finalize_batch([], [claimed]) == 1
+        (again,) = await store.lock_due_jobs(now=later)
+        await store.load_payloads([again])
+        assert (again.next_run_at, again.version, again.payload) == (later, 1, {"n": 2})
+        assert await store.finalize_batch([], [again]) == 0
+        assert await store.earliest_due() is None
+    run(t)
+
+
+def test_tags_update_during_fire_does_not_refire(run):
+    async def t(store):
+        job = _job()
+        await store.insert_jobs([job])
+        (claimed,) = await store.lock_due_jobs(now=T0)
+        applied, _ = await store.update_jobs([JobUpdate(job.id, tags={"a": "b"})])
+        assert applied == {job.id: 1}
+
+        # not a schedule change: the fire still counts
+        assert await store.finalize_batch([], [claimed]) == 0
+        assert await store.lock_due_jobs(now=T0 + timedelta(days=1)) == []
+    run(t)
+
+
+def test_delay_markers_pending_until_confirmed(run):
+    async def t(store):
+        a, b = uuid.uuid4(), uuid.uuid4()
+        until = T0 + timedelta(minutes=5)
+        assert await store.add_delay_markers([a, b], expires_at=until) == ({a, b}, set())
+        assert await store.add_delay_markers([a, b], expires_at=until) == (set(), set())
+        await store.confirm_delay_markers([a])
+        assert await store.add_delay_markers([a, b], expires_at=until) == (set(), {a})
+    run(t)
+
+
+def test_cancel_by_selector(run):
+    async def t(store):
+        mine = [_job(tags={"user_id": "42"}) for _ in range(5)]
+        other = _job(tags={"user_id": "7"})
+        await store.insert_jobs([*mine, other])
+        totals = [n async for n in store.cancel_by_selector({"user_id": "42"}, chunk=2)]
+        assert totals[-1] == 5
+        assert await store.find_by_selector({"user_id": "7"}) == [other.id]
+        assert await store.cancel_jobs([other.id, mine[0].id]) == {other.id}
+    run(t)
+
+
+def test_pool_roles_and_statement_registry():
+    from config import Settings
+    from repo import ROLES, STATEMENTS, JobRepo, PoolSpec
+
+    assert {role for role, _ in STATEMENTS.values()} == set(ROLES)
+    spec = PoolSpec.from_settings(Settings(PG_CLAIM_POOL_MAX=7, PG_CLAIM_TIMEOUT_MS=250), "claim")
+    assert (spec.max_size, spec.statement_timeout_ms) == (7, 250)
+    with pytest.raises(ValueError):
+        asyncio.run(JobRepo.create("postgres://unused", pools={"reporting": PoolSpec()}))
+
+
+def test_sqlite_startup_failure_is_raised_not_hung(tmp_path):
+    import sqlite3
+
+    from sqlite_store import SQLiteJobStore
+
+    with pytest.raises(sqlite3.OperationalError):
+        asyncio.run(asyncio.wait_for(
+            SQLiteJobStore.create(str(tmp_path / "missing" / "jobs.db")), 5))
+
+
+def test_claim_defaults_to_the_authoritative_clock(run):
+    import clock
+
+    async def t(store):
+        await store.insert_jobs([_job(T0), _job(T0 + timedelta(minutes=5))])
+        with clock.using(clock.VirtualClock(T0 - timedelta(seconds=1))) as vc:
+            assert await store.lock_due_jobs() == []
+            vc.advance(1)
+            assert [j.next_run_at for j in await store.lock_due_jobs()] == [T0]
+            assert await store.count_overdue() == 1
+        db = await store.db_now()
+        assert abs((db - datetime.now(timezone.utc)).total_seconds()) < 5
+    run(t)
+
+
+def test_fire_log_lateness_and_retention(run):
+    async def test(store):
+        day = T0.date()
+        await store.ensure_fire_log_partitions(day - timedelta(days=3), 4)
+        # lateness i seconds: type "a" gets 1, 3, 5, 7, 9
+        fires = [FireRecord(T0 + timedelta(seconds=i), uuid.uuid4(), "ab"[i % 2 == 0], T0, 1)
+                 for i in range(10)]
+        old = T0 - timedelta(days=3)
+        await store.write_fire_log([*fires, FireRecord(old, uuid.uuid4(), "a", old, 2)])
+
+        rows = await store.fire_lateness(T0, T0 + timedelta(hours=1), percentiles=(0.5, 1.0))
+        assert [(jt, n) for jt, n, _, _ in rows] == [("a", 5), ("b", 5), (None, 10)]
+        assert rows[0][2] == pytest.approx([5.0, 9.0]) and rows[0][3] == pytest.approx(9.0)
+        assert rows[2][2] == pytest.approx([4.5, 9.0])
+        assert [n for _, n, _, _ in await store.fire_lateness(
+            T0, T0 + timedelta(hours=1), job_type="b")] == [5, 5]
+
+        assert await store.prune_fire_log(day - timedelta(days=1)) >= 1
+        assert await store.fire_lateness(old, T0) == []
+        assert len(await store.fire_lateness(T0, T0 + timedelta(hours=1))) == 3
+    run(test)
@@ -0,0 +1,59 @@
+import asyncio
+
+import pytest
+
+import tracing
+
+
+class ListExporter:
+    def __init__(self):
+        self.records = []
+
+    def export(self, record):
+        self.records.append(record)
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def exporter(monkeypatch):
+    exp = ListExporter()
+    monkeypatch.setattr(tracing, "tracer", tracing.Tracer(enabled=True, ratio=1.0, exporter=exp))
+    return exp
+
+
+def test_disabled_span_is_shared_noop(monkeypatch):
+    monkeypatch.setattr(tracing, "tracer", tracing.Tracer())
+    assert tracing.span("x") is tracing.span("y")
+    assert tracing.inject({}) == {}
+
+
+def test_child_spans_and_propagation(exporter):
+    parent = tracing.parse_traceparent("00-" + "a" * 32 + "-" + "b" * 16 + "-01")
+
+    @tracing.traced("inner")
+    async def inner():
+        return tracing.inject({})
+
+    async def main():
+        with tracing.span("outer", parent=parent):
+            return await inner()
+
+    headers = asyncio.run(main())
+    ctx = tracing.extract(headers)
+    assert ctx.trace_id == "a" * 32 and ctx.sampled
+    inner_rec, outer_rec = exporter.records
+    assert outer_rec["parent_id"] == "b" * 16
+    assert inner_rec["parent_id"] == outer_rec["span_id"]
+
+
+def test_sampling_follows_trace_id(exporter):
+    tracing.tracer.ratio, tracing.tracer._bound = 0.5, 1 << 63
+    keep, drop = "0" * 16 + "1" * 16, "0" * 16 + "f" * 16
+    with tracing.span("kept", trace_id=keep):
+        pass
+    with tracing.span("dropped", trace_id=drop) as sp:
+        assert tracing.current_trace_id() == drop    # still propagates
+    assert [r["name"] for r in exporter.records] == ["kept"]
+    assert tracing.parse_traceparent("garbage") is None